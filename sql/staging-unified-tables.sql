@@ -0,0 +1,169 @@
+-- Vereinheitlichte, partitionierte Staging-Tabellen (eine Tabelle pro Quelle).
+-- src/staging.py --unified-table castet jede Datei beim Laden auf diesen Spaltensatz
+-- (abgeleitet aus schema/schemas_with_filenames_*.json) und legt die Tabellen bei Bedarf
+-- selbst an. Die DDL hier dient als Referenz bzw. zum manuellen Anlegen.
+-- Partitionierung nach Pickup-Monat, Clustering nach Pickup-/Dropoff-Zone.
+
+-- 1. FHV
+CREATE TABLE IF NOT EXISTS `taxi-bi-project.staging.fhv_staging` (
+    `dispatching_base_num` STRING,
+    `pickup_datetime` DATETIME,
+    `dropOff_datetime` DATETIME,
+    `PUlocationID` INT64,
+    `DOlocationID` INT64,
+    `SR_Flag` INT64,
+    `Affiliated_base_number` STRING,
+    `duplicate_flag` STRING,
+    `missing_flag` STRING,
+    `pickup_month` DATE,
+    `schema_version` STRING,
+    `source_file` STRING
+)
+PARTITION BY DATE_TRUNC(pickup_month, MONTH)
+CLUSTER BY PUlocationID, DOlocationID;
+
+-- 2. GREEN
+CREATE TABLE IF NOT EXISTS `taxi-bi-project.staging.green_staging` (
+    `VendorID` INT64,
+    `lpep_pickup_datetime` DATETIME,
+    `lpep_dropoff_datetime` DATETIME,
+    `store_and_fwd_flag` STRING,
+    `RatecodeID` INT64,
+    `PULocationID` INT64,
+    `DOLocationID` INT64,
+    `passenger_count` INT64,
+    `trip_distance` FLOAT64,
+    `fare_amount` FLOAT64,
+    `extra` FLOAT64,
+    `mta_tax` FLOAT64,
+    `tip_amount` FLOAT64,
+    `tolls_amount` FLOAT64,
+    `ehail_fee` FLOAT64,
+    `improvement_surcharge` FLOAT64,
+    `total_amount` FLOAT64,
+    `payment_type` INT64,
+    `trip_type` INT64,
+    `congestion_surcharge` FLOAT64,
+    `cbd_congestion_fee` FLOAT64,
+    `duplicate_flag` STRING,
+    `missing_flag` STRING,
+    `pickup_month` DATE,
+    `schema_version` STRING,
+    `source_file` STRING
+)
+PARTITION BY DATE_TRUNC(pickup_month, MONTH)
+CLUSTER BY PULocationID, DOLocationID;
+
+-- 3. YELLOW
+CREATE TABLE IF NOT EXISTS `taxi-bi-project.staging.yellow_staging` (
+    `VendorID` INT64,
+    `tpep_pickup_datetime` DATETIME,
+    `tpep_dropoff_datetime` DATETIME,
+    `passenger_count` INT64,
+    `trip_distance` FLOAT64,
+    `RatecodeID` INT64,
+    `store_and_fwd_flag` STRING,
+    `PULocationID` INT64,
+    `DOLocationID` INT64,
+    `payment_type` STRING,
+    `fare_amount` FLOAT64,
+    `extra` FLOAT64,
+    `mta_tax` FLOAT64,
+    `tip_amount` FLOAT64,
+    `tolls_amount` FLOAT64,
+    `improvement_surcharge` FLOAT64,
+    `total_amount` FLOAT64,
+    `congestion_surcharge` FLOAT64,
+    `Airport_fee` FLOAT64,
+    `vendor_id` STRING,
+    `pickup_datetime` STRING,
+    `dropoff_datetime` STRING,
+    `pickup_longitude` FLOAT64,
+    `pickup_latitude` FLOAT64,
+    `rate_code` STRING,
+    `dropoff_longitude` FLOAT64,
+    `dropoff_latitude` FLOAT64,
+    `surcharge` FLOAT64,
+    `cbd_congestion_fee` FLOAT64,
+    `duplicate_flag` STRING,
+    `missing_flag` STRING,
+    `pickup_month` DATE,
+    `schema_version` STRING,
+    `source_file` STRING
+)
+PARTITION BY DATE_TRUNC(pickup_month, MONTH)
+CLUSTER BY PULocationID, DOLocationID;
+
+
+-- VIEWS AUF DIE VEREINHEITLICHTEN TABELLEN
+-- Ersetzen die UNION-ALL-Views aus staging-view.sql mit identischen Ausgabespalten,
+-- sobald alle Dateien mit --unified-table geladen wurden. Filter auf pickup_month
+-- werden bis auf die Tabelle durchgereicht (Partition Pruning).
+
+CREATE OR REPLACE VIEW `taxi-bi-project.staging.fhv_staging_unified` AS
+SELECT
+    dispatching_base_num,
+    pickup_datetime,
+    dropOff_datetime,
+    PUlocationID,
+    DOlocationID,
+    CAST(SR_Flag AS STRING) AS SR_Flag,
+    Affiliated_base_number,
+    duplicate_flag,
+    missing_flag,
+    pickup_month
+FROM `taxi-bi-project.staging.fhv_staging`;
+
+CREATE OR REPLACE VIEW `taxi-bi-project.staging.green_staging_unified` AS
+SELECT
+    VendorID,
+    lpep_pickup_datetime,
+    lpep_dropoff_datetime,
+    store_and_fwd_flag,
+    RatecodeID,
+    PULocationID,
+    DOLocationID,
+    passenger_count,
+    trip_distance,
+    fare_amount,
+    extra,
+    mta_tax,
+    tip_amount,
+    tolls_amount,
+    ehail_fee,
+    improvement_surcharge,
+    total_amount,
+    payment_type,
+    trip_type,
+    congestion_surcharge,
+    duplicate_flag,
+    missing_flag,
+    pickup_month
+FROM `taxi-bi-project.staging.green_staging`;
+
+CREATE OR REPLACE VIEW `taxi-bi-project.staging.yellow_staging_unified` AS
+SELECT
+    VendorID,
+    -- Schema 5 (2010) liefert Zeitstempel als String in pickup_datetime/dropoff_datetime
+    COALESCE(tpep_pickup_datetime, SAFE_CAST(pickup_datetime AS DATETIME)) AS tpep_pickup_datetime,
+    COALESCE(tpep_dropoff_datetime, SAFE_CAST(dropoff_datetime AS DATETIME)) AS tpep_dropoff_datetime,
+    passenger_count,
+    trip_distance,
+    RatecodeID,
+    store_and_fwd_flag,
+    PULocationID,
+    DOLocationID,
+    SAFE_CAST(payment_type AS INT64) AS payment_type,
+    fare_amount,
+    extra,
+    mta_tax,
+    tip_amount,
+    tolls_amount,
+    improvement_surcharge,
+    total_amount,
+    congestion_surcharge,
+    Airport_fee,
+    duplicate_flag,
+    missing_flag,
+    pickup_month
+FROM `taxi-bi-project.staging.yellow_staging`;
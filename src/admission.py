@@ -0,0 +1,157 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import psutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schema_classifier import FOOTER_BLOCK_SIZE, DEFAULT_FOOTER_WORKERS
+
+# pandas hält Strings als Python-Objekte: ~49 Byte Objekt-Header + 8 Byte Zeiger pro Wert
+PANDAS_STRING_OVERHEAD = 57
+PANDAS_OBJECT_POINTER = 8
+# Spitzenverbrauch relativ zu den dekodierten Daten (Kopien für Hashing/Duplikate, Flags, Upload-Serialisierung)
+PEAK_FACTORS = {"pandas": 3.0, "arrow": 2.0, "stream": 2.0}
+# Zeilen-Hashes im Streaming-Modus: sortiertes uint64-Array + Kopie beim Zusammenführen
+STREAM_HASH_BYTES_PER_ROW = 16
+
+DEFAULT_POLL_SECONDS = 0.5
+
+
+def read_parquet_metadata(uri):
+    """Liest nur den Parquet-Footer (Ranged Read) und liefert (FileMetaData, Arrow-Schema)."""
+    with fsspec.open(uri, "rb", block_size=FOOTER_BLOCK_SIZE) as f:
+        parquet_file = pq.ParquetFile(f)
+        return parquet_file.metadata, parquet_file.schema_arrow
+
+
+def estimate_decoded_bytes(metadata, arrow_schema, mode="pandas"):
+    """Schätzt die Größe der dekodierten Daten aus Zeilenzahl, Spaltentypen und unkomprimierten Größen."""
+    rows = metadata.num_rows
+    uncompressed = {}
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for i in range(row_group.num_columns):
+            column = row_group.column(i)
+            uncompressed[column.path_in_schema] = uncompressed.get(column.path_in_schema, 0) + column.total_uncompressed_size
+
+    total = 0
+    for field in arrow_schema:
+        typ = field.type
+        if pa.types.is_string(typ) or pa.types.is_large_string(typ) or pa.types.is_binary(typ):
+            data = uncompressed.get(field.name, 0)
+            if mode == "pandas":
+                total += rows * PANDAS_STRING_OVERHEAD + data
+            else:
+                total += rows * 8 + data
+        elif pa.types.is_null(typ):
+            total += rows * PANDAS_OBJECT_POINTER if mode == "pandas" else 0
+        else:
+            # Feste Breite plus Validity-Bitmap
+            total += rows * max(1, typ.bit_width // 8) + rows // 8
+    return total
+
+
+def estimate_peak_bytes(metadata, arrow_schema, mode="pandas", memory_budget_mb=None):
+    """Geschätzter Spitzenverbrauch einer Datei in Bytes für den Verarbeitungsmodus."""
+    if mode == "stream":
+        decoded = estimate_decoded_bytes(metadata, arrow_schema, "pandas")
+        batch_bytes = memory_budget_mb * 1024 * 1024 if memory_budget_mb else decoded
+        return int(min(decoded, batch_bytes) * PEAK_FACTORS["stream"] + metadata.num_rows * STREAM_HASH_BYTES_PER_ROW)
+    return int(estimate_decoded_bytes(metadata, arrow_schema, mode) * PEAK_FACTORS[mode])
+
+
+def profile_files(uris, mode="pandas", memory_budget_mb=None, workers=DEFAULT_FOOTER_WORKERS):
+    """Liest die Footer vieler Dateien parallel und liefert uri -> {rows, columns, peak_bytes} oder Exception."""
+    def _profile(uri):
+        try:
+            metadata, arrow_schema = read_parquet_metadata(uri)
+            return uri, {
+                "rows": metadata.num_rows,
+                "columns": len(arrow_schema),
+                "peak_bytes": estimate_peak_bytes(metadata, arrow_schema, mode, memory_budget_mb),
+            }
+        except Exception as e:
+            return uri, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(executor.map(_profile, uris))
+
+
+class AdmissionController:
+    """Lässt Dateien nur dann zur Verarbeitung zu, wenn der projizierte RSS unter dem Budget bleibt.
+
+    Projektion: max(gemessener RSS von Prozess und Workern, Ausgangs-RSS + reservierte Schätzungen)
+    plus die Schätzung der neuen Datei. Läuft keine Datei, wird immer zugelassen, damit Dateien
+    über dem Budget allein (mit reduzierter Parallelität) statt gar nicht verarbeitet werden.
+    """
+
+    def __init__(self, budget_bytes, estimates=None, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.estimates = estimates or {}
+        self.poll_seconds = poll_seconds
+        self.reserved = 0
+        self.in_flight = 0
+        self.peak_rss = 0
+        self.deferred = 0
+        self._process = psutil.Process()
+        self._cond = threading.Condition()
+        self.baseline_rss = self.current_rss()
+
+    def current_rss(self):
+        """RSS dieses Prozesses und aller Kindprozesse (Worker) in Bytes."""
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def estimate_for(self, gcs_path):
+        return self.estimates.get(gcs_path, 0)
+
+    def projected_rss(self, estimate):
+        return max(self.current_rss(), self.baseline_rss + self.reserved) + estimate
+
+    def try_admit(self, estimate):
+        """Reserviert estimate und liefert True, falls die Datei jetzt verarbeitet werden darf."""
+        with self._cond:
+            if self.in_flight == 0 or self.projected_rss(estimate) <= self.budget_bytes:
+                self.reserved += estimate
+                self.in_flight += 1
+                return True
+            return False
+
+    def admit(self, estimate):
+        """Blockiert, bis die Datei zugelassen wird (für den Pipeline-Modus)."""
+        deferred = False
+        with self._cond:
+            while not self.try_admit(estimate):
+                deferred = True
+                self._cond.wait(self.poll_seconds)
+        if deferred:
+            self.deferred += 1
+
+    def release(self, estimate):
+        with self._cond:
+            self.reserved -= estimate
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def summary(self):
+        return (f"Budget {self.budget_bytes / 2**20:,.0f} MiB | Peak RSS {self.peak_rss / 2**20:,.0f} MiB | "
+                f"{self.deferred} Dateien zurückgestellt")
+
+
+def wait_for_admission(controller, estimate, on_idle, timeout=None):
+    """Wartet auf Zulassung und ruft währenddessen on_idle(poll_seconds) auf (z.B. um fertige Futures einzusammeln)."""
+    start = time.time()
+    while not controller.try_admit(estimate):
+        if timeout is not None and time.time() - start > timeout:
+            return False
+        on_idle(controller.poll_seconds)
+    return True
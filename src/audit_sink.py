@@ -0,0 +1,150 @@
+import glob
+import json
+import os
+import threading
+import time
+
+# Standard-Schwellen für das Schreiben eines Audit-Batches
+DEFAULT_FLUSH_ROWS = 50
+DEFAULT_FLUSH_SECONDS = 30.0
+
+
+def _owner_alive(wal_path):
+    """Prüft, ob der Prozess, dem die Write-Ahead-Datei gehört (audit-<pid>.jsonl), noch läuft."""
+    try:
+        pid = int(os.path.basename(wal_path).split("-")[-1].split(".")[0])
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditSink:
+    """Puffert Audit-Log-Zeilen und schreibt sie gesammelt über write_fn (ein Load Job pro Batch).
+
+    Jede Zeile wird vor dem Puffern in eine lokale Write-Ahead-Datei (JSON-Lines, fsync)
+    geschrieben und erst nach erfolgreichem Batch-Load daraus entfernt. Nach einem Absturz
+    übernimmt recover() die verbliebenen Zeilen, sodass keine Log-Zeile verloren geht
+    (im ungünstigsten Fall wird eine Zeile doppelt geschrieben).
+    Mit flush_in_background schreibt auch ein volles Batch der Hintergrund-Thread; append()
+    wartet dann nie auf einen Load Job.
+    """
+
+    def __init__(self, write_fn, wal_path, flush_rows=DEFAULT_FLUSH_ROWS, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 flush_in_background=False):
+        self.write_fn = write_fn
+        self.wal_path = wal_path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.flush_in_background = flush_in_background
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.time()
+        self._stop = threading.Event()
+        self._due = threading.Event()
+        self._closed = False
+
+        os.makedirs(os.path.dirname(wal_path) or ".", exist_ok=True)
+        self._wal = open(wal_path, "a", encoding="utf-8")
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def _write_wal(self, rows):
+        for row in rows:
+            self._wal.write(json.dumps(row, default=str) + "\n")
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+    def append(self, row):
+        """Schreibt die Zeile in die Write-Ahead-Datei und puffert sie; flusht bei Erreichen der Schwelle."""
+        with self._lock:
+            self._write_wal([row])
+            self._buffer.append(row)
+            due = len(self._buffer) >= self.flush_rows
+        if due and self.flush_in_background:
+            self._due.set()
+        elif due:
+            self.flush()
+
+    def flush(self):
+        """Schreibt alle gepufferten Zeilen in einem Batch. Bei Fehlern bleiben sie gepuffert und in der WAL."""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._buffer)
+            if not rows:
+                self._last_flush = time.time()
+                return 0
+            try:
+                self.write_fn(rows)
+            except Exception as e:
+                print(f"WARNUNG: Audit-Batch mit {len(rows)} Zeilen konnte nicht geschrieben werden (bleibt in WAL): {e}")
+                return 0
+            with self._lock:
+                # Während des Loads angehängte Zeilen bleiben erhalten
+                self._buffer = self._buffer[len(rows):]
+                self._rewrite_wal()
+            self._last_flush = time.time()
+            print(f"INFO: {len(rows)} Audit-Zeilen in einem Batch geschrieben.")
+            return len(rows)
+
+    def _rewrite_wal(self):
+        tmp_path = f"{self.wal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for row in self._buffer:
+                tmp.write(json.dumps(row, default=str) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._wal.close()
+        os.replace(tmp_path, self.wal_path)
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+
+    def recover(self, wal_dir=None):
+        """Übernimmt Zeilen aus verwaisten Write-Ahead-Dateien (abgestürzte Läufe/Worker) und flusht sie.
+
+        Dateien noch laufender Prozesse (z.B. eines parallelen Staging-Laufs) bleiben unberührt.
+        """
+        wal_dir = wal_dir or os.path.dirname(self.wal_path)
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(wal_dir, "*.jsonl"))):
+            if os.path.abspath(path) == os.path.abspath(self.wal_path) or _owner_alive(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            with self._lock:
+                # Erst in die eigene WAL übernehmen, dann die fremde Datei löschen
+                self._write_wal(rows)
+                self._buffer.extend(rows)
+            os.remove(path)
+            recovered += len(rows)
+        if recovered:
+            print(f"INFO: {recovered} Audit-Zeilen aus früheren Write-Ahead-Dateien wiederhergestellt.")
+        self.flush()
+        return recovered
+
+    def _flush_periodically(self):
+        while not self._stop.is_set():
+            due = self._due.wait(min(1.0, self.flush_seconds))
+            self._due.clear()
+            if self._stop.is_set():
+                break
+            if self._buffer and (due or time.time() - self._last_flush >= self.flush_seconds):
+                self.flush()
+
+    def close(self):
+        """Letzter Flush beim Beenden. Die WAL-Datei wird nur gelöscht, wenn sie leer ist."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._due.set()
+        self.flush()
+        with self._lock:
+            self._wal.close()
+            if not self._buffer:
+                os.remove(self.wal_path)
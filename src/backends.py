@@ -0,0 +1,1198 @@
+import base64
+import fcntl
+import itertools
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import fsspec
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from unified_schema import (
+    FLAG_COLUMNS, PARTITION_COLUMN, CLUSTER_COLUMNS, unified_bigquery_fields, unify_arrow_table, widened_columns,
+    pickup_month_column, file_month_index, route_pickup_months,
+)
+from pushdown_sql import BIGQUERY, DUCKDB, PUSHDOWN_STATS, build_flag_select, build_flag_stats, sql_string_literal
+
+# Namen der Backends für --backend (die Google-Cloud-Bibliotheken werden erst im GCP-Backend importiert)
+GCP_BACKEND = "gcp"
+LOCAL_BACKEND = "local"
+
+
+def _create_client(factory, **kwargs):
+    """Erstellt einen Google-Cloud-Client erst bei Bedarf (Import und Offline-Läufe brauchen keine Credentials)."""
+    try:
+        client = factory(**kwargs)
+    except Exception as e:
+        print(f"FEHLER bei der Initialisierung der Google Cloud Clients: {e}")
+        print("Stellen Sie sicher, dass die Google Cloud CLI installiert und 'gcloud auth application-default login' ausgeführt wurde.")
+        raise
+    print(f"Google Cloud Client ({factory.__module__}) erfolgreich initialisiert.")
+    return client
+
+
+# Pushdown: transiente Tabelle mit der Rohdatei (wird nach dem Anhängen gelöscht, verfällt sonst nach einem Tag)
+PUSHDOWN_TABLE_PREFIX = "_pushdown_"
+PUSHDOWN_TABLE_TTL = timedelta(days=1)
+
+
+# --- OBJEKTSPEICHER (Quelldateien, Schema-JSON) ---
+
+
+class GenerationMismatch(Exception):
+    """Bedingtes Schreiben/Löschen abgelehnt: das Objekt hat nicht (mehr) die erwartete Generation."""
+
+class GCSObjectStore:
+    """Quelldateien und Schema-JSON-Dateien in einem GCS-Bucket."""
+
+    def __init__(self, bucket_name, project):
+        self.bucket_name = bucket_name
+        self.project = project
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import storage
+            self._client = _create_client(storage.Client, project=self.project)
+        return self._client
+
+    def uri(self, name):
+        """URI, über die pandas/pyarrow/fsspec das Objekt lesen."""
+        return f"gs://{self.bucket_name}/{name}"
+
+    def list_objects(self, prefix, suffix=".parquet"):
+        """Listet Objekte unter prefix mit Generation, Größe und CRC32C."""
+        bucket = self.client.bucket(self.bucket_name)
+        return [
+            {"name": blob.name, "generation": blob.generation, "size": blob.size, "crc32c": blob.crc32c}
+            for blob in bucket.list_blobs(prefix=prefix)
+            if blob.name.endswith(suffix)
+        ]
+
+    def stat(self, name):
+        """Metadaten eines einzelnen Objekts (wie ein Eintrag von list_objects)."""
+        blob = self.client.bucket(self.bucket_name).get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(self.uri(name))
+        return {"name": blob.name, "generation": blob.generation, "size": blob.size, "crc32c": blob.crc32c}
+
+    def checksum(self, name):
+        """CRC32C (base64) des Objekts; GCS liefert sie mit den Metadaten."""
+        return self.stat(name)["crc32c"]
+
+    def read_bytes(self, name):
+        return self.client.bucket(self.bucket_name).blob(name).download_as_bytes()
+
+    def write_bytes(self, name, data, content_type=None):
+        self.client.bucket(self.bucket_name).blob(name).upload_from_string(data, content_type=content_type)
+
+    def open_write(self, name):
+        """Öffnet ein Objekt zum Schreiben; es wird erst beim Schließen der Datei angelegt."""
+        return fsspec.open(self.uri(name), "wb").open()
+
+    def delete(self, name):
+        from google.api_core.exceptions import NotFound
+        try:
+            self.client.bucket(self.bucket_name).blob(name).delete()
+        except NotFound:
+            pass
+
+    def read_versioned(self, name):
+        """(Inhalt, Generation) eines kleinen Objekts; (None, 0), wenn es nicht existiert."""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        blob = self.client.bucket(self.bucket_name).get_blob(name)
+        if blob is None:
+            return None, 0
+        try:
+            return blob.download_as_bytes(if_generation_match=blob.generation), blob.generation
+        except (NotFound, PreconditionFailed):
+            # Zwischen Metadaten und Inhalt geändert bzw. gelöscht -> neu lesen
+            return self.read_versioned(name)
+
+    def write_if_generation(self, name, data, generation, content_type=None):
+        """Schreibt nur, wenn das Objekt noch die Generation hat (0 = darf nicht existieren). Liefert die neue Generation."""
+        from google.api_core.exceptions import PreconditionFailed
+        blob = self.client.bucket(self.bucket_name).blob(name)
+        try:
+            blob.upload_from_string(data, content_type=content_type, if_generation_match=generation)
+        except PreconditionFailed as e:
+            raise GenerationMismatch(self.uri(name)) from e
+        return blob.generation
+
+    def delete_if_generation(self, name, generation):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        try:
+            self.client.bucket(self.bucket_name).blob(name).delete(if_generation_match=generation)
+        except NotFound:
+            pass
+        except PreconditionFailed as e:
+            raise GenerationMismatch(self.uri(name)) from e
+
+
+class LocalObjectStore:
+    """Quelldateien in einem lokalen Verzeichnis mit derselben Ordnerstruktur wie der Bucket (z.B. <root>/raw/...).
+
+    Als Generation dient der Änderungszeitpunkt in Nanosekunden; eine CRC32C-Prüfsumme gibt es nicht.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def uri(self, name):
+        return os.path.abspath(self.path(name))
+
+    def list_objects(self, prefix, suffix=".parquet"):
+        start = self.path(prefix.rsplit("/", 1)[0]) if "/" in prefix else self.root
+        objects = []
+        for dirpath, _, filenames in os.walk(start):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not name.startswith(prefix) or not name.endswith(suffix):
+                    continue
+                stat = os.stat(path)
+                objects.append({"name": name, "generation": stat.st_mtime_ns, "size": stat.st_size, "crc32c": None})
+        return sorted(objects, key=lambda obj: obj["name"])
+
+    def stat(self, name):
+        stat = os.stat(self.path(name))
+        return {"name": name, "generation": stat.st_mtime_ns, "size": stat.st_size, "crc32c": None}
+
+    def checksum(self, name, chunk_size=8 * 1024 * 1024):
+        """CRC32C (base64, wie bei GCS) über den Dateiinhalt; wird nur bei Bedarf berechnet, da die Datei gelesen wird."""
+        import google_crc32c
+        checksum = google_crc32c.Checksum()
+        with open(self.path(name), "rb") as f:
+            while chunk := f.read(chunk_size):
+                checksum.update(chunk)
+        return base64.b64encode(checksum.digest()).decode("ascii")
+
+    def read_bytes(self, name):
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def write_bytes(self, name, data, content_type=None):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+
+    def open_write(self, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return open(path, "wb")
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    # Bedingte Zugriffe wie bei GCS: Lesen, Vergleichen und Ersetzen unter einer Sperrdatei je Objekt
+    # (fcntl, d.h. nur zwischen Prozessen, die dasselbe Dateisystem sehen)
+
+    def _locked(self, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        lock = open(f"{path}.lock", "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _generation(self, name):
+        try:
+            return os.stat(self.path(name)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def read_versioned(self, name):
+        with self._locked(name):
+            generation = self._generation(name)
+            return (self.read_bytes(name), generation) if generation else (None, 0)
+
+    def write_if_generation(self, name, data, generation, content_type=None):
+        with self._locked(name):
+            current = self._generation(name)
+            if current != generation:
+                raise GenerationMismatch(self.uri(name))
+            self.write_bytes(name, data, content_type)
+            # Streng steigende Generation, auch bei grober Zeitauflösung des Dateisystems
+            new_generation = max(time.time_ns(), current + 1)
+            os.utime(self.path(name), ns=(new_generation, new_generation))
+            return new_generation
+
+    def delete_if_generation(self, name, generation):
+        with self._locked(name):
+            current = self._generation(name)
+            if current and current != generation:
+                raise GenerationMismatch(self.uri(name))
+            self.delete(name)
+
+
+class StagedParquetFile:
+    """Schreibt die geflaggten Daten einer Datei als Parquet-Objekt in den Staging-Bereich des Objektspeichers.
+
+    Im Batch-Load-Modus übernimmt erst ein gemeinsamer Load Job mehrere dieser Objekte in die
+    Zieltabelle. Mehrere write()-Aufrufe (Streaming-Batches) landen als Row Groups in derselben Datei.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.writer = None
+
+    def write(self, table):
+        """Hängt eine Arrow-Tabelle an und liefert die Anzahl geschriebener Bytes."""
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.file, table.schema)
+        elif not table.schema.equals(self.writer.schema):
+            # Spätere Batches können abweichende Typen haben (z.B. reine NULL-Spalten)
+            table = table.select(self.writer.schema.names).cast(self.writer.schema)
+        start = self.file.tell()
+        self.writer.write_table(table)
+        return self.file.tell() - start
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.file.close()
+
+    def abort(self):
+        """Schließt die Datei nach einem Fehler, ohne Folgefehler zu werfen."""
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# --- WAREHOUSE: BIGQUERY ---
+
+# Arrow-Typ (wie in schema/*.json) -> BigQuery-Typ. Zeitstempel ohne Zeitzone werden wie bisher
+# über pandas als DATETIME geladen; reine NULL-Spalten werden als STRING angelegt (vgl. staging-view.sql).
+ARROW_TO_BQ_TYPES = {
+    "string": "STRING",
+    "large_string": "STRING",
+    "int32": "INT64",
+    "int64": "INT64",
+    "double": "FLOAT64",
+    "float": "FLOAT64",
+    "bool": "BOOL",
+    "timestamp[us]": "DATETIME",
+    "timestamp[ns]": "DATETIME",
+    "null": "STRING",
+}
+
+def bigquery_schema_from_registry(column_types):
+    """Leitet das BigQuery-Schema einer Staging-Tabelle aus den Arrow-Typen der Schema-Registry ab."""
+    from google.cloud import bigquery
+    schema = [bigquery.SchemaField(col, ARROW_TO_BQ_TYPES.get(arrow_type, "STRING"))
+              for col, arrow_type in column_types.items()]
+    schema.extend(bigquery.SchemaField(col, "STRING") for col in FLAG_COLUMNS)
+    return schema
+
+
+class BigQueryWarehouse:
+    """Ziel-Warehouse BigQuery: Staging-Tabellen und Audit-Log im Dataset project.dataset."""
+
+    def __init__(self, project, dataset):
+        self.project = project
+        self.dataset = dataset
+        self._client = None
+        self._write_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import bigquery
+            self._client = _create_client(bigquery.Client, project=self.project)
+        return self._client
+
+    @property
+    def write_client(self):
+        """Client der Storage Write API (Pending Write Streams)."""
+        if self._write_client is None:
+            from google.cloud import bigquery_storage_v1
+            self._write_client = _create_client(bigquery_storage_v1.BigQueryWriteClient)
+        return self._write_client
+
+    def table_id(self, table):
+        return f"{self.project}.{self.dataset}.{table}"
+
+    def table_path(self, table):
+        """Ressourcenname der Tabelle für die Storage Write API."""
+        return f"projects/{self.project}/datasets/{self.dataset}/tables/{table}"
+
+    def ensure_table(self, table, columns):
+        """Legt die Tabelle mit den Spalten [(Name, BigQuery-Typ)] an, falls sie fehlt. Liefert True bei Neuanlage."""
+        from google.cloud import bigquery
+        try:
+            self.client.get_table(self.table_id(table))
+            return False
+        except Exception:
+            schema = [bigquery.SchemaField(name, bq_type) for name, bq_type in columns]
+            self.client.create_table(bigquery.Table(self.table_id(table), schema=schema))
+            return True
+
+    def append_rows(self, table, df):
+        """Hängt einen DataFrame in einem einzigen Load Job an die Tabelle an."""
+        from google.cloud import bigquery
+        job_config = bigquery.LoadJobConfig(
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+        )
+        job = self.client.load_table_from_dataframe(df, self.table_id(table), job_config=job_config)
+        job.result()
+
+    def successful_files(self, log_table):
+        """Alle Dateinamen mit Status 'success' im Audit-Log."""
+        query = f"""
+        SELECT DISTINCT file_name
+        FROM `{self.table_id(log_table)}`
+        WHERE status = 'success'
+        """
+        return {row.file_name for row in self.client.query(query)}
+
+    def load_staged(self, table, uris, job_config=None):
+        """Lädt mehrere gestagte Parquet-Objekte in einem einzigen Load Job (atomar: alle oder keines).
+
+        Liefert die Job-Statistiken (job_id, output_rows, input_bytes, seconds).
+        """
+        from google.cloud import bigquery
+        if job_config is None:
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.PARQUET,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            )
+        start = time.time()
+        job = self.client.load_table_from_uri(uris, self.table_id(table), job_config=job_config)
+        job.result()
+        return {"job_id": job.job_id, "output_rows": job.output_rows, "input_bytes": loaded_bytes(job),
+                "seconds": time.time() - start}
+
+    def pushdown_append(self, table, uri, columns, critical_cols, column_types=None):
+        """Lädt die Rohdatei per URI in eine transiente Tabelle, berechnet die Flags per SQL und hängt das
+        Ergebnis an die Staging-Tabelle an. Über den Client laufen nur die Zählwerte.
+
+        Die Flag-Abfrage (mit dem Duplikat-Fenster über alle Spalten) läuft genau einmal, in eine zweite
+        transiente Tabelle. Die Zähler liest eine Abfrage nur über deren Flag-Spalten; angehängt wird per
+        Copy Job, der keine Bytes scannt.
+
+        columns: [(Name, Arrow-Typ)] aus dem Parquet-Footer. Liefert die Zähler (PUSHDOWN_STATS),
+        die job_id des Copy Jobs und die Dauer der Schritte load/check/append in Sekunden.
+        """
+        from google.cloud import bigquery
+        suffix = f"{table}_{uuid.uuid4().hex[:12]}"
+        transient = self.table_id(f"{PUSHDOWN_TABLE_PREFIX}{suffix}")
+        flagged = self.table_id(f"{PUSHDOWN_TABLE_PREFIX}flagged_{suffix}")
+        start = time.time()
+        load_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        )
+        self.client.load_table_from_uri(uri, transient, job_config=load_config).result()
+        try:
+            self.expire_transient(transient)
+
+            target_types = None
+            if column_types and set(column_types) == {name for name, _ in columns}:
+                # Zeitstempel & Co. wie beim Laden mit explizitem Schema (BigQuerySink.prepare_arrow)
+                target_types = {col: ARROW_TO_BQ_TYPES.get(arrow_type, "STRING") for col, arrow_type in column_types.items()}
+            flag_select = build_flag_select(f"`{transient}`", columns, critical_cols, BIGQUERY, target_types)
+            result = {"load_seconds": time.time() - start}
+
+            start = time.time()
+            flag_config = bigquery.QueryJobConfig(
+                destination=flagged,
+                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            )
+            self.client.query(flag_select, job_config=flag_config).result()
+            self.expire_transient(flagged)
+            row = next(iter(self.client.query(build_flag_stats(f"`{flagged}`")).result()))
+            result.update({key: row[key] for key in PUSHDOWN_STATS})
+            result["check_seconds"] = time.time() - start
+
+            start = time.time()
+            copy_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+            job = self.client.copy_table(flagged, self.table_id(table), job_config=copy_config)
+            job.result()
+            result["job_id"] = job.job_id
+            result["append_seconds"] = time.time() - start
+        finally:
+            self.client.delete_table(transient, not_found_ok=True)
+            self.client.delete_table(flagged, not_found_ok=True)
+        return result
+
+    def expire_transient(self, table_id):
+        """Transiente Tabellen verfallen, falls das Löschen ausbleibt (z.B. nach einem Absturz)."""
+        transient_table = self.client.get_table(table_id)
+        transient_table.expires = datetime.now(timezone.utc) + PUSHDOWN_TABLE_TTL
+        self.client.update_table(transient_table, ["expires"])
+
+    def ensure_table_for_load(self, table, job_config):
+        """Legt die Tabelle mit Schema, Partitionierung und Clustering aus job_config an, falls sie fehlt.
+
+        Load Jobs erzeugen fehlende Tabellen selbst; Write Streams setzen eine existierende Tabelle voraus.
+        """
+        from google.cloud import bigquery
+        from google.api_core.exceptions import Conflict, NotFound
+        try:
+            self.client.get_table(self.table_id(table))
+            return False
+        except NotFound:
+            pass
+        if not job_config.schema:
+            raise ValueError(f"Kein Schema für {self.table_id(table)} bekannt; Write Streams benötigen einen Schema-Registry-Eintrag.")
+        bq_table = bigquery.Table(self.table_id(table), schema=job_config.schema)
+        bq_table.time_partitioning = job_config.time_partitioning
+        bq_table.clustering_fields = job_config.clustering_fields
+        try:
+            self.client.create_table(bq_table)
+        except Conflict:
+            return False  # Parallel von einem anderen Worker angelegt
+        return True
+
+    def write_stream_sink(self, table, sink):
+        return BigQueryWriteStreamSink(self, table, sink)
+
+    def commit_write_streams(self, table, stream_names):
+        """Committet finalisierte Pending Streams atomar; erst danach sind ihre Zeilen sichtbar."""
+        from google.cloud.bigquery_storage_v1 import types
+        response = self.write_client.batch_commit_write_streams(
+            types.BatchCommitWriteStreamsRequest(parent=self.table_path(table), write_streams=list(stream_names))
+        )
+        if response.stream_errors:
+            raise RuntimeError("; ".join(f"{e.entity}: {e.error_message}" for e in response.stream_errors))
+        return response.commit_time
+
+    def write_stream_state(self, table, stream_name):
+        """Zustand eines Write Streams: 'committed', 'finalized', 'open' oder None (unbekannt/abgelaufen)."""
+        from google.cloud.bigquery_storage_v1 import types
+        from google.api_core.exceptions import NotFound
+        try:
+            stream = self.write_client.get_write_stream(
+                types.GetWriteStreamRequest(name=stream_name, view=types.WriteStreamView.BASIC)
+            )
+        except NotFound:
+            return None
+        if stream.commit_time:
+            return "committed"
+        if stream.finalize_time:
+            return "finalized"
+        return "open"
+
+    def staging_sink(self, table, column_types=None, stage=None, loads=None):
+        return BigQuerySink(self.client, self.table_id(table), column_types, stage, loads)
+
+    def quarantine_sink(self, table, stage=None, loads=None):
+        return QuarantineBigQuerySink(self.client, self.table_id(table), stage=stage, loads=loads)
+
+    def unified_sink(self, table, unified_columns, source_prefix, schema_version, source_file, stage=None, loads=None):
+        return UnifiedBigQuerySink(self.client, self.table_id(table), unified_columns, source_prefix,
+                                   schema_version, source_file, stage, loads)
+
+
+def loaded_bytes(job):
+    """Vom Load Job gemeldete Eingabegröße in Bytes (0, falls BigQuery keine Angabe liefert)."""
+    size = getattr(job, "input_file_bytes", None)
+    return size if isinstance(size, int) else 0
+
+
+class BigQuerySink:
+    """Schreibt geflaggte Daten per Load Job (WRITE_APPEND) in eine Staging-Tabelle.
+
+    column_types (aus der Schema-Registry) liefert das explizite BigQuery-Schema für write_arrow.
+    Die write-Methoden liefern die Anzahl hochgeladener Bytes. Mit stage (StagedParquetFile) wird
+    statt eines Load Jobs nur das gestagte Objekt geschrieben; job_config enthält danach die
+    Konfiguration für den späteren gemeinsamen Load Job. Mit append_id wird der Load Job idempotent
+    (deterministische Job-ID, siehe run_load). Mit loads (LoadGroup) werden Load Jobs nur eingereicht;
+    die hochgeladenen Bytes zählt dann der Aufrufer aus den abgeschlossenen Jobs (Rückgabe 0).
+    """
+
+    def __init__(self, bqclient, fulltable, column_types=None, stage=None, loads=None):
+        self.bqclient = bqclient
+        self.fulltable = fulltable
+        self.column_types = column_types
+        self.stage = stage
+        self.loads = loads
+        self.job_config = None
+
+    def write_dataframe(self, df, append_id=None):
+        if self.stage is not None:
+            return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False))
+        if self.loads is not None:
+            self.loads.submit(lambda job_id: self.bqclient.load_table_from_dataframe(df, self.fulltable, job_id=job_id),
+                              get_job=self.bqclient.get_job)
+            return 0
+        job = self.run_load(lambda job_id: self.bqclient.load_table_from_dataframe(df, self.fulltable, job_id=job_id), append_id)
+        return loaded_bytes(job)
+
+    def run_load(self, start_job, append_id=None):
+        """Startet einen Load Job über start_job(job_id) und wartet auf ihn.
+
+        Mit append_id lauten die Job-IDs <append_id>_<Versuch>. Existiert ein Job mit dieser ID bereits
+        (z.B. aus einem abgebrochenen Lauf) und war erfolgreich, wird er übernommen statt die Daten ein
+        zweites Mal anzuhängen; war er fehlgeschlagen, folgt der nächste Versuch.
+        """
+        if append_id is None:
+            job = start_job(None)
+            job.result()
+            return job
+        from google.api_core.exceptions import Conflict, GoogleAPICallError
+        for attempt in itertools.count():
+            job_id = f"{append_id}_{attempt}"
+            try:
+                job = start_job(job_id)
+            except Conflict:
+                job = self.bqclient.get_job(job_id)
+                try:
+                    job.result()
+                except GoogleAPICallError:
+                    continue
+                print(f"INFO: Load Job {job_id} war bereits erfolgreich; Daten werden nicht erneut angehängt.")
+                return job
+            job.result()
+            return job
+
+    def parquet_job_config(self):
+        from google.cloud import bigquery
+        return bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+
+    def prepare_arrow(self, table, job_config):
+        """Bringt die Arrow-Tabelle in die Form des Zielschemas und setzt es in job_config."""
+        column_types = self.column_types
+        if column_types and set(column_types) == set(table.column_names) - set(FLAG_COLUMNS):
+            table = table.select(list(column_types) + FLAG_COLUMNS)
+            # NULL-Spalten als STRING schreiben, damit Parquet-Typ und Zielschema übereinstimmen
+            for i, typ in enumerate(table.schema.types):
+                if pa.types.is_null(typ):
+                    table = table.set_column(i, table.column_names[i], pa.nulls(table.num_rows, pa.string()))
+            job_config.schema = bigquery_schema_from_registry(column_types)
+        elif column_types:
+            print(f"WARNUNG: Spalten passen nicht zur Schema-Registry für {self.fulltable}. Lade ohne explizites Schema.")
+        else:
+            print(f"WARNUNG: Kein Schema-Registry-Eintrag für {self.fulltable}. Lade ohne explizites Schema.")
+        return table
+
+    def write_arrow(self, table, append_id=None):
+        job_config = self.parquet_job_config()
+        table = self.prepare_arrow(table, job_config)
+        if self.stage is not None:
+            self.job_config = self.job_config or job_config
+            return self.stage.write(table)
+        tmp = tempfile.TemporaryFile()
+        submitted = False
+        try:
+            pq.write_table(table, tmp)
+            del table
+            size = tmp.tell()
+
+            def start_job(job_id):
+                tmp.seek(0)
+                return self.bqclient.load_table_from_file(tmp, self.fulltable, job_config=job_config, job_id=job_id)
+
+            if self.loads is not None:
+                # Die temporäre Datei bleibt bis zum Ende des Jobs offen (Neueinreichung bei Wiederholungen)
+                self.loads.submit(start_job, cleanup=tmp.close, get_job=self.bqclient.get_job)
+                submitted = True
+                return 0
+            self.run_load(start_job, append_id)
+        finally:
+            if not submitted:
+                tmp.close()
+        return size
+
+    def close(self):
+        """Schließt den Sink nach der letzten Schreiboperation (für gepufferte Sinks)."""
+        if self.stage is not None:
+            self.stage.close()
+
+
+class UnifiedBigQuerySink(BigQuerySink):
+    """Castet jede Datei auf den vereinheitlichten Spaltensatz ihrer Quelle und hängt sie an eine
+    nach Pickup-Monat partitionierte und nach Zonen geclusterte Tabelle pro Quelle an."""
+
+    def __init__(self, bqclient, fulltable, unified_columns, source_prefix, schema_version, source_file, stage=None, loads=None):
+        super().__init__(bqclient, fulltable, stage=stage, loads=loads)
+        self.unified_columns = unified_columns
+        self.source_prefix = source_prefix
+        self.schema_version = schema_version
+        self.source_file = source_file
+        # INT64-Spalten des Spaltensatzes, die in der Tabelle FLOAT64 sind (None = noch nicht abgefragt)
+        self.float_columns = None
+
+    def write_dataframe(self, df, append_id=None):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False), append_id)
+
+    def widen_columns(self, columns):
+        """Verbreitert INT64-Spalten der Tabelle auf FLOAT64 (gebrochene Werte) und liefert alle FLOAT64-Spalten.
+
+        Spätere Dateien mit ganzzahligen Werten werden in diesen Spalten ebenfalls als FLOAT64 geladen.
+        """
+        from google.api_core.exceptions import NotFound
+        if self.float_columns is None:
+            try:
+                schema = self.bqclient.get_table(self.fulltable).schema
+            except NotFound:
+                schema = []
+            self.float_columns = {field.name for field in schema
+                                  if field.field_type in ("FLOAT", "FLOAT64") and self.unified_columns.get(field.name) == "INT64"}
+        for col in sorted(set(columns) - self.float_columns):
+            try:
+                self.bqclient.query(f"ALTER TABLE `{self.fulltable}` ALTER COLUMN `{col}` SET DATA TYPE FLOAT64").result()
+            except NotFound:
+                pass  # Tabelle entsteht erst mit diesem Load (Schema mit FLOAT64)
+            print(f"WARNUNG: {self.source_file}: Spalte {col} enthält gebrochene Werte; {self.fulltable}.{col} ist jetzt FLOAT64.")
+            self.float_columns.add(col)
+        return self.float_columns
+
+    def parquet_job_config(self):
+        from google.cloud import bigquery
+        job_config = super().parquet_job_config()
+        job_config.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.MONTH, field=PARTITION_COLUMN
+        )
+        job_config.clustering_fields = CLUSTER_COLUMNS[self.source_prefix]
+        # Neue Schema-Versionen dürfen Spalten ergänzen
+        job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+        return job_config
+
+    def prepare_arrow(self, table, job_config):
+        from google.cloud import bigquery
+        table = unify_arrow_table(table, self.unified_columns, self.source_prefix, self.schema_version, self.source_file)
+        float_columns = self.widen_columns(widened_columns(table, self.unified_columns))
+        for col in float_columns:
+            i = table.schema.get_field_index(col)
+            table = table.set_column(i, col, pc.cast(table[col], pa.float64()))
+        job_config.schema = [bigquery.SchemaField(col, "FLOAT64" if col in float_columns else bq_type)
+                             for col, bq_type in unified_bigquery_fields(self.unified_columns)]
+        return table
+
+
+class QuarantineBigQuerySink(BigQuerySink):
+    """Hängt quarantänisierte Zeilen an eine Quarantäne-Tabelle an. Das Schema folgt den Daten;
+    neue Spalten späterer Schema-Versionen werden ergänzt, abweichende Pflichtfelder gelockert."""
+
+    def write_dataframe(self, df):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False))
+
+    def parquet_job_config(self):
+        from google.cloud import bigquery
+        job_config = super().parquet_job_config()
+        job_config.schema_update_options = [
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION,
+        ]
+        return job_config
+
+    def prepare_arrow(self, table, job_config):
+        for i, typ in enumerate(table.schema.types):
+            if pa.types.is_null(typ):
+                table = table.set_column(i, table.column_names[i], pa.nulls(table.num_rows, pa.string()))
+        return table
+
+
+# Storage Write API: höchstens 10 MB pro AppendRows-Request (mit Reserve für den Protokoll-Overhead)
+MAX_APPEND_BYTES = 8 * 1024 * 1024
+# Ausstehende Appends, bevor auf Bestätigungen gewartet wird (begrenzt den Speicher)
+MAX_PENDING_APPENDS = 8
+
+
+class BigQueryWriteStreamSink:
+    """Hängt geflaggte Daten als Arrow Record Batches an einen Pending Write Stream (Storage Write API) an.
+
+    Die Zeilen werden erst mit commit_write_streams() sichtbar. Jeder Append trägt seinen Offset,
+    sodass ein wiederholter Request nicht zu doppelten Zeilen führt. Die Aufbereitung der Daten
+    (Spaltenauswahl, Zielschema, vereinheitlichte Tabelle) übernimmt der zugrunde liegende Sink.
+    """
+
+    def __init__(self, warehouse, table, sink):
+        self.warehouse = warehouse
+        self.table = table
+        self.sink = sink
+        self.stream_name = None
+        self.row_count = 0
+        self.job_config = None
+        self._append_stream = None
+        self._futures = []
+
+    def write_dataframe(self, df):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False))
+
+    def _open(self, schema, job_config):
+        from google.cloud.bigquery_storage_v1 import types, writer
+        self.warehouse.ensure_table_for_load(self.table, job_config)
+        stream = self.warehouse.write_client.create_write_stream(
+            parent=self.warehouse.table_path(self.table),
+            write_stream=types.WriteStream(type_=types.WriteStream.Type.PENDING),
+        )
+        self.stream_name = stream.name
+        template = types.AppendRowsRequest(
+            write_stream=stream.name,
+            arrow_rows=types.AppendRowsRequest.ArrowData(
+                writer_schema=types.ArrowSchema(serialized_schema=schema.serialize().to_pybytes())
+            ),
+        )
+        self._append_stream = writer.AppendRowsStream(self.warehouse.write_client, template)
+
+    def write_arrow(self, table):
+        from google.cloud.bigquery_storage_v1 import types
+        job_config = self.sink.parquet_job_config()
+        table = self.sink.prepare_arrow(table, job_config)
+        if self._append_stream is None:
+            self.job_config = job_config
+            self._open(table.schema, job_config)
+        rows_per_request = max(1, int(MAX_APPEND_BYTES * table.num_rows / max(table.nbytes, 1)))
+        sent = 0
+        for batch in table.to_batches(max_chunksize=rows_per_request):
+            payload = batch.serialize().to_pybytes()
+            request = types.AppendRowsRequest(
+                offset=self.row_count,
+                arrow_rows=types.AppendRowsRequest.ArrowData(
+                    rows=types.ArrowRecordBatch(serialized_record_batch=payload, row_count=batch.num_rows)
+                ),
+            )
+            self._futures.append(self._append_stream.send(request))
+            self.row_count += batch.num_rows
+            sent += len(payload)
+            if len(self._futures) >= MAX_PENDING_APPENDS:
+                self._wait()
+        return sent
+
+    def _wait(self):
+        for future in self._futures:
+            future.result()
+        self._futures = []
+
+    def close(self):
+        """Wartet auf alle Appends und finalisiert den Stream (danach sind keine Appends mehr möglich)."""
+        if self._append_stream is None:
+            return
+        self._wait()
+        self._append_stream.close()
+        self._append_stream = None
+        response = self.warehouse.write_client.finalize_write_stream(name=self.stream_name)
+        if response.row_count != self.row_count:
+            raise RuntimeError(f"Write Stream {self.stream_name} enthält {response.row_count} statt {self.row_count} Zeilen.")
+
+    def abort(self):
+        """Schließt den Stream nach einem Fehler; nicht committete Zeilen verfallen in BigQuery."""
+        if self._append_stream is not None:
+            try:
+                self._append_stream.close()
+            except Exception:
+                pass
+            self._append_stream = None
+
+
+# --- WAREHOUSE: LOKALES PARQUET-VERZEICHNIS ---
+
+class ParquetWarehouse:
+    """Lokales Warehouse für Offline-Läufe, Profiling und Benchmarks.
+
+    Jede Tabelle ist ein Verzeichnis <root>/<dataset>/<table>/ mit einer Parquet-Datei pro
+    Schreibvorgang (entspricht einem Load Job mit WRITE_APPEND). Dateien werden atomar per
+    rename geschrieben, sodass parallele Worker und Leser nie eine halbe Datei sehen. Ein
+    Batch-Load legt seine Dateien gemeinsam in einem Unterverzeichnis batch-*/ an, das ebenfalls
+    per rename (alle oder keine) sichtbar wird. Write Streams sammeln ihre Batches in
+    .streams/<stream>/ und werden beim Commit als stream-*/ sichtbar.
+    """
+
+    def __init__(self, root, dataset):
+        self.root = root
+        self.dataset = dataset
+        self._counter = itertools.count()
+
+    def table_id(self, table):
+        return os.path.join(self.root, self.dataset, table)
+
+    def ensure_table(self, table, columns):
+        path = self.table_id(table)
+        created = not os.path.isdir(path)
+        os.makedirs(path, exist_ok=True)
+        return created
+
+    def part_path(self, table, name=None):
+        """Pfad einer neuen Parquet-Datei im Tabellenverzeichnis (legt das Verzeichnis bei Bedarf an)."""
+        path = self.table_id(table)
+        os.makedirs(path, exist_ok=True)
+        if name is None:
+            name = f"part-{time.time_ns()}-{os.getpid()}-{next(self._counter)}"
+        return os.path.join(path, f"{name}.parquet")
+
+    def write_part(self, table, arrow_table, name=None):
+        """Schreibt eine neue Parquet-Datei in das Tabellenverzeichnis und liefert ihre Größe in Bytes.
+
+        Mit name entsteht die Datei <name>.parquet; ein wiederholter Aufruf ersetzt sie (idempotentes Anhängen).
+        """
+        part = self.part_path(table, name)
+        tmp_path = f"{part}.tmp"
+        pq.write_table(arrow_table, tmp_path)
+        os.replace(tmp_path, part)
+        return os.path.getsize(part)
+
+    def append_rows(self, table, df):
+        self.write_part(table, pa.Table.from_pandas(df, preserve_index=False))
+
+    def load_staged(self, table, uris, job_config=None):
+        """Verschiebt gestagte Parquet-Dateien gemeinsam in die Tabelle (Gegenstück zum Batch Load Job)."""
+        start = time.time()
+        path = self.table_id(table)
+        batch = f"batch-{time.time_ns()}-{os.getpid()}-{next(self._counter)}"
+        # Versteckte Verzeichnisse werden von read_table ignoriert
+        tmp_dir = os.path.join(path, f".{batch}.tmp")
+        os.makedirs(tmp_dir)
+        rows = size = 0
+        for i, uri in enumerate(uris):
+            rows += pq.ParquetFile(uri).metadata.num_rows
+            size += os.path.getsize(uri)
+            os.replace(uri, os.path.join(tmp_dir, f"part-{i:05d}.parquet"))
+        os.replace(tmp_dir, os.path.join(path, batch))
+        return {"job_id": batch, "output_rows": rows, "input_bytes": size, "seconds": time.time() - start}
+
+    def pushdown_append(self, table, uri, columns, critical_cols, column_types=None):
+        """Gegenstück zu BigQueryWarehouse.pushdown_append mit DuckDB: dieselbe generierte SQL läuft
+        gegen eine temporäre Tabelle mit der Rohdatei; das Ergebnis wird per COPY als neue Parquet-Datei
+        der Tabelle geschrieben, ohne die Daten nach Python zu holen."""
+        import duckdb
+        start = time.time()
+        con = duckdb.connect()
+        try:
+            con.execute(f"CREATE TEMP TABLE raw_file AS SELECT * FROM read_parquet({sql_string_literal(uri)})")
+            # Reine NULL-Spalten als String schreiben (wie ParquetDirectorySink/BigQuerySink)
+            null_columns = {name: "VARCHAR" for name, arrow_type in columns if pa.types.is_null(arrow_type)}
+            flag_select = build_flag_select("raw_file", columns, critical_cols, DUCKDB, null_columns)
+            result = {"load_seconds": time.time() - start}
+
+            # Flag-Abfrage nur einmal ausführen; Zähler und Export lesen das Ergebnis
+            start = time.time()
+            con.execute(f"CREATE TEMP TABLE flagged AS {flag_select}")
+            result.update(zip(PUSHDOWN_STATS, con.execute(build_flag_stats("flagged")).fetchone()))
+            result["check_seconds"] = time.time() - start
+
+            start = time.time()
+            part = self.part_path(table)
+            tmp_path = f"{part}.tmp"
+            con.execute(f"COPY flagged TO {sql_string_literal(tmp_path)} (FORMAT PARQUET)")
+            os.replace(tmp_path, part)
+            result["job_id"] = os.path.basename(part)
+            result["append_seconds"] = time.time() - start
+        finally:
+            con.close()
+        return result
+
+    def write_stream_sink(self, table, sink):
+        return LocalWriteStreamSink(self, table, sink)
+
+    def stream_dir(self, table, stream_name, committed=False):
+        if committed:
+            return os.path.join(self.table_id(table), stream_name)
+        return os.path.join(self.table_id(table), ".streams", stream_name)
+
+    def create_write_stream(self, table):
+        stream_name = f"stream-{time.time_ns()}-{os.getpid()}-{next(self._counter)}"
+        os.makedirs(self.stream_dir(table, stream_name))
+        return stream_name
+
+    def commit_write_streams(self, table, stream_names):
+        for stream_name in stream_names:
+            if self.write_stream_state(table, stream_name) == "committed":
+                continue
+            if self.write_stream_state(table, stream_name) != "finalized":
+                raise RuntimeError(f"Write Stream {stream_name} ist nicht finalisiert.")
+            os.replace(self.stream_dir(table, stream_name), self.stream_dir(table, stream_name, committed=True))
+        return time.time()
+
+    def write_stream_state(self, table, stream_name):
+        if os.path.isdir(self.stream_dir(table, stream_name, committed=True)):
+            return "committed"
+        pending = self.stream_dir(table, stream_name)
+        if os.path.exists(os.path.join(pending, LocalWriteStreamSink.FINALIZED_MARKER)):
+            return "finalized"
+        return "open" if os.path.isdir(pending) else None
+
+    def table_parts(self, table):
+        """Alle sichtbaren Parquet-Dateien einer Tabelle (inklusive batch-*/-Unterverzeichnissen)."""
+        parts = []
+        for dirpath, dirnames, filenames in os.walk(self.table_id(table)):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            parts.extend(os.path.join(dirpath, p) for p in sorted(filenames) if p.endswith(".parquet"))
+        return parts
+
+    def read_table(self, table, columns=None):
+        """Liest alle Dateien einer Tabelle (abweichende Schema-Versionen werden zusammengeführt)."""
+        tables = [pq.read_table(part, columns=columns) for part in self.table_parts(table)]
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    def successful_files(self, log_table):
+        log = self.read_table(log_table, columns=["file_name", "status"])
+        if log.num_rows == 0:
+            return set()
+        df = log.to_pandas()
+        return set(df.loc[df["status"] == "success", "file_name"])
+
+    # loads: Teile werden lokal synchron geschrieben, es entstehen keine Jobs
+    def staging_sink(self, table, column_types=None, stage=None, loads=None):
+        return ParquetDirectorySink(self, table, stage)
+
+    def quarantine_sink(self, table, stage=None, loads=None):
+        return ParquetDirectorySink(self, table, stage)
+
+    def unified_sink(self, table, unified_columns, source_prefix, schema_version, source_file, stage=None, loads=None):
+        return UnifiedParquetDirectorySink(self, table, unified_columns, source_prefix, schema_version, source_file, stage)
+
+
+class ParquetDirectorySink:
+    """Hängt geflaggte Daten als Parquet-Datei an eine Tabelle des ParquetWarehouse an (Gegenstück zu BigQuerySink)."""
+
+    def __init__(self, warehouse, table, stage=None):
+        self.warehouse = warehouse
+        self.table = table
+        self.stage = stage
+        # Keine Job-Konfiguration im lokalen Warehouse
+        self.job_config = None
+
+    def write_dataframe(self, df, append_id=None):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False), append_id)
+
+    def prepare_arrow(self, table):
+        return table
+
+    def write_arrow(self, table, append_id=None):
+        if self.stage is not None:
+            return self.stage.write(self.prepare_arrow(table))
+        return self.warehouse.write_part(self.table, self.prepare_arrow(table), append_id)
+
+    def close(self):
+        """Schließt den Sink nach der letzten Schreiboperation (für gepufferte Sinks)."""
+        if self.stage is not None:
+            self.stage.close()
+
+
+class UnifiedParquetDirectorySink(ParquetDirectorySink):
+    """Castet jede Datei auf den vereinheitlichten Spaltensatz ihrer Quelle (Gegenstück zu UnifiedBigQuerySink)."""
+
+    def __init__(self, warehouse, table, unified_columns, source_prefix, schema_version, source_file, stage=None):
+        super().__init__(warehouse, table, stage)
+        self.unified_columns = unified_columns
+        self.source_prefix = source_prefix
+        self.schema_version = schema_version
+        self.source_file = source_file
+
+    def prepare_arrow(self, table):
+        return unify_arrow_table(table, self.unified_columns, self.source_prefix, self.schema_version, self.source_file)
+
+
+class LocalWriteStreamSink:
+    """Gegenstück zu BigQueryWriteStreamSink für das ParquetWarehouse (Offline-Läufe und Tests).
+
+    Jeder Append wird als batch-<offset>.parquet im versteckten Stream-Verzeichnis abgelegt; ein
+    Append mit bereits vorhandenem Offset wird ignoriert. close() gleicht wie FinalizeWriteStream die
+    Zeilenzahl des Streams ab und finalisiert mit einer Marker-Datei.
+    """
+
+    FINALIZED_MARKER = "_FINALIZED"
+
+    def __init__(self, warehouse, table, sink):
+        self.warehouse = warehouse
+        self.table = table
+        self.sink = sink
+        self.stream_name = None
+        self.row_count = 0
+        self.job_config = None
+
+    def write_dataframe(self, df):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False))
+
+    def write_arrow(self, table):
+        table = self.sink.prepare_arrow(table)
+        if self.stream_name is None:
+            self.stream_name = self.warehouse.create_write_stream(self.table)
+        path = os.path.join(self.warehouse.stream_dir(self.table, self.stream_name), f"batch-{self.row_count:012d}.parquet")
+        if not os.path.exists(path):
+            pq.write_table(table, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        self.row_count += table.num_rows
+        return os.path.getsize(path)
+
+    def close(self):
+        if self.stream_name is None:
+            return
+        stream_dir = self.warehouse.stream_dir(self.table, self.stream_name)
+        rows = sum(pq.ParquetFile(os.path.join(stream_dir, name)).metadata.num_rows
+                   for name in os.listdir(stream_dir) if name.endswith(".parquet"))
+        if rows != self.row_count:
+            raise RuntimeError(f"Write Stream {self.stream_name} enthält {rows} statt {self.row_count} Zeilen.")
+        with open(os.path.join(stream_dir, self.FINALIZED_MARKER), "w") as f:
+            f.write(str(self.row_count))
+
+    def abort(self):
+        if self.stream_name is not None:
+            shutil.rmtree(self.warehouse.stream_dir(self.table, self.stream_name), ignore_errors=True)
+
+
+# --- QUARANTÄNE-ROUTING ---
+
+QUARANTINE_REASON_COLUMN = "quarantine_reason"
+QUARANTINE_SOURCE_COLUMN = "source_file"
+# Grundcode je Kombination der Flags (Index = duplicate + 2 * missing - 1)
+QUARANTINE_REASON_CODES = ["DUPLICATE", "MISSING_CRITICAL", "DUPLICATE,MISSING_CRITICAL"]
+
+
+def quarantine_codes(duplicate_flags, missing_flags):
+    """0 für saubere Zeilen, sonst 1 + Index in QUARANTINE_REASON_CODES."""
+    return np.asarray(duplicate_flags == "Y", dtype=np.int8) + 2 * np.asarray(missing_flags == "Y", dtype=np.int8)
+
+
+class SplitRoutingSink:
+    """Schreibt saubere Zeilen in den Haupt-Sink und geflaggte Zeilen mit Grundcode in einen Quarantäne-Sink.
+
+    Die Haupttabelle enthält damit nur noch Zeilen mit duplicate_flag = missing_flag = 'N'.
+    prepare (optional) bringt Quarantäne-Zeilen vorab in die Form der Haupttabelle (z.B. den
+    vereinheitlichten Spaltensatz), damit Dateien verschiedener Schema-Versionen zusammenpassen.
+    Je Batch werden zuerst die Quarantäne-Zeilen geschrieben: Scheitert das, erreicht der Batch auch
+    die Haupttabelle nicht. Der Quarantäne-Sink merkt die Zeilen nur vor (Stage bzw. versteckte
+    Dateien); FileTask übernimmt sie erst nach den Haupt-Zeilen und verwirft sie bei einem Fehler.
+    Alle übrigen Attribute (job_config, stream_name, abort, ...) stammen vom Haupt-Sink.
+    """
+
+    def __init__(self, sink, quarantine_sink, source_file, prepare=None):
+        self.sink = sink
+        self.quarantine_sink = quarantine_sink
+        self.source_file = source_file
+        self.prepare = prepare
+        self.quarantined_rows = 0
+
+    def __getattr__(self, name):
+        if name == "sink":
+            raise AttributeError(name)
+        return getattr(self.sink, name)
+
+    def write_dataframe(self, df):
+        codes = quarantine_codes(df["duplicate_flag"].to_numpy(), df["missing_flag"].to_numpy())
+        flagged = codes > 0
+        written = 0
+        if flagged.any():
+            written += self.write_quarantine(pa.Table.from_pandas(df[flagged], preserve_index=False), codes[flagged])
+        # Auch leere Teile schreiben, damit gestagte Objekte bzw. Streams immer angelegt werden
+        return written + self.sink.write_dataframe(df[~flagged].reset_index(drop=True))
+
+    def write_arrow(self, table):
+        codes = quarantine_codes(
+            pc.cast(table["duplicate_flag"], pa.string()).to_numpy(zero_copy_only=False),
+            pc.cast(table["missing_flag"], pa.string()).to_numpy(zero_copy_only=False),
+        )
+        flagged = codes > 0
+        written = 0
+        if flagged.any():
+            written += self.write_quarantine(table.filter(pa.array(flagged)), codes[flagged])
+        return written + self.sink.write_arrow(table.filter(pa.array(~flagged)))
+
+    def write_quarantine(self, table, codes):
+        """Ergänzt Grundcode und Quelldatei und schreibt die Zeilen in den Quarantäne-Sink."""
+        if self.prepare is not None:
+            table = self.prepare(table)
+        reasons = pa.DictionaryArray.from_arrays(pa.array(codes - 1), pa.array(QUARANTINE_REASON_CODES))
+        table = table.append_column(QUARANTINE_REASON_COLUMN, reasons)
+        if QUARANTINE_SOURCE_COLUMN not in table.column_names:
+            table = table.append_column(QUARANTINE_SOURCE_COLUMN, pa.array([self.source_file] * table.num_rows, pa.string()))
+        self.quarantined_rows += table.num_rows
+        return self.quarantine_sink.write_arrow(table)
+
+    def close(self):
+        self.sink.close()
+        self.quarantine_sink.close()
+
+
+class PickupMonthRoutingSink:
+    """Hängt den tatsächlichen Pickup-Monat jeder Zeile als Partitionsspalte an und zählt die Buckets.
+
+    Der Monat wird einmal pro Batch vektorisiert berechnet und von allen nachgelagerten Sinks
+    (vereinheitlichte Tabelle, Quarantäne, Lake) übernommen. Zeilen weiter als max_month_offset
+    Monate vom Dateimonat entfernt bekommen NULL und landen in der NULL-Partition (Quarantäne-Bucket).
+    Alle übrigen Attribute (job_config, stream_name, abort, ...) stammen vom Haupt-Sink.
+    """
+
+    def __init__(self, sink, source_prefix, source_file, max_month_offset):
+        self.sink = sink
+        self.source_prefix = source_prefix
+        self.file_month = file_month_index(source_file)
+        self.max_month_offset = max_month_offset
+        self.bucket_counts = {}
+
+    def __getattr__(self, name):
+        if name == "sink":
+            raise AttributeError(name)
+        return getattr(self.sink, name)
+
+    def write_dataframe(self, df, **kwargs):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False), **kwargs)
+
+    def write_arrow(self, table, **kwargs):
+        months, counts = route_pickup_months(pickup_month_column(table, self.source_prefix),
+                                             self.file_month, self.max_month_offset)
+        for bucket, rows in counts.items():
+            self.bucket_counts[bucket] = self.bucket_counts.get(bucket, 0) + rows
+        return self.sink.write_arrow(table.append_column(PARTITION_COLUMN, months), **kwargs)
+
+    def close(self):
+        self.sink.close()
+
+
+class QuarantineParquetSink:
+    """Schreibt quarantänisierte Zeilen kompakt (zstd) als Parquet-Dateien nach <root>/<table>/ (lokal oder gs://).
+
+    Die Dateien entstehen zunächst versteckt (.<datei>-<nr>.parquet, von Lesern ignoriert); publish()
+    benennt sie in <datei>-<nr>.parquet um, discard() löscht sie nach einem Fehler.
+    """
+
+    def __init__(self, root, table, source_file):
+        self.root = root.rstrip("/")
+        self.table = table
+        self.stem = source_file.rsplit(".", 1)[0]
+        self.parts = 0
+        self.pending = []
+
+    def write_dataframe(self, df):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False))
+
+    def write_arrow(self, table):
+        fs, path = fsspec.core.url_to_fs(f"{self.root}/{self.table}/.{self.stem}-{self.parts:05d}.parquet")
+        if "file" in fs.protocol:
+            fs.makedirs(os.path.dirname(path), exist_ok=True)
+        with fs.open(path, "wb") as f:
+            pq.write_table(table, f, compression="zstd")
+            size = f.tell()
+        self.pending.append(path)
+        self.parts += 1
+        return size
+
+    def publish(self):
+        """Macht die vorgemerkten Dateien sichtbar (nach dem Laden der Haupt-Zeilen)."""
+        fs, _ = fsspec.core.url_to_fs(self.root)
+        while self.pending:
+            path = self.pending.pop(0)
+            fs.mv(path, f"{os.path.dirname(path)}/{os.path.basename(path)[1:]}")
+
+    def discard(self):
+        """Löscht die vorgemerkten Dateien (nach einem Fehler der Datei)."""
+        fs, _ = fsspec.core.url_to_fs(self.root)
+        if self.pending:
+            fs.rm(self.pending)
+        self.pending = []
+
+    def close(self):
+        """Schließt den Sink nach der letzten Schreiboperation (für gepufferte Sinks)."""
@@ -0,0 +1,199 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from backends import LOCAL_BACKEND
+from staging_metrics import STAGE_DURATIONS, load_run_metrics, new_run_id
+from synthetic_tlc import SCHEMA_FILES, generate_dataset
+import staging
+
+# Testdaten und Ergebnisse liegen im lokalen Zustand (nicht versioniert)
+DEFAULT_BENCH_ROOT = os.path.join(staging.STATE_DIR, "bench_data")
+DEFAULT_RESULTS_PATH = os.path.join(staging.STATE_DIR, "benchmarks.jsonl")
+DEFAULT_MODES = ["pandas", "arrow", "stream"]
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def git_revision():
+    """Kurzer Commit-Hash des Repositorys (mit '+dirty' bei lokalen Änderungen), None außerhalb von git."""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "src"], cwd=REPO_DIR).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{rev}+dirty" if dirty else rev
+
+
+def mode_options(mode, memory_budget_mb):
+    """StagingOptions-Argumente eines Benchmark-Modus."""
+    if mode == "arrow":
+        return {"arrow": True}
+    if mode == "stream":
+        return {"stream": True, "memory_budget_mb": memory_budget_mb}
+    return {}
+
+
+def _run_case(root, case, option_kwargs, metrics_path, run_id):
+    """Verarbeitet eine Datei mit processfile gegen das lokale Backend (läuft in einem frischen Prozess)."""
+    options = staging.StagingOptions(backend=LOCAL_BACKEND, local_root=root, metrics_path=metrics_path,
+                                     run_id=run_id, **option_kwargs)
+    staging.configure_backends(options)
+    staging.start_metrics_recorder(options)
+    jsonfile = staging.SCHEMA_JSON_BY_SOURCE[case["source"]]
+    schemas = staging.download_schema_json(jsonfile)
+    mapping = staging.loadschemamappingjsonfile(jsonfile, schemas)
+    options.schema_registry.update(staging.build_schema_registry(schemas))
+    staging.processfile(staging.get_warehouse(), mapping, case["file_name"], case["gcs_path"], options)
+
+
+def run_case(root, case, option_kwargs, metrics_path):
+    """Misst einen Fall in einem eigenen Prozess (spawn), damit Peak-RSS und Caches nicht von vorherigen Fällen stammen."""
+    run_id = new_run_id()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        try:
+            executor.submit(_run_case, root, case, option_kwargs, metrics_path, run_id).result()
+        except Exception as e:
+            # processfile hat den Fehler bereits protokolliert; der Metrik-Eintrag trägt den Status 'fail'
+            print(f"FEHLER: Benchmark-Fall {case['gcs_path']} fehlgeschlagen: {type(e).__name__}: {e}")
+    shutil.rmtree(os.path.join(root, staging.LOCAL_WAREHOUSE_DIR), ignore_errors=True)
+    entries = load_run_metrics(metrics_path, run_id)
+    return entries[-1] if entries else None
+
+
+def build_result(case, mode, entry, environment):
+    return {
+        **environment,
+        "benchmark_at": datetime.now(timezone.utc).isoformat(),
+        "source": case["source"],
+        "schema": case["schema"],
+        "file_name": case["file_name"],
+        "rows": entry["rows"],
+        "mode": mode,
+        "status": entry["status"],
+        "bytes_read": entry["bytes_read"],
+        "bytes_uploaded": entry["bytes_uploaded"],
+        "total_seconds": entry["total_seconds"],
+        "rows_per_second": entry["rows_per_second"],
+        "peak_rss_bytes": entry["peak_rss_bytes"],
+        "duplicate_count": entry["duplicate_count"],
+        "missing_count": entry["missing_count"],
+        "stages": entry["stages"],
+    }
+
+
+def case_key(result):
+    return (result["host"], result["source"], result["schema"].lower(), result["rows"], result["mode"])
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline_for(result, history):
+    """Letztes früheres Ergebnis desselben Falls auf demselben Host, bevorzugt aus einer anderen Revision."""
+    same_case = [r for r in history if case_key(r) == case_key(result) and r.get("status") == "success"]
+    other_revision = [r for r in same_case if r.get("git_rev") != result.get("git_rev")]
+    candidates = other_revision or same_case
+    return candidates[-1] if candidates else None
+
+
+def print_report(results, history, threshold):
+    """Tabelle je Fall mit Durchsatz, Peak-RSS, Stufenzeiten und Veränderung gegenüber der Baseline."""
+    regressions = []
+    print(f"\n{'Fall':<34} {'Modus':<7} {'Zeilen':>11} {'rows/s':>11} {'Δ':>8} {'RSS MiB':>8} "
+          + " ".join(f"{stage:>9}" for stage in STAGE_DURATIONS))
+    for result in results:
+        label = f"{result['source']}/{result['schema']}"
+        if result["status"] != "success":
+            print(f"{label:<34} {result['mode']:<7} {'':>11} FEHLGESCHLAGEN ({result['status']})")
+            continue
+        baseline = baseline_for(result, history)
+        delta = ""
+        if baseline and baseline.get("rows_per_second"):
+            change = result["rows_per_second"] / baseline["rows_per_second"] - 1
+            delta = f"{change * 100:+.1f}%"
+            if change < -threshold:
+                regressions.append((result, baseline, change))
+        rss = (result["peak_rss_bytes"] or 0) / 2**20
+        stages = " ".join(f"{result['stages'][stage]['seconds']:>8.2f}s" for stage in STAGE_DURATIONS)
+        print(f"{label:<34} {result['mode']:<7} {result['rows']:>11,} {result['rows_per_second']:>11,.0f} "
+              f"{delta:>8} {rss:>8,.0f} {stages}")
+
+    for result, baseline, change in regressions:
+        print(f"REGRESSION: {result['source']}/{result['schema']} ({result['mode']}, {result['rows']:,} Zeilen): "
+              f"{change * 100:+.1f}% rows/s gegenüber {baseline.get('git_rev')} vom {baseline['benchmark_at'][:10]}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Durchsatz-Benchmark des Staging-ETL gegen das lokale Backend mit synthetischen TLC-Dateien.")
+    parser.add_argument("--root", default=DEFAULT_BENCH_ROOT, help=f"Verzeichnis für Testdaten (Standard: {DEFAULT_BENCH_ROOT}).")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000], help="Zeilenzahlen pro Datei (Standard: 1.000.000).")
+    parser.add_argument("--sources", nargs="*", choices=list(SCHEMA_FILES), help="Nur diese Quellen messen.")
+    parser.add_argument("--schemas", nargs="*", help="Nur diese Schema-Versionen messen (z.B. Schema-1).")
+    parser.add_argument("--modes", nargs="+", choices=DEFAULT_MODES, default=DEFAULT_MODES, help="Zu messende Verarbeitungsmodi.")
+    parser.add_argument("--memory-budget-mb", type=int, default=staging.DEFAULT_MEMORY_BUDGET_MB,
+                        help=f"Speicherbudget im Streaming-Modus (Standard: {staging.DEFAULT_MEMORY_BUDGET_MB} MB).")
+    parser.add_argument("--repeat", type=int, default=1, help="Wiederholungen pro Fall; gespeichert wird der schnellste Lauf.")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help=f"JSON-Lines-Datei der Ergebnisse (Standard: {DEFAULT_RESULTS_PATH}).")
+    parser.add_argument("--regression-threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help=f"Durchsatzverlust, ab dem ein Fall als Regression gilt (Standard: {DEFAULT_REGRESSION_THRESHOLD:.0%}).")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit-Code 1, wenn eine Regression erkannt wurde.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    environment = {
+        "git_rev": git_revision(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+    metrics_path = os.path.join(args.root, "metrics.jsonl")
+    history = load_results(args.results)
+
+    results = []
+    for rows in args.rows:
+        cases = generate_dataset(args.root, rows, sources=args.sources, schema_keys=args.schemas)
+        for case in cases:
+            for mode in args.modes:
+                best = None
+                for _ in range(max(1, args.repeat)):
+                    entry = run_case(args.root, case, mode_options(mode, args.memory_budget_mb), metrics_path)
+                    if entry is None:
+                        continue
+                    if best is None or (entry["rows_per_second"] or 0) > (best["rows_per_second"] or 0):
+                        best = entry
+                if best is None:
+                    print(f"WARNUNG: Keine Metriken für {case['gcs_path']} ({mode}).")
+                    continue
+                results.append(build_result(case, mode, best, environment))
+
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    regressions = print_report(results, history, args.regression_threshold)
+    print(f"\nINFO: {len(results)} Ergebnisse (Revision {environment['git_rev']}) nach {args.results} geschrieben.")
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import threading
+
+import numpy as np
+
+# Bloom-Filter: Ziel-Fehlerrate für das Vorfiltern der Lookups
+DEFAULT_BLOOM_FP_RATE = 0.01
+
+SEGMENT_SUFFIX = ".hashes.npy"
+BLOOM_SUFFIX = ".bloom.npy"
+
+
+class BloomFilter:
+    """Einfacher Bloom-Filter über 64-Bit-Hashes (Double Hashing, vektorisiert mit numpy)."""
+
+    def __init__(self, bits, num_hashes):
+        self.bits = bits
+        self.num_hashes = num_hashes
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=DEFAULT_BLOOM_FP_RATE):
+        """Dimensioniert den Filter für capacity Einträge bei der gewünschten Fehlerrate."""
+        capacity = max(1, capacity)
+        num_bits = int(-capacity * np.log(fp_rate) / (np.log(2) ** 2))
+        num_bits = max(64, (num_bits + 7) // 8 * 8)
+        num_hashes = max(1, int(round(num_bits / capacity * np.log(2))))
+        return cls(np.zeros(num_bits // 8, dtype=np.uint8), num_hashes)
+
+    def _positions(self, hashes):
+        num_bits = np.uint64(len(self.bits) * 8)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        for i in range(self.num_hashes):
+            yield (h1 + np.uint64(i) * h2) % num_bits
+
+    def add(self, hashes):
+        for pos in self._positions(hashes):
+            np.bitwise_or.at(self.bits, (pos >> np.uint64(3)).astype(np.int64),
+                             (np.uint8(1) << (pos & np.uint64(7)).astype(np.uint8)))
+
+    def might_contain(self, hashes):
+        """Liefert False für sicher unbekannte Hashes, True für mögliche Treffer."""
+        result = np.ones(len(hashes), dtype=bool)
+        for pos in self._positions(hashes):
+            byte = self.bits[(pos >> np.uint64(3)).astype(np.int64)]
+            result &= (byte >> (pos & np.uint64(7)).astype(np.uint8)) & np.uint8(1) == 1
+        return result
+
+    def save(self, path):
+        # Anzahl Hash-Funktionen wird als erstes Byte mitgespeichert
+        np.save(path, np.concatenate([np.array([self.num_hashes], dtype=np.uint8), self.bits]))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data[1:], int(data[0]))
+
+
+class FingerprintIndex:
+    """Persistenter Index von 64-Bit-Zeilen-Hashes, partitioniert nach Quelle und Pickup-Monat.
+
+    Jede verarbeitete Datei schreibt pro Monat ein eigenes Segment (sortiertes uint64-Array,
+    optional mit Bloom-Filter) unter <root>/<source>/<YYYY-MM>/<file_name>. Eine erneut
+    verarbeitete Datei ersetzt so nur ihr eigenes Segment, statt sich selbst als Duplikat zu erkennen.
+
+    Segmente entstehen erst mit commit(). Gleichzeitig laufende Dateien desselben Prozesses
+    (Pipeline, Batch-Load) teilen sich deshalb einen Index: mark_seen() prüft unter der Sperre
+    auch die vorgemerkten Hashes der anderen Dateien. Scheitert eine solche Datei später, bleiben
+    die dagegen geflaggten Zeilen geflaggt. Andere Prozesse sehen vorgemerkte Hashes nicht;
+    mehrere Prozesse dürfen denselben Index daher nicht gleichzeitig befüllen (kein --workers > 1).
+    """
+
+    def __init__(self, root, use_bloom=True, bloom_fp_rate=DEFAULT_BLOOM_FP_RATE):
+        self.root = root
+        self.use_bloom = use_bloom
+        self.bloom_fp_rate = bloom_fp_rate
+        self._segments = {}   # (source, month) -> [(file_name, hashes, bloom)]
+        self._pending = {}    # file_name -> {(source, month): [hashes]}
+        # Im Pipeline-Modus sind mehrere Dateien gleichzeitig in Bearbeitung
+        self._lock = threading.RLock()
+
+    def _partition_dir(self, source, month):
+        return os.path.join(self.root, source, month)
+
+    def _load_partition(self, source, month):
+        key = (source, month)
+        if key not in self._segments:
+            segments = []
+            partition_dir = self._partition_dir(source, month)
+            if os.path.isdir(partition_dir):
+                for entry in sorted(os.listdir(partition_dir)):
+                    if not entry.endswith(SEGMENT_SUFFIX):
+                        continue
+                    file_name = entry[:-len(SEGMENT_SUFFIX)]
+                    # mmap: nur die tatsächlich gesuchten Seiten werden von der Platte gelesen
+                    hashes = np.load(os.path.join(partition_dir, entry), mmap_mode="r")
+                    bloom_path = os.path.join(partition_dir, file_name + BLOOM_SUFFIX)
+                    bloom = BloomFilter.load(bloom_path) if self.use_bloom and os.path.exists(bloom_path) else None
+                    segments.append((file_name, hashes, bloom))
+            self._segments[key] = segments
+        return self._segments[key]
+
+    def lookup(self, source, months, hashes, exclude_file=None):
+        """Liefert eine Bool-Maske: Zeile wurde bereits in einer anderen (früheren) Datei gesehen."""
+        seen = np.zeros(len(hashes), dtype=bool)
+        unique_months, inverse = np.unique(months, return_inverse=True)
+        for month_idx, month in enumerate(unique_months):
+            rows = np.flatnonzero(inverse == month_idx)
+            month_hashes = hashes[rows]
+            for file_name, segment, bloom in self._load_partition(source, str(month)):
+                if file_name == exclude_file or len(segment) == 0:
+                    continue
+                open_rows = np.flatnonzero(~seen[rows])
+                if bloom is not None:
+                    open_rows = open_rows[bloom.might_contain(month_hashes[open_rows])]
+                if len(open_rows) == 0:
+                    continue
+                candidates = month_hashes[open_rows]
+                pos = np.minimum(np.searchsorted(segment, candidates), len(segment) - 1)
+                seen[rows[open_rows]] = segment[pos] == candidates
+        return seen
+
+    def mark_seen(self, source, months, hashes, file_name):
+        """Wie lookup, zusätzlich gegen die vorgemerkten Hashes anderer Dateien; merkt danach die eigenen vor.
+
+        Prüfen und Vormerken geschehen unter einer Sperre, damit sich zwei gleichzeitig laufende
+        Dateien mit denselben Zeilen nicht gegenseitig übersehen.
+        """
+        with self._lock:
+            seen = self.lookup(source, months, hashes, exclude_file=file_name)
+            for other_file, pending in self._pending.items():
+                if other_file == file_name:
+                    continue
+                for (pending_source, month), parts in pending.items():
+                    if pending_source != source:
+                        continue
+                    rows = np.flatnonzero((months == month) & ~seen)
+                    if len(rows):
+                        seen[rows] = np.isin(hashes[rows], np.concatenate(parts))
+            self.stage(source, months, hashes, file_name)
+        return seen
+
+    def stage(self, source, months, hashes, file_name):
+        """Merkt Hashes der Datei file_name vor; geschrieben wird erst mit commit() nach erfolgreichem Laden."""
+        unique_months, inverse = np.unique(months, return_inverse=True)
+        with self._lock:
+            pending = self._pending.setdefault(file_name, {})
+            for month_idx, month in enumerate(unique_months):
+                pending.setdefault((source, str(month)), []).append(hashes[inverse == month_idx])
+
+    def commit(self, file_name):
+        """Schreibt alle vorgemerkten Hashes als Segmente der Datei file_name (atomar per rename)."""
+        # Vormerkung erst nach dem Schreiben entfernen, damit andere Dateien die Hashes lückenlos sehen
+        with self._lock:
+            pending = dict(self._pending.get(file_name, {}))
+        for (source, month), parts in pending.items():
+            hashes = np.unique(np.concatenate(parts))
+            partition_dir = self._partition_dir(source, month)
+            os.makedirs(partition_dir, exist_ok=True)
+            if self.use_bloom:
+                bloom = BloomFilter.for_capacity(len(hashes), self.bloom_fp_rate)
+                bloom.add(hashes)
+                self._atomic_save(os.path.join(partition_dir, file_name + BLOOM_SUFFIX), bloom.save)
+            self._atomic_save(os.path.join(partition_dir, file_name + SEGMENT_SUFFIX),
+                              lambda path: np.save(path, hashes))
+            with self._lock:
+                self._segments.pop((source, month), None)
+        with self._lock:
+            self._pending.pop(file_name, None)
+
+    def discard(self, file_name):
+        """Verwirft die vorgemerkten Hashes einer Datei (z.B. nach einem fehlgeschlagenen Load)."""
+        with self._lock:
+            self._pending.pop(file_name, None)
+
+    @staticmethod
+    def _atomic_save(path, save_fn):
+        tmp_path = f"{path}.tmp-{os.getpid()}.npy"
+        save_fn(tmp_path)
+        os.replace(tmp_path, path)
@@ -0,0 +1,228 @@
+import threading
+import time
+import uuid
+
+# Höchstens so viele Load Jobs gleichzeitig ausstehend (weitere Einreichungen warten)
+DEFAULT_MAX_OUTSTANDING = 8
+# Wiederholungen bei transienten Fehlern mit exponentiellem Backoff
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+DEFAULT_POLL_SECONDS = 1.0
+
+# Fehlergründe von BigQuery-Jobs bzw. HTTP-Status, bei denen ein neuer Versuch sinnvoll ist
+TRANSIENT_REASONS = {"backendError", "internalError", "rateLimitExceeded", "jobBackendError", "jobInternalError"}
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+CONFLICT_STATUS_CODE = 409
+
+
+def is_transient(error):
+    """Prüft, ob ein Fehler beim Einreichen oder Ausführen eines Jobs vorübergehend ist."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if getattr(error, "code", None) in TRANSIENT_STATUS_CODES:
+        return True
+    reasons = {e.get("reason") for e in getattr(error, "errors", None) or [] if isinstance(e, dict)}
+    return bool(reasons & TRANSIENT_REASONS)
+
+
+class LoadGroup:
+    """Die Load Jobs einer Datei.
+
+    Nach seal() gilt die Gruppe als abgeschlossen, sobald kein Job mehr aussteht: erfolgreich,
+    wenn alle Jobs erfolgreich waren, sonst mit dem ersten endgültigen Fehler (error).
+    """
+
+    def __init__(self, poller, label):
+        self.poller = poller
+        self.label = label
+        self.pending = 0
+        self.retries = 0
+        self.completed = []  # erfolgreich abgeschlossene Jobs (für Statistiken)
+        self.error = None
+        self.sealed = False
+        self.settled = False
+        self.on_success = None
+        self.on_failure = None
+
+    def submit(self, start_job, cleanup=None, get_job=None):
+        self.poller.submit(self, start_job, cleanup, get_job)
+
+    def seal(self, on_success=None, on_failure=None):
+        """Keine weiteren Jobs. on_success() bzw. on_failure(error) laufen in LoadJobPoller.collect()."""
+        self.poller.seal(self, on_success, on_failure)
+
+    def abandon(self):
+        """Ausstehende Jobs laufen zu Ende, ihr Ergebnis wird aber nicht mehr ausgewertet (Datei fehlgeschlagen)."""
+        if not self.sealed:
+            self.seal()
+
+
+class LoadJobPoller:
+    """Verfolgt alle ausstehenden Load Jobs eines Prozesses in einem Hintergrund-Thread.
+
+    submit() reicht einen Job ein und kehrt sofort zurück (blockiert nur, solange max_outstanding
+    Jobs ausstehen). Der Poller fragt die Jobs ab, reicht sie bei transienten Fehlern mit Backoff
+    erneut ein und markiert Gruppen als abgeschlossen. Deren Callbacks (Audit-Zeile, Manifest, ...)
+    laufen in dem Thread, der collect() bzw. drain() aufruft, nie im Poller-Thread.
+
+    Job-IDs sind <präfix>_<lauf>: Schlägt das Einreichen selbst transient fehl, wird dieselbe ID
+    erneut eingereicht und ein bereits angelegter Job (Konflikt) über get_job übernommen, statt
+    die Daten ein zweites Mal anzuhängen. Erst nach einem fehlgeschlagenen Job folgt eine neue ID.
+    """
+
+    def __init__(self, max_outstanding=DEFAULT_MAX_OUTSTANDING, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_seconds=DEFAULT_BACKOFF_SECONDS, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.max_outstanding = max_outstanding
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.jobs = 0
+        self.retries = 0
+        self.failed = 0
+        self.max_seen_outstanding = 0
+        self._entries = []
+        self._settled = []
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll_periodically, name="load-job-poller", daemon=True)
+        self._thread.start()
+
+    def group(self, label):
+        return LoadGroup(self, label)
+
+    def submit(self, group, start_job, cleanup=None, get_job=None):
+        """Reicht start_job(job_id) -> Job ein, ohne auf den Job zu warten. cleanup() läuft nach dem Ende."""
+        with self._cond:
+            while len(self._entries) >= self.max_outstanding:
+                self._cond.wait()
+            entry = {"group": group, "start_job": start_job, "cleanup": cleanup, "get_job": get_job,
+                     "prefix": f"staging_{uuid.uuid4().hex}", "run": 0, "attempt": 0, "job": None, "retry_at": None}
+            self._entries.append(entry)
+            group.pending += 1
+            self.jobs += 1
+            self.max_seen_outstanding = max(self.max_seen_outstanding, len(self._entries))
+        self._start(entry)
+
+    def _start(self, entry):
+        job_id = f"{entry['prefix']}_{entry['run']}"
+        try:
+            job = entry["start_job"](job_id)
+        except Exception as e:
+            if getattr(e, "code", None) == CONFLICT_STATUS_CODE and entry["get_job"] is not None:
+                # Der vorige Einreichungsversuch hat den Job trotz Fehler angelegt
+                job = entry["get_job"](job_id)
+            else:
+                self._retry_or_fail(entry, e, resubmit_same_id=True)
+                return
+        with self._cond:
+            entry["job"] = job
+            self._cond.notify_all()
+
+    def _retry_or_fail(self, entry, error, resubmit_same_id=False):
+        with self._cond:
+            if entry["attempt"] < self.max_retries and is_transient(error):
+                delay = min(self.backoff_seconds * 2 ** entry["attempt"], MAX_BACKOFF_SECONDS)
+                entry["attempt"] += 1
+                if not resubmit_same_id:
+                    entry["run"] += 1
+                entry["job"] = None
+                entry["retry_at"] = time.time() + delay
+                entry["group"].retries += 1
+                self.retries += 1
+                print(f"WARNUNG: Load Job für {entry['group'].label} fehlgeschlagen ({type(error).__name__}: {error}); "
+                      f"Versuch {entry['attempt'] + 1} in {delay:.0f}s.")
+                self._cond.notify_all()
+                return
+        self._finish(entry, error)
+
+    def _finish(self, entry, error=None, job=None):
+        if entry["cleanup"] is not None:
+            entry["cleanup"]()
+        with self._cond:
+            self._entries.remove(entry)
+            group = entry["group"]
+            group.pending -= 1
+            if error is not None:
+                self.failed += 1
+                group.error = group.error or error
+            elif job is not None:
+                group.completed.append(job)
+            self._settle_if_done(group)
+            self._cond.notify_all()
+
+    def _settle_if_done(self, group):
+        if group.sealed and group.pending == 0 and not group.settled:
+            group.settled = True
+            self._settled.append(group)
+
+    def seal(self, group, on_success=None, on_failure=None):
+        with self._cond:
+            group.on_success = on_success
+            group.on_failure = on_failure
+            group.sealed = True
+            self._settle_if_done(group)
+            self._cond.notify_all()
+
+    def poll(self):
+        """Ein Durchgang über alle ausstehenden Jobs (Neueinreichungen, abgeschlossene Jobs)."""
+        with self._cond:
+            entries = list(self._entries)
+        now = time.time()
+        for entry in entries:
+            with self._cond:
+                job = entry["job"]
+                resubmit = job is None and entry["retry_at"] is not None and now >= entry["retry_at"]
+                if resubmit:
+                    entry["retry_at"] = None
+            if resubmit:
+                self._start(entry)
+            if job is None:
+                continue
+            try:
+                done = job.done()
+            except Exception as e:
+                # Nur die Abfrage ist fehlgeschlagen; der Job selbst läuft weiter
+                print(f"WARNUNG: Status von Load Job {getattr(job, 'job_id', '?')} nicht abrufbar: {e}")
+                continue
+            if not done:
+                continue
+            try:
+                job.result()
+            except Exception as e:
+                self._retry_or_fail(entry, e)
+                continue
+            self._finish(entry, job=job)
+
+    def _poll_periodically(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.poll()
+
+    def collect(self):
+        """Führt die Callbacks aller inzwischen abgeschlossenen Gruppen im aufrufenden Thread aus."""
+        with self._cond:
+            settled, self._settled = self._settled, []
+        for group in settled:
+            if group.error is None:
+                if group.on_success is not None:
+                    group.on_success()
+            elif group.on_failure is not None:
+                group.on_failure(group.error)
+        return len(settled)
+
+    def drain(self):
+        """Wartet, bis kein Job mehr aussteht, und führt alle Callbacks aus (am Ende eines Laufs)."""
+        while True:
+            self.collect()
+            with self._cond:
+                if not self._entries and not self._settled:
+                    return
+                self._cond.wait(self.poll_seconds)
+
+    def close(self):
+        self.drain()
+        self._stop.set()
+        self._thread.join()
+        if self.jobs:
+            print(f"INFO: {self.jobs} Load Jobs asynchron eingereicht ({self.retries} Wiederholungen, "
+                  f"{self.failed} fehlgeschlagen, max. {self.max_seen_outstanding} gleichzeitig ausstehend).")
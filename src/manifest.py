@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Ergebnis von classify()
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+# Zustände eines Row-Group-Checkpoints: vor dem Anhängen vorgemerkt bzw. angehängt
+PENDING = "pending"
+APPENDED = "appended"
+
+CHECKPOINT_COLUMNS = [
+    "gcs_path", "generation", "first_row_group", "last_row_group", "append_id", "status",
+    "row_count", "duplicate_count", "missing_count", "quarantined_count", "bytes_uploaded", "row_hashes",
+]
+
+
+class IngestionManifest:
+    """Lokales Manifest (SQLite) aller gesehenen Quelldateien mit Generation, Größe, Checksumme und Status.
+
+    Ersetzt die Abfrage der Audit-Tabelle beim Start: ob eine Datei neu, geändert oder
+    unverändert ist, wird per Primärschlüssel-Lookup entschieden.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Ergebnisse können aus Pipeline-Threads gemeldet werden; Zugriffe werden per Lock serialisiert.
+        # Worker-Prozesse schreiben Checkpoints über eigene Verbindungen; SQLite serialisiert diese
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                gcs_path   TEXT PRIMARY KEY,
+                file_name  TEXT NOT NULL,
+                generation INTEGER,
+                size       INTEGER,
+                crc32c     TEXT,
+                status     TEXT NOT NULL,
+                table_name TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_by_name ON files (file_name)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS row_group_checkpoints (
+                gcs_path          TEXT NOT NULL,
+                generation        INTEGER,
+                first_row_group   INTEGER NOT NULL,
+                last_row_group    INTEGER NOT NULL,
+                append_id         TEXT NOT NULL,
+                status            TEXT NOT NULL,
+                row_count         INTEGER,
+                duplicate_count   INTEGER,
+                missing_count     INTEGER,
+                quarantined_count INTEGER,
+                bytes_uploaded    INTEGER,
+                row_hashes        BLOB,
+                updated_at        TEXT NOT NULL,
+                PRIMARY KEY (gcs_path, first_row_group)
+            )
+        """)
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get(self, gcs_path):
+        row = self._conn.execute(
+            "SELECT gcs_path, file_name, generation, size, crc32c, status, table_name, updated_at FROM files WHERE gcs_path = ?",
+            (gcs_path,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ["gcs_path", "file_name", "generation", "size", "crc32c", "status", "table_name", "updated_at"]
+        return dict(zip(keys, row))
+
+    def classify(self, obj):
+        """Entscheidet für ein gelistetes Objekt (dict mit name/generation/size/crc32c): new, changed oder unchanged.
+
+        Unverändert ist eine Datei nur, wenn sie mit identischer Generation bzw. Checksumme
+        bereits erfolgreich verarbeitet wurde.
+        """
+        entry = self.get(obj["name"])
+        if entry is None:
+            return NEW
+        same_content = (
+            entry["generation"] == obj.get("generation")
+            or (entry["crc32c"] is not None and entry["crc32c"] == obj.get("crc32c") and entry["size"] == obj.get("size"))
+        )
+        if not same_content:
+            return CHANGED
+        return UNCHANGED if entry["status"] == "success" else NEW
+
+    def record(self, obj, status, table_name=None):
+        """Speichert Status und Objekt-Metadaten einer Datei (überschreibt frühere Einträge)."""
+        with self._lock:
+            self._record(obj, status, table_name)
+
+    def _record(self, obj, status, table_name):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (gcs_path, file_name, generation, size, crc32c, status, table_name, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                obj["name"],
+                obj["name"].split("/")[-1],
+                obj.get("generation"),
+                obj.get("size"),
+                obj.get("crc32c"),
+                status,
+                table_name,
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+        self._conn.commit()
+
+    def reconcile(self, objects, successful_file_names):
+        """Gleicht das Manifest mit der Audit-Tabelle ab.
+
+        - gelistete Dateien mit 'success' im Audit-Log, aber ohne Manifest-Eintrag, werden mit
+          ihren aktuellen Metadaten als 'success' übernommen
+        - Manifest-Einträge mit 'success', die im Audit-Log fehlen, werden auf 'unknown' gesetzt
+          und beim nächsten Lauf neu verarbeitet
+        Liefert (übernommen, zurückgesetzt).
+        """
+        adopted = 0
+        for obj in objects:
+            file_name = obj["name"].split("/")[-1]
+            if file_name in successful_file_names and self.get(obj["name"]) is None:
+                self.record(obj, "success")
+                adopted += 1
+
+        reset = 0
+        for gcs_path, file_name in self._conn.execute(
+            "SELECT gcs_path, file_name FROM files WHERE status = 'success'"
+        ).fetchall():
+            if file_name not in successful_file_names:
+                self._conn.execute("UPDATE files SET status = 'unknown' WHERE gcs_path = ?", (gcs_path,))
+                reset += 1
+        self._conn.commit()
+        return adopted, reset
+
+    # --- Row-Group-Checkpoints (Wiederaufnahme großer Dateien) ---
+
+    def checkpoints(self, gcs_path, generation):
+        """Checkpoints der Datei in Row-Group-Reihenfolge. Einträge einer anderen Generation (die Datei
+        wurde inzwischen geändert) werden verworfen."""
+        with self._lock:
+            self._conn.execute("DELETE FROM row_group_checkpoints WHERE gcs_path = ? AND generation IS NOT ?",
+                               (gcs_path, generation))
+            self._conn.commit()
+            rows = self._conn.execute(
+                f"SELECT {', '.join(CHECKPOINT_COLUMNS)} FROM row_group_checkpoints WHERE gcs_path = ? ORDER BY first_row_group",
+                (gcs_path,),
+            ).fetchall()
+        return [dict(zip(CHECKPOINT_COLUMNS, row)) for row in rows]
+
+    def begin_row_groups(self, gcs_path, generation, first_row_group, last_row_group, append_id):
+        """Merkt den Bereich vor dem Anhängen vor; ein Abbruch danach wiederholt ihn mit derselben append_id."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO row_group_checkpoints "
+                "(gcs_path, generation, first_row_group, last_row_group, append_id, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (gcs_path, generation, first_row_group, last_row_group, append_id, PENDING,
+                 datetime.now(timezone.utc).isoformat()),
+            )
+            self._conn.commit()
+
+    def complete_row_groups(self, gcs_path, first_row_group, counts, row_hashes):
+        """Markiert den Bereich als angehängt und speichert Zähler und Zeilen-Hashes (für die Duplikaterkennung)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE row_group_checkpoints SET status = ?, row_count = ?, duplicate_count = ?, missing_count = ?, "
+                "quarantined_count = ?, bytes_uploaded = ?, row_hashes = ?, updated_at = ? "
+                "WHERE gcs_path = ? AND first_row_group = ?",
+                (APPENDED, counts["row_count"], counts["duplicate_count"], counts["missing_count"],
+                 counts["quarantined_count"], counts["bytes_uploaded"], row_hashes,
+                 datetime.now(timezone.utc).isoformat(), gcs_path, first_row_group),
+            )
+            self._conn.commit()
+
+    def clear_checkpoints(self, gcs_path):
+        """Entfernt die Checkpoints, sobald die Datei erfolgreich protokolliert ist."""
+        with self._lock:
+            self._conn.execute("DELETE FROM row_group_checkpoints WHERE gcs_path = ?", (gcs_path,))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
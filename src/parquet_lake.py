@@ -0,0 +1,333 @@
+import argparse
+import os
+import time
+
+import fsspec
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from unified_schema import PARTITION_COLUMN, unify_arrow_table
+
+# Hive-Partitionierung des Lakes: <root>/source=<quelle>/year=<jahr>/month=<monat>/
+LAKE_PARTITIONING = pa.schema([("source", pa.string()), ("year", pa.int16()), ("month", pa.int8())])
+LAKE_COMPRESSION = "zstd"
+LAKE_COMPRESSION_LEVEL = 3
+# Row Groups groß genug für effiziente Scans, klein genug für Pruning über die Min/Max-Statistiken
+LAKE_ROW_GROUP_ROWS = 512 * 1024
+# Kompaktierung: Dateien unter der Zielgröße werden je Partition und Quelldatei zusammengeführt
+DEFAULT_TARGET_FILE_MB = 256
+DEFAULT_MIN_FILES = 2
+COMPACTED_PREFIX = "compacted-"
+
+
+def lake_filesystem(root):
+    """(pyarrow-Dateisystem, Pfad) für einen lokalen Pfad oder eine fsspec-URI (z.B. gs://...)."""
+    fs, path = fsspec.core.url_to_fs(root)
+    return pafs.PyFileSystem(pafs.FSSpecHandler(fs)), path
+
+
+def dictionary_columns(schema):
+    """String-Spalten (z.B. dispatching_base_num, Flags) werden dictionary-kodiert, Zahlen und Zeitstempel nicht."""
+    return [field.name for field in schema
+            if pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or pa.types.is_dictionary(field.type)]
+
+
+def add_partition_columns(table, source_prefix):
+    """Ergänzt source/year/month aus dem Pickup-Monat (Zeilen ohne Pickup landen in der Default-Partition)."""
+    pickup_month = table[PARTITION_COLUMN]
+    table = table.append_column("source", pa.array([source_prefix] * table.num_rows, pa.string()))
+    table = table.append_column("year", pc.cast(pc.year(pickup_month), pa.int16()))
+    return table.append_column("month", pc.cast(pc.month(pickup_month), pa.int8()))
+
+
+def write_partitioned(table, root, basename):
+    """Schreibt eine Tabelle mit Partitionsspalten als Hive-partitioniertes Parquet.
+
+    Je Partition entsteht <basename>-<i>.parquet; ein erneuter Aufruf mit gleichem basename
+    ersetzt die Dateien. Liefert die Anzahl geschriebener Bytes.
+    """
+    filesystem, path = lake_filesystem(root)
+    data_schema = pa.schema([field for field in table.schema if field.name not in LAKE_PARTITIONING.names])
+    file_format = ds.ParquetFileFormat()
+    written = []
+    ds.write_dataset(
+        table, path, filesystem=filesystem, format=file_format,
+        partitioning=ds.partitioning(LAKE_PARTITIONING, flavor="hive"),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=file_format.make_write_options(
+            compression=LAKE_COMPRESSION, compression_level=LAKE_COMPRESSION_LEVEL,
+            use_dictionary=dictionary_columns(data_schema),
+        ),
+        max_rows_per_group=LAKE_ROW_GROUP_ROWS,
+        file_visitor=lambda written_file: written.append(written_file.size),
+    )
+    return sum(written)
+
+
+def lake_files(fs, path, source_prefix):
+    """Sichtbare Parquet-Dateien aller Partitionen einer Quelle."""
+    source_path = f"{path}/source={source_prefix}"
+    if not fs.exists(source_path):
+        return []
+    return sorted(file_path for file_path in fs.find(source_path)
+                  if file_path.endswith(".parquet") and not os.path.basename(file_path).startswith("."))
+
+
+def file_source_files(fs, file_path):
+    """Kleinster und größter Wert der Spalte source_file laut Footer-Statistik (None, falls nicht ermittelbar)."""
+    with fs.open(file_path, "rb") as f:
+        metadata = pq.ParquetFile(f).metadata
+    if "source_file" not in metadata.schema.names:
+        return None
+    column = metadata.schema.names.index("source_file")
+    low = high = None
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(column).statistics
+        if statistics is None or not statistics.has_min_max:
+            return None
+        low = statistics.min if low is None else min(low, statistics.min)
+        high = statistics.max if high is None else max(high, statistics.max)
+    return (low, high) if low is not None else None
+
+
+def rewrite_without(fs, file_path, source_file):
+    """Schreibt eine Datei mit Zeilen mehrerer Quelldateien ohne die Zeilen von source_file neu (bzw. löscht sie)."""
+    with fs.open(file_path, "rb") as f:
+        table = pq.read_table(f)
+    table = table.filter(pc.not_equal(table["source_file"], source_file))
+    if table.num_rows == 0:
+        fs.rm(file_path)
+        return
+    tmp_path = f"{os.path.dirname(file_path)}/.{os.path.basename(file_path)}.tmp"
+    with fs.open(tmp_path, "wb") as tmp_file:
+        pq.write_table(table, tmp_file, row_group_size=LAKE_ROW_GROUP_ROWS, compression=LAKE_COMPRESSION,
+                       compression_level=LAKE_COMPRESSION_LEVEL, use_dictionary=dictionary_columns(table.schema))
+    fs.mv(tmp_path, file_path)
+
+
+def clear_source_file(root, source_prefix, source_file, keep=None):
+    """Entfernt die Zeilen einer Quelldatei aus dem Lake, bevor sie erneut geschrieben wird.
+
+    Kandidaten sind die Teildateien <datei>-* und die kompaktierten Dateien der Quelle; welche Quelldatei
+    eine Datei enthält, entscheidet die Footer-Statistik der Spalte source_file. Dateien nur dieser
+    Quelldatei werden gelöscht, ältere Kompaktate mehrerer Quelldateien ohne ihre Zeilen neu geschrieben.
+    keep (append_ids der aus Checkpoints übernommenen Bereiche) setzt einen Lauf fort: dann bleiben
+    deren Teildateien und alle Kompaktate stehen, gelöscht werden nur die übrigen Teildateien.
+    Liefert die Anzahl entfernter bzw. neu geschriebener Dateien.
+    """
+    fs, path = fsspec.core.url_to_fs(root)
+    stem = source_file.rsplit(".", 1)[0]
+    keep_prefixes = tuple(f"{stem}-{append_id}-" for append_id in keep or ())
+    touched = 0
+    for file_path in lake_files(fs, path, source_prefix):
+        name = os.path.basename(file_path)
+        compacted = name.startswith(COMPACTED_PREFIX)
+        if not (name.startswith(f"{stem}-") or compacted):
+            continue
+        if (keep is not None and compacted) or (keep_prefixes and name.startswith(keep_prefixes)):
+            continue
+        bounds = file_source_files(fs, file_path)
+        if bounds is not None and not bounds[0] <= source_file <= bounds[1]:
+            continue
+        if bounds == (source_file, source_file):
+            fs.rm(file_path)
+        else:
+            rewrite_without(fs, file_path, source_file)
+        touched += 1
+    return touched
+
+
+class LakeSink:
+    """Schreibt geflaggte Daten im vereinheitlichten Spaltensatz der Quelle in den Parquet-Lake.
+
+    Jeder Schreibvorgang erzeugt je berührter Partition eine Datei <datei>-<nr>-<i>.parquet (bzw.
+    <datei>-<append_id>-<i>.parquet bei Row-Group-Checkpoints, damit Wiederholungen idempotent sind).
+    Vor dem ersten Schreiben werden die Zeilen früherer Läufe derselben Quelldatei entfernt
+    (clear_source_file), auch aus kompaktierten Dateien; ein erneutes Stagen nach einer Kompaktierung
+    oder mit neuer Generation und anderen Partitionen dupliziert so keine Zeilen.
+    """
+
+    def __init__(self, root, source_prefix, unified_columns, schema_version, source_file):
+        self.root = root.rstrip("/")
+        self.source_prefix = source_prefix
+        self.unified_columns = unified_columns
+        self.schema_version = schema_version
+        self.source_file = source_file
+        self.stem = source_file.rsplit(".", 1)[0]
+        self.parts = 0
+        self.bytes_written = 0
+        self.cleared = False
+
+    def clear(self, keep=None):
+        """Entfernt die Zeilen früherer Läufe dieser Quelldatei (keep: übernommene append_ids, siehe clear_source_file)."""
+        removed = clear_source_file(self.root, self.source_prefix, self.source_file, keep)
+        if removed:
+            print(f"INFO: {removed} Lake-Dateien früherer Läufe von {self.source_file} entfernt bzw. bereinigt.")
+        self.cleared = True
+
+    def write_dataframe(self, df, append_id=None):
+        return self.write_arrow(pa.Table.from_pandas(df, preserve_index=False), append_id)
+
+    def write_arrow(self, table, append_id=None):
+        if not self.cleared:
+            self.clear()
+        table = unify_arrow_table(table, self.unified_columns, self.source_prefix, self.schema_version, self.source_file)
+        basename = f"{self.stem}-{append_id}" if append_id else f"{self.stem}-{self.parts:05d}"
+        self.parts += 1
+        size = write_partitioned(add_partition_columns(table, self.source_prefix), self.root, basename)
+        self.bytes_written += size
+        return size
+
+    def close(self):
+        """Schließt den Sink nach der letzten Schreiboperation (für gepufferte Sinks)."""
+        pass
+
+
+class LakeTeeSink:
+    """Schreibt jeden Batch in den Haupt-Sink und zusätzlich in den Parquet-Lake.
+
+    Zurückgegeben werden nur die ins Warehouse hochgeladenen Bytes (Lake: lake_sink.bytes_written).
+    Alle übrigen Attribute (job_config, stream_name, abort, ...) stammen vom Haupt-Sink.
+    """
+
+    def __init__(self, sink, lake_sink):
+        self.sink = sink
+        self.lake_sink = lake_sink
+
+    def __getattr__(self, name):
+        if name == "sink":
+            raise AttributeError(name)
+        return getattr(self.sink, name)
+
+    def write_dataframe(self, df, **kwargs):
+        written = self.sink.write_dataframe(df, **kwargs)
+        self.lake_sink.write_dataframe(df, kwargs.get("append_id"))
+        return written
+
+    def write_arrow(self, table, **kwargs):
+        written = self.sink.write_arrow(table, **kwargs)
+        self.lake_sink.write_arrow(table, kwargs.get("append_id"))
+        return written
+
+    def close(self):
+        self.sink.close()
+        self.lake_sink.close()
+
+
+def open_lake(root, source_prefix):
+    """Öffnet die Partitionen einer Quelle als pyarrow-Dataset (Partition Pruning über year/month,
+    Spaltenprojektion über columns= beim Lesen)."""
+    filesystem, path = lake_filesystem(root)
+    return ds.dataset(f"{path}/source={source_prefix}", filesystem=filesystem, format="parquet",
+                      partitioning=ds.partitioning(pa.schema([LAKE_PARTITIONING.field("year"), LAKE_PARTITIONING.field("month")]), flavor="hive"))
+
+
+# --- KOMPAKTIERUNG ---
+
+def plan_compaction(sizes, target_bytes, min_files=DEFAULT_MIN_FILES):
+    """Gruppiert die kleinen Dateien einer Partition ({Pfad: Bytes}) zu Gruppen von etwa target_bytes."""
+    groups, group, group_bytes = [], [], 0
+    for path, size in sorted(sizes.items()):
+        if size >= target_bytes:
+            continue
+        group.append(path)
+        group_bytes += size
+        if group_bytes >= target_bytes:
+            groups.append(group)
+            group, group_bytes = [], 0
+    groups.append(group)
+    return [group for group in groups if len(group) >= min_files]
+
+
+def merge_files(fs, paths, out_path):
+    """Führt Parquet-Dateien einer Partition zu einer Datei mit vollen Row Groups zusammen (gepuffert je Row Group)."""
+    writer = None
+    buffered, buffered_rows = [], 0
+
+    def flush():
+        nonlocal writer, buffered, buffered_rows
+        table = pa.concat_tables(buffered, promote_options="permissive")
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_file, table.schema, compression=LAKE_COMPRESSION,
+                                      compression_level=LAKE_COMPRESSION_LEVEL,
+                                      use_dictionary=dictionary_columns(table.schema))
+        elif not table.schema.equals(writer.schema):
+            table = table.select(writer.schema.names).cast(writer.schema)
+        writer.write_table(table, row_group_size=LAKE_ROW_GROUP_ROWS)
+        buffered, buffered_rows = [], 0
+
+    tmp_path = f"{os.path.dirname(out_path)}/.{os.path.basename(out_path)}.tmp"
+    with fs.open(tmp_path, "wb") as tmp_file:
+        for path in paths:
+            with fs.open(path, "rb") as f:
+                table = pq.read_table(f)
+            buffered.append(table)
+            buffered_rows += table.num_rows
+            if buffered_rows >= LAKE_ROW_GROUP_ROWS:
+                flush()
+        if buffered:
+            flush()
+        writer.close()
+    fs.mv(tmp_path, out_path)
+
+
+def compact_lake(root, target_file_mb=DEFAULT_TARGET_FILE_MB, min_files=DEFAULT_MIN_FILES):
+    """Führt kleine Dateien je Partition und Quelldatei zu Dateien von etwa target_file_mb zusammen.
+
+    Jede kompaktierte Datei enthält nur Zeilen einer Quelldatei, damit LakeSink sie beim erneuten
+    Stagen als Ganzes löschen kann (Dateien ohne eindeutige source_file-Statistik werden untereinander
+    zusammengeführt). Die zusammengeführte Datei wird erst unter einem versteckten Namen geschrieben
+    und dann umbenannt; danach werden die Eingabedateien gelöscht. Liefert Zähler für die Ausgabe.
+    """
+    fs, path = fsspec.core.url_to_fs(root)
+    target_bytes = target_file_mb * 1024 * 1024
+    by_group = {}
+    for file_path, info in fs.find(path, detail=True).items():
+        name = os.path.basename(file_path)
+        if name.endswith(".parquet") and not name.startswith("."):
+            bounds = file_source_files(fs, file_path)
+            source_file = bounds[0] if bounds is not None and bounds[0] == bounds[1] else None
+            by_group.setdefault((os.path.dirname(file_path), source_file or ""), {})[file_path] = info["size"]
+
+    stats = {"partitions": 0, "files_in": 0, "files_out": 0, "bytes_in": 0, "bytes_out": 0}
+    compacted_partitions = set()
+    for (partition, _), sizes in sorted(by_group.items()):
+        groups = plan_compaction(sizes, target_bytes, min_files)
+        if groups and partition not in compacted_partitions:
+            compacted_partitions.add(partition)
+            stats["partitions"] += 1
+        for i, group in enumerate(groups):
+            out_path = f"{partition}/{COMPACTED_PREFIX}{time.time_ns()}-{i}.parquet"
+            merge_files(fs, group, out_path)
+            fs.rm(group)
+            stats["files_in"] += len(group)
+            stats["files_out"] += 1
+            stats["bytes_in"] += sum(sizes[p] for p in group)
+            stats["bytes_out"] += fs.size(out_path)
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kompaktierung des Hive-partitionierten Parquet-Lakes (staging --lake-dir).")
+    parser.add_argument("lake_dir", help="Wurzel des Lakes (lokaler Pfad oder gs://...).")
+    parser.add_argument("--target-file-mb", type=int, default=DEFAULT_TARGET_FILE_MB,
+                        help=f"Zielgröße der zusammengeführten Dateien (Standard: {DEFAULT_TARGET_FILE_MB} MB).")
+    parser.add_argument("--min-files", type=int, default=DEFAULT_MIN_FILES,
+                        help=f"Partitionen erst ab so vielen kleinen Dateien kompaktieren (Standard: {DEFAULT_MIN_FILES}).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.time()
+    stats = compact_lake(args.lake_dir, args.target_file_mb, args.min_files)
+    print(f"KOMPAKTIERUNG: {stats['partitions']} Partitionen | {stats['files_in']} Dateien -> {stats['files_out']} | "
+          f"{stats['bytes_in'] / 2**20:,.1f} MiB -> {stats['bytes_out'] / 2**20:,.1f} MiB | Dauer: {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import pyarrow as pa
+
+from unified_schema import FLAG_COLUMNS
+
+# SQL-Dialekte: BigQuery (Produktion) und DuckDB (lokales Warehouse als Stand-in)
+BIGQUERY = "bigquery"
+DUCKDB = "duckdb"
+
+# Spalten der Zählabfrage (entsprechen den gleichnamigen Zählern in stats)
+PUSHDOWN_STATS = ["row_count", "duplicate_count", "missing_count", "quarantined_count"]
+
+
+def quote_identifier(name, dialect):
+    if dialect == BIGQUERY:
+        return f"`{name}`"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_string_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def missing_condition(name, arrow_type, dialect):
+    """NULL-Prüfung einer kritischen Spalte wie arrow_missing_mask: NULL, NaN (Gleitkomma) oder '' (String)."""
+    col = quote_identifier(name, dialect)
+    conditions = [f"{col} IS NULL"]
+    if pa.types.is_floating(arrow_type):
+        conditions.append(f"IS_NAN({col})" if dialect == BIGQUERY else f"isnan({col})")
+    elif pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        conditions.append(f"{col} = ''")
+    return " OR ".join(conditions)
+
+
+def duplicate_window(columns, dialect):
+    """Fenster über alle Spalten: Zeilen einer Partition sind exakte Duplikate (wie arrow_duplicate_mask)."""
+    # Reine NULL-Spalten sind in jeder Zeile gleich und tragen nichts zur Unterscheidung bei
+    names = [quote_identifier(name, dialect) for name, arrow_type in columns if not pa.types.is_null(arrow_type)]
+    if not names:
+        return "OVER ()"
+    if dialect == BIGQUERY:
+        # BigQuery erlaubt kein PARTITION BY über FLOAT64; TO_JSON_STRING vergleicht die ganze Zeile exakt
+        return f"OVER (PARTITION BY TO_JSON_STRING(STRUCT({', '.join(names)})))"
+    return f"OVER (PARTITION BY {', '.join(names)})"
+
+
+def build_flag_select(source, columns, critical_cols, dialect, target_types=None):
+    """Erzeugt die SELECT-Anweisung, die duplicate_flag und missing_flag im Warehouse berechnet.
+
+    columns: [(Name, Arrow-Typ)] aus dem Parquet-Footer der Rohdatei; critical_cols: die vorhandenen
+    kritischen Spalten der Quelle (get_critical_null_cols). target_types ({Spalte: SQL-Typ}) castet
+    die Spalten auf das Schema der Staging-Tabelle. Das erste Vorkommen einer Zeile gilt nicht als
+    Duplikat; welche von mehreren identischen Zeilen das ist, spielt keine Rolle.
+    """
+    target_types = target_types or {}
+    select_list = []
+    for name, _ in columns:
+        col = quote_identifier(name, dialect)
+        select_list.append(f"CAST({col} AS {target_types[name]}) AS {col}" if name in target_types else col)
+
+    arrow_types = dict(columns)
+    missing = " OR ".join(f"({missing_condition(col, arrow_types[col], dialect)})" for col in critical_cols) or "FALSE"
+    duplicate_flag, missing_flag = FLAG_COLUMNS
+    return (
+        f"SELECT {', '.join(select_list)},\n"
+        f"  CASE WHEN ROW_NUMBER() {duplicate_window(columns, dialect)} > 1 THEN 'Y' ELSE 'N' END AS {duplicate_flag},\n"
+        f"  CASE WHEN {missing} THEN 'Y' ELSE 'N' END AS {missing_flag}\n"
+        f"FROM {source}"
+    )
+
+
+def build_flag_stats(flagged):
+    """Zählabfrage über das bereits geflaggte Ergebnis flagged (Tabelle; liefert die Spalten PUSHDOWN_STATS
+    in einer Zeile). Gelesen werden nur die beiden Flag-Spalten, nicht erneut die Rohdaten."""
+    duplicate_flag, missing_flag = FLAG_COLUMNS
+    return (
+        "SELECT COUNT(*) AS row_count,\n"
+        f"  COALESCE(SUM(CASE WHEN {duplicate_flag} = 'Y' THEN 1 ELSE 0 END), 0) AS duplicate_count,\n"
+        f"  COALESCE(SUM(CASE WHEN {missing_flag} = 'Y' THEN 1 ELSE 0 END), 0) AS missing_count,\n"
+        f"  COALESCE(SUM(CASE WHEN {duplicate_flag} = 'Y' OR {missing_flag} = 'Y' THEN 1 ELSE 0 END), 0) AS quarantined_count\n"
+        f"FROM {flagged}"
+    )
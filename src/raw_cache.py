@@ -0,0 +1,236 @@
+import argparse
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import fsspec
+
+DEFAULT_RAW_CACHE_DIR = "raw_cache"
+DEFAULT_RAW_CACHE_MB = 20 * 1024
+# Download in Blöcken (Prüfsumme wird dabei fortlaufend berechnet)
+CHUNK_SIZE = 8 * 1024 * 1024
+RUN_STATS = ["hits", "misses", "bypassed", "bytes_downloaded", "bytes_served", "evictions"]
+
+
+def cache_key(uri, generation, crc32c, size):
+    """Inhaltsadresse eines Objekts: Generation und CRC32C (ohne Prüfsumme zusätzlich die URI)."""
+    identity = f"{generation}:{crc32c}:{size}" if crc32c else f"{uri}:{generation}:{size}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def new_crc32c():
+    """Laufende CRC32C-Prüfsumme (google-crc32c wird erst bei Objekten mit Prüfsumme benötigt)."""
+    import google_crc32c
+    return google_crc32c.Checksum()
+
+
+class RawFileCache:
+    """Lokaler, inhaltsadressierter Cache roher Quelldateien mit Speicherbudget und LRU-Verdrängung.
+
+    Objekte liegen unter <dir>/objects/<xx>/<schlüssel>.parquet; ein SQLite-Index hält Größe und
+    letzten Zugriff. Heruntergeladene Objekte werden gegen die CRC32C des Objektspeichers geprüft,
+    bevor sie in den Cache übernommen werden. Treffer, Fehlschläge und Bytes werden je Lauf (run_id)
+    im Index gezählt, sodass auch Worker-Prozesse in dieselbe Statistik schreiben.
+    """
+
+    INDEX_NAME = "index.sqlite"
+
+    def __init__(self, cache_dir, budget_mb=DEFAULT_RAW_CACHE_MB, run_id=None):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.run_id = run_id
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, self.INDEX_NAME), timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key         TEXT PRIMARY KEY,
+                uri         TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                hits        INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_by_access ON entries (last_access)")
+        columns = ", ".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in RUN_STATS)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS run_stats (run_id TEXT PRIMARY KEY, {columns})")
+        self._conn.commit()
+
+    @classmethod
+    def open_existing(cls, cache_dir, budget_mb=DEFAULT_RAW_CACHE_MB):
+        """Öffnet einen vorhandenen Cache (None, falls es keinen gibt), z.B. für das lesende --plan."""
+        if not os.path.exists(os.path.join(cache_dir, cls.INDEX_NAME)):
+            return None
+        return cls(cache_dir, budget_mb)
+
+    def object_path(self, key):
+        return os.path.join(self.cache_dir, "objects", key[:2], f"{key}.parquet")
+
+    def lookup(self, uri, generation, crc32c, size):
+        """Lokaler Pfad eines bereits gecachten Objekts oder None (ohne Download und ohne Statistik)."""
+        key = cache_key(uri, generation, crc32c, size)
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        path = self.object_path(key)
+        if row is None or not os.path.exists(path) or os.path.getsize(path) != row[0]:
+            return None
+        return path
+
+    def fetch(self, uri, generation, crc32c, size):
+        """Liefert (lokaler Pfad, Treffer). Bei einem Fehlschlag wird das Objekt geprüft heruntergeladen.
+
+        Objekte über dem Budget werden nicht gecacht; dann wird die ursprüngliche URI geliefert.
+        """
+        key = cache_key(uri, generation, crc32c, size)
+        path = self.lookup(uri, generation, crc32c, size)
+        if path is not None:
+            with self._lock:
+                self._conn.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            self.record(hits=1, bytes_served=size)
+            return path, True
+
+        if size > self.budget_bytes:
+            print(f"WARNUNG: {uri} ({size / 2**20:,.0f} MiB) ist größer als das Cache-Budget und wird direkt gelesen.")
+            self.record(bypassed=1)
+            return uri, False
+
+        path = self.object_path(key)
+        self.download(uri, path, crc32c)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, uri, size, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                (key, uri, size, time.time()),
+            )
+            self._conn.commit()
+        self.record(misses=1, bytes_downloaded=size)
+        self.evict(keep=key)
+        return path, False
+
+    def download(self, uri, path, crc32c):
+        """Lädt das Objekt blockweise in eine temporäre Datei, prüft die CRC32C und benennt sie um."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        checksum = new_crc32c() if crc32c else None
+        try:
+            with fsspec.open(uri, "rb") as src, open(tmp_path, "wb") as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    if checksum is not None:
+                        checksum.update(chunk)
+                    dst.write(chunk)
+            if checksum is not None:
+                actual = base64.b64encode(checksum.digest()).decode("ascii")
+                if actual != crc32c:
+                    raise ValueError(f"CRC32C von {uri} stimmt nicht: erwartet {crc32c}, gelesen {actual}")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self, keep=None):
+        """Verdrängt die am längsten nicht genutzten Objekte, bis der Cache ins Budget passt."""
+        evicted = 0
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            candidates = self._conn.execute(
+                "SELECT key, size FROM entries WHERE key != ? ORDER BY last_access", (keep or "",)
+            ).fetchall()
+            for key, size in candidates:
+                if total <= self.budget_bytes:
+                    break
+                try:
+                    os.remove(self.object_path(key))
+                except FileNotFoundError:
+                    pass
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+            self._conn.commit()
+        if evicted:
+            self.record(evictions=evicted)
+        return evicted
+
+    def record(self, **counts):
+        if self.run_id is None:
+            return
+        assignments = ", ".join(f"{name} = {name} + excluded.{name}" for name in counts)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO run_stats (run_id, {', '.join(counts)}) VALUES (?, {', '.join('?' * len(counts))}) "
+                f"ON CONFLICT (run_id) DO UPDATE SET {assignments}",
+                (self.run_id, *counts.values()),
+            )
+            self._conn.commit()
+
+    def run_stats(self, run_id=None):
+        """Zähler eines Laufs (Standard: der eigene); ohne Lauf-Kennung die Summe aller Läufe."""
+        run_id = run_id or self.run_id
+        with self._lock:
+            if run_id is None:
+                row = self._conn.execute(f"SELECT {', '.join(f'SUM({name})' for name in RUN_STATS)} FROM run_stats").fetchone()
+            else:
+                row = self._conn.execute(f"SELECT {', '.join(RUN_STATS)} FROM run_stats WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(zip(RUN_STATS, [value or 0 for value in row or [0] * len(RUN_STATS)]))
+
+    def usage(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def summary(self, run_id=None):
+        stats = self.run_stats(run_id)
+        usage = self.usage()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0.0
+        return (f"{stats['hits']} Treffer, {stats['misses']} Fehlschläge ({hit_rate:.0f}% Trefferquote), "
+                f"{stats['bypassed']} zu groß | {stats['bytes_served'] / 2**20:,.1f} MiB aus dem Cache, "
+                f"{stats['bytes_downloaded'] / 2**20:,.1f} MiB heruntergeladen, {stats['evictions']} verdrängt | "
+                f"Belegung: {usage['entries']} Objekte, {usage['bytes'] / 2**20:,.1f} / {self.budget_bytes / 2**20:,.0f} MiB")
+
+    def close(self):
+        self._conn.close()
+
+
+def cached_path(uri, cache_dir=DEFAULT_RAW_CACHE_DIR, budget_mb=DEFAULT_RAW_CACHE_MB):
+    """Lokaler Pfad einer Rohdatei für Notebooks, z.B. pd.read_parquet(cached_path("gs://.../yellow_tripdata_2023-06.parquet")).
+
+    Generation und CRC32C stammen aus den fsspec-Metadaten des Objekts (gcsfs: generation/crc32c).
+    """
+    fs, path = fsspec.core.url_to_fs(uri)
+    info = fs.info(path)
+    generation = info.get("generation") or info.get("mtime")
+    # Notebook-Zugriffe erscheinen in der Statistik unter der Lauf-Kennung 'notebook'
+    cache = RawFileCache(cache_dir, budget_mb, run_id="notebook")
+    try:
+        return cache.fetch(uri, str(generation), info.get("crc32c"), info["size"])[0]
+    finally:
+        cache.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Belegung und Trefferstatistik des Raw-File-Caches (staging --raw-cache).")
+    parser.add_argument("cache_dir", nargs="?", default=DEFAULT_RAW_CACHE_DIR,
+                        help=f"Cache-Verzeichnis (Standard: {DEFAULT_RAW_CACHE_DIR}).")
+    parser.add_argument("--run-id", default=None, help="Statistik nur für diesen Lauf (Standard: alle Läufe).")
+    parser.add_argument("--budget-mb", type=int, default=None,
+                        help="Cache auf dieses Budget verkleinern (LRU-Verdrängung).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = RawFileCache.open_existing(args.cache_dir, args.budget_mb or DEFAULT_RAW_CACHE_MB)
+    if cache is None:
+        print(f"INFO: Kein Raw-File-Cache unter {args.cache_dir}.")
+        return
+    if args.budget_mb is not None:
+        print(f"INFO: {cache.evict()} Objekte verdrängt.")
+    print(f"RAW-CACHE: {cache.summary(args.run_id)}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import pyarrow.parquet as pq
+
+# Kleine Blockgröße: beim Lesen des Footers werden nur die letzten Bytes der Datei angefragt
+FOOTER_BLOCK_SIZE = 64 * 1024
+DEFAULT_FOOTER_WORKERS = 32
+
+
+def read_footer_schema(uri):
+    """Liest nur den Parquet-Footer (Ranged Read, keine Datenseiten) und liefert {Spalte: Arrow-Typ}."""
+    with fsspec.open(uri, "rb", block_size=FOOTER_BLOCK_SIZE) as f:
+        schema = pq.read_schema(f)
+    return {
+        field.name: str(field.type)
+        for field in schema
+        if not field.name.startswith("__index_level_")
+    }
+
+
+def read_footer_schemas(uris, workers=DEFAULT_FOOTER_WORKERS):
+    """Liest die Footer vieler Dateien parallel (I/O-gebunden, daher Threads). Liefert uri -> Schema oder Exception."""
+    def _read(uri):
+        try:
+            return uri, read_footer_schema(uri)
+        except Exception as e:
+            return uri, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(executor.map(_read, uris))
+
+
+def schema_fingerprint(column_types):
+    """Fingerprint eines Schemas: Hash über die sortierten (Spalte, Typ)-Paare (Reihenfolge egal, wie dict-Gleichheit)."""
+    canonical = json.dumps(sorted(column_types.items()))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class SchemaClassifier:
+    """Ordnet Footer-Schemata den bekannten Schema-Versionen aus schema/schemas_with_filenames_*.json zu.
+
+    schemas_by_source enthält pro Quelle (fhv/green/yellow) die Liste der Schema-Einträge im
+    JSON-Format. Unbekannte Schemata werden als neue Version 'Schema-<n+1>' angehängt; die
+    geänderten Quellen stehen danach in changed_sources und können zurückgeschrieben werden.
+    """
+
+    def __init__(self, schemas_by_source):
+        self.schemas_by_source = schemas_by_source
+        self.changed_sources = set()
+        self._index = {}
+        for source, entries in schemas_by_source.items():
+            for entry in entries:
+                key, column_types = _schema_item(entry)
+                if key:
+                    self._index[(source, schema_fingerprint(column_types))] = entry
+
+    def classify(self, source, filename, column_types):
+        """Liefert (Schema-Key, neu_registriert) für die Datei und trägt sie in den Schema-Eintrag ein."""
+        fingerprint = schema_fingerprint(column_types)
+        entry = self._index.get((source, fingerprint))
+        is_new = entry is None
+        if is_new:
+            entries = self.schemas_by_source.setdefault(source, [])
+            entry = {_next_schema_key(entries): dict(column_types), "files": []}
+            entries.append(entry)
+            self._index[(source, fingerprint)] = entry
+
+        if filename not in entry["files"]:
+            entry["files"].append(filename)
+            self.changed_sources.add(source)
+        key, _ = _schema_item(entry)
+        return key, is_new
+
+
+def _schema_item(entry):
+    for key, value in entry.items():
+        if key.lower().startswith("schema"):
+            return key, value
+    return None, None
+
+
+def _next_schema_key(entries):
+    numbers = []
+    for entry in entries:
+        key, _ = _schema_item(entry)
+        if key:
+            try:
+                numbers.append(int(key.split("-")[-1]))
+            except ValueError:
+                pass
+    return f"Schema-{max(numbers, default=0) + 1}"
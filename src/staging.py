@@ -1,8 +1,42 @@
 import json
+import argparse
+import numpy as np
 import pandas as pd
-from google.cloud import bigquery
-from google.cloud import storage
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import threading
+import queue
+import functools
+import hashlib
+import itertools
+import uuid
+from fingerprint_index import FingerprintIndex
+from audit_sink import AuditSink, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_SECONDS
+from manifest import IngestionManifest, NEW, CHANGED, UNCHANGED, APPENDED
+from schema_classifier import SchemaClassifier, read_footer_schemas, DEFAULT_FOOTER_WORKERS
+from staging_metrics import (
+    MetricsRecorder, new_run_id, build_file_metrics, load_run_metrics,
+    write_prometheus_textfile, print_metrics_summary,
+)
+from unified_schema import unified_table_name, build_unified_columns, unify_arrow_table, DEFAULT_MAX_MONTH_OFFSET
+from stream_journal import StreamJournal, COMMITTED
+from admission import AdmissionController, profile_files, wait_for_admission, read_parquet_metadata, DEFAULT_POLL_SECONDS
+from work_plan import WorkPlan, PlanEntry, PROCESS, SKIP, QUARANTINE
+from parquet_lake import LakeSink, LakeTeeSink
+from backends import (
+    GCP_BACKEND, LOCAL_BACKEND, GCSObjectStore, LocalObjectStore, BigQueryWarehouse, ParquetWarehouse, GenerationMismatch,
+    StagedParquetFile, SplitRoutingSink, QuarantineParquetSink, PickupMonthRoutingSink, loaded_bytes,
+)
+from load_poller import LoadJobPoller, DEFAULT_MAX_OUTSTANDING
+from raw_cache import RawFileCache, DEFAULT_RAW_CACHE_DIR, DEFAULT_RAW_CACHE_MB
+from work_leases import WorkLeases, lease_owner, DEFAULT_LEASE_TTL_SECONDS
+import atexit
+import multiprocessing.util
+import fsspec
 from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
 import time
 import os
 
@@ -11,15 +45,98 @@ PROJECTID = "taxi-bi-project"
 DATASET = "staging"
 BUCKET_NAME = "taxi-raw-bucket"
 RAW_PREFIX = "raw/"
-SCHEMAJSONFILES = [
-    "schemes/schemas_with_filenames_fhv.json",
-    "schemes/schemas_with_filenames_greentaxi.json",
-    "schemes/schemas_with_filenames_yellowtaxi.json"
-]
+# Schema-JSON-Datei je Quelle (auch Ziel für automatisch registrierte Schema-Versionen)
+SCHEMA_JSON_BY_SOURCE = {
+    "fhv": "schemes/schemas_with_filenames_fhv.json",
+    "green": "schemes/schemas_with_filenames_greentaxi.json",
+    "yellow": "schemes/schemas_with_filenames_yellowtaxi.json",
+}
+SCHEMAJSONFILES = list(SCHEMA_JSON_BY_SOURCE.values())
 LOGTABLE = "log_table_audit"
 
 PROCESSOR_NAME = "ed033" 
 
+# Lokaler Zustand (Write-Ahead-Dateien etc.)
+STATE_DIR = ".staging_state"
+AUDIT_WAL_DIR = os.path.join(STATE_DIR, "audit_wal")
+MANIFEST_PATH = os.path.join(STATE_DIR, "manifest.sqlite")
+METRICS_PATH = os.path.join(STATE_DIR, "metrics.jsonl")
+STREAM_JOURNAL_PATH = os.path.join(STATE_DIR, "write_streams.sqlite")
+
+# Lokales Backend (--backend local): Bucket-Inhalt (raw/..., schemes/...) unter <root>, Warehouse unter <root>/warehouse
+DEFAULT_LOCAL_ROOT = ".staging_local"
+LOCAL_WAREHOUSE_DIR = "warehouse"
+
+# Standard-Parallelität (1 = sequentielle Verarbeitung wie bisher)
+DEFAULT_WORKERS = 1
+
+# Streaming-Modus: Speicherbudget pro Datei und Schätzfaktor für dekodierte Daten
+DEFAULT_MEMORY_BUDGET_MB = 1024
+STREAM_MEMORY_FACTOR = 4
+STREAM_MIN_BATCH_ROWS = 10_000
+
+# Pipeline-Modus: maximale Anzahl Dateien gleichzeitig im Speicher
+DEFAULT_PIPELINE_DEPTH = 2
+
+# Batch-Load: gestagte Objekte unter staged/<run_id>/<tabelle>/, höchstens N Dateien pro Load Job
+STAGED_PREFIX = "staged/"
+DEFAULT_BATCH_LOAD_FILES = 50
+
+# Split-Routing: quarantänisierte Zeilen landen in <zieltabelle>_quarantine
+QUARANTINE_TABLE_SUFFIX = "_quarantine"
+
+# Pushdown: Dateien ab dieser Größe per URI ins Warehouse laden und dort per SQL flaggen
+DEFAULT_PUSHDOWN_MIN_MB = 128
+
+
+@dataclass
+class StagingOptions:
+    """Laufzeit-Optionen für processfile (werden aus den CLI-Argumenten befüllt)."""
+    # Objektspeicher/Warehouse: 'gcp' (GCS + BigQuery) oder 'local' (Verzeichnis + Parquet-Warehouse)
+    backend: str = GCP_BACKEND
+    local_root: str = DEFAULT_LOCAL_ROOT
+    stream: bool = False
+    memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB
+    arrow: bool = False
+    # Staging-Tabelle -> {Spalte: Arrow-Typ} aus schema/*.json (für explizite BigQuery-Schemata)
+    schema_registry: dict = field(default_factory=dict)
+    # Verzeichnis des dateiübergreifenden Fingerprint-Index (None = deaktiviert)
+    fingerprint_index_dir: str = None
+    bloom: bool = True
+    # Eine partitionierte Tabelle pro Quelle ({source}_staging) statt {source}_schema_N
+    unified_table: bool = False
+    # Gepufferter Audit-Writer
+    audit_wal_dir: str = AUDIT_WAL_DIR
+    audit_flush_rows: int = DEFAULT_FLUSH_ROWS
+    audit_flush_seconds: float = DEFAULT_FLUSH_SECONDS
+    # Strukturierte Metriken pro Datei (JSON-Lines, None = deaktiviert) und Lauf-Kennung
+    metrics_path: str = None
+    run_id: str = None
+    # Dateien pro Zieltabelle gesammelt in einem Load Job laden (None = ein Load Job pro Datei)
+    batch_load_files: int = None
+    # Über Pending Write Streams anhängen und zusammen mit der Audit-Zeile committen (exactly-once)
+    write_stream: bool = False
+    stream_journal_path: str = STREAM_JOURNAL_PATH
+    # Geflaggte Zeilen in eine Quarantäne-Tabelle (bzw. ein Parquet-Verzeichnis) statt in die Haupttabelle
+    split_quarantine: bool = False
+    quarantine_dir: str = None
+    # Dateien ab dieser Größe (MB) im Warehouse flaggen statt lokal (None = deaktiviert)
+    pushdown_min_mb: int = None
+    # Streaming in ganzen Row Groups mit Checkpoints im Manifest (Wiederaufnahme nach Abbruch)
+    checkpoint_row_groups: bool = False
+    manifest_path: str = MANIFEST_PATH
+    # Geflaggte Daten zusätzlich als Hive-partitionierten Parquet-Lake ablegen (None = deaktiviert)
+    lake_dir: str = None
+    # Zeilen nach tatsächlichem Pickup-Monat routen; weiter entfernte Monate in die NULL-Partition (None = aus)
+    max_month_offset: int = None
+    # Load Jobs nur einreichen; ein Poller verfolgt höchstens so viele gleichzeitig (None = synchron warten)
+    max_outstanding_loads: int = None
+    # Lokaler Cache roher Quelldateien (None = deaktiviert) und sein Speicherbudget
+    raw_cache_dir: str = None
+    raw_cache_mb: int = DEFAULT_RAW_CACHE_MB
+    # gcs_path -> Pfade inhaltsgleicher Kopien unter anderen Präfixen (werden nicht erneut geladen)
+    duplicate_sources: dict = field(default_factory=dict)
+
 # Die spezifischen GCS-Ordner, die verarbeitet werden sollen
 TARGET_GCS_PREFIXES = [
     "raw/FHV_Data_2015-2025_all/",
@@ -31,40 +148,55 @@ TARGET_GCS_PREFIXES = [
 print("START ETL - Lokale Ausführung (DUAL FLAGS IMPLEMENTIERT)")
 print(f"Schema-Dateien: {SCHEMAJSONFILES}")
 
-# Initialisierung der Clients
-try:
-    storage_client = storage.Client(project=PROJECTID)
-    bqclient = bigquery.Client(project=PROJECTID)
-    print("Google Cloud Clients erfolgreich initialisiert.")
-except Exception as e:
-    print(f"FEHLER bei der Initialisierung der Google Cloud Clients: {e}")
-    print("Stellen Sie sicher, dass die Google Cloud CLI installiert und 'gcloud auth application-default login' ausgeführt wurde.")
-    exit(1)
+# --- BACKENDS ---
+
+# Objektspeicher und Warehouse des Prozesses; die Google-Cloud-Clients entstehen erst beim ersten Zugriff
+_object_store = None
+_warehouse = None
+
+def configure_backends(options):
+    """Wählt Objektspeicher und Warehouse gemäß options.backend (auch in jedem Worker-Prozess)."""
+    global _object_store, _warehouse
+    if options.backend == LOCAL_BACKEND:
+        _object_store = LocalObjectStore(options.local_root)
+        _warehouse = ParquetWarehouse(os.path.join(options.local_root, LOCAL_WAREHOUSE_DIR), DATASET)
+    else:
+        _object_store = GCSObjectStore(BUCKET_NAME, PROJECTID)
+        _warehouse = BigQueryWarehouse(PROJECTID, DATASET)
+    print(f"INFO: Backend '{options.backend}' aktiv.")
+    return _object_store, _warehouse
+
+def get_object_store():
+    """Aktiver Objektspeicher (ohne configure_backends: GCS)."""
+    global _object_store
+    if _object_store is None:
+        _object_store = GCSObjectStore(BUCKET_NAME, PROJECTID)
+    return _object_store
+
+def get_warehouse():
+    """Aktives Warehouse (ohne configure_backends: BigQuery)."""
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = BigQueryWarehouse(PROJECTID, DATASET)
+    return _warehouse
 
 
 # --- AUDIT-TABELLEN-GARANTIE ---
 
+LOG_SCHEMA = [
+    ("table_name", "STRING"), ("file_name", "STRING"),
+    ("row_count", "INT64"), ("column_count", "INT64"),
+    ("duplicate_count", "INT64"), ("processed_at", "TIMESTAMP"),
+    ("opened_at", "TIMESTAMP"), ("processed_by", "STRING"),
+    ("status", "STRING"), ("additional_info", "STRING"),
+]
+
 def ensure_audit_tables_exist(client):
     """Stellt sicher, dass die log_table_audit Tabelle existiert."""
     print("\nINFO: Überprüfe/Erstelle kritische Audit-Tabelle log_table_audit...")
 
-    log_schema = [
-        bigquery.SchemaField("table_name", "STRING"), bigquery.SchemaField("file_name", "STRING"),
-        bigquery.SchemaField("row_count", "INT64"), bigquery.SchemaField("column_count", "INT64"),
-        bigquery.SchemaField("duplicate_count", "INT64"), bigquery.SchemaField("processed_at", "TIMESTAMP"),
-        bigquery.SchemaField("opened_at", "TIMESTAMP"), bigquery.SchemaField("processed_by", "STRING"),
-        bigquery.SchemaField("status", "STRING"), bigquery.SchemaField("additional_info", "STRING")
-    ]
-    
-    full_log_table = f"{PROJECTID}.{DATASET}.{LOGTABLE}"
-    try:
-        client.get_table(full_log_table)
-    except:
-        table = bigquery.Table(full_log_table, schema=log_schema)
-        client.create_table(table)
+    if client.ensure_table(LOGTABLE, LOG_SCHEMA):
         print(f"INFO: Tabelle {LOGTABLE} wurde neu erstellt.")
-        time.sleep(5) 
-        print("INFO: 5 Sekunden gewartet, um BigQuery-Status-Update zu ermöglichen.")
 
     print("INFO: Audit-Tabelle ist vorhanden.")
 
@@ -72,15 +204,8 @@ def ensure_audit_tables_exist(client):
 
 def get_processed_files(client):
     """Fragt die log_table_audit ab, um alle erfolgreich verarbeiteten Dateinamen zu erhalten."""
-    query = f"""
-    SELECT DISTINCT file_name
-    FROM `{PROJECTID}.{DATASET}.{LOGTABLE}`
-    WHERE status = 'success'
-    """
-    
     try:
-        query_job = client.query(query)
-        processed_files = {row.file_name for row in query_job}
+        processed_files = client.successful_files(LOGTABLE)
         print(f"INFO: {len(processed_files)} Dateien wurden laut Audit-Log als erfolgreich verarbeitet erkannt.")
         return processed_files
     except Exception as e:
@@ -90,19 +215,48 @@ def get_processed_files(client):
 
 # --- HILFSFUNKTIONEN  ---
 
-def loadschemamappingjsonfile(jsonfile):
-    """Lädt das Schema-Mapping aus einer JSON-Datei im GCS-Bucket und erstellt ein Dateiname->Schema-Mapping."""
-    print(f"INFO: Lade Mapping aus gs://{BUCKET_NAME}/{jsonfile}")
-    
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(jsonfile)
+def download_schema_json(jsonfile):
+    """Lädt eine Schema-JSON-Datei aus dem Objektspeicher (GCS-Bucket). Liefert eine leere Liste bei Fehlern."""
+    store = get_object_store()
+    print(f"INFO: Lade Mapping aus {store.uri(jsonfile)}")
     
     try:
-        json_bytes = blob.download_as_bytes()
-        schemas = json.loads(json_bytes.decode('utf-8'))
+        json_bytes = store.read_bytes(jsonfile)
+        return json.loads(json_bytes.decode('utf-8'))
     except Exception as e:
         print(f"FEHLER: Konnte JSON-Schema-Datei {jsonfile} nicht laden. {e}")
-        return {}
+        return []
+
+def upload_schema_json(jsonfile, source_prefix, classified):
+    """Trägt per Footer klassifizierte Dateien ([(Dateiname, {Spalte: Arrow-Typ})]) in die Schema-JSON-Datei ein.
+
+    Mehrere Staging-Prozesse (auch auf verschiedenen Hosts) schreiben dieselbe Datei. Deshalb wird die
+    Klassifikation auf den aktuellen Stand angewendet, neue Versionen werden dort als Schema-<n+1>
+    nummeriert, und geschrieben wird nur, wenn sich die Generation seit dem Lesen nicht geändert hat;
+    sonst von vorn. Liefert die geschriebenen (bzw. bereits vollständigen) Schema-Einträge.
+    """
+    store = get_object_store()
+    while True:
+        content, generation = store.read_versioned(jsonfile)
+        schemas = json.loads(content.decode('utf-8')) if content else []
+        classifier = SchemaClassifier({source_prefix: schemas})
+        for filename, column_types in classified:
+            classifier.classify(source_prefix, filename, column_types)
+        if not classifier.changed_sources:
+            return schemas
+        try:
+            store.write_if_generation(jsonfile, json.dumps(schemas, indent=4), generation, content_type="application/json")
+        except GenerationMismatch:
+            # Ein anderer Prozess hat zwischen Lesen und Schreiben Einträge ergänzt
+            print(f"INFO: {store.uri(jsonfile)} wurde parallel geändert; Schema-Einträge werden neu abgeglichen.")
+            continue
+        print(f"INFO: Schema-Datei {store.uri(jsonfile)} aktualisiert.")
+        return schemas
+
+def loadschemamappingjsonfile(jsonfile, schemas=None):
+    """Lädt das Schema-Mapping aus einer JSON-Datei im GCS-Bucket und erstellt ein Dateiname->Schema-Mapping."""
+    if schemas is None:
+        schemas = download_schema_json(jsonfile)
 
     mapping = {}
     for schemaentry in schemas:
@@ -114,43 +268,245 @@ def loadschemamappingjsonfile(jsonfile):
     print(f"DEBUG: Geladenes Mapping aus {jsonfile} hat {len(mapping)} Einträge.")
     return mapping
 
-def list_gcs_parquet_files(bucket_name, prefix):
-    """Listet alle Parquet-Dateien in einem GCS-Bucket-Ordnerbaum rekursiv auf."""
-    print(f"INFO: Suche Parquet-Dateien in gs://{bucket_name}/{prefix}...")
-    bucket = storage_client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=prefix)
-    return [blob.name for blob in blobs if blob.name.endswith('.parquet')]
+def staging_table_name(source_prefix, schemacategory):
+    """Baut den Namen der Staging-Tabelle, z.B. ('fhv', 'Schema-2') -> 'fhv_schema_2'."""
+    return f"{source_prefix}_{schemacategory.replace('-', '_').lower()}"
 
+def build_schema_registry(schemas):
+    """Erstellt aus den Schema-Einträgen ein Staging-Tabelle->{Spalte: Arrow-Typ}-Registry."""
+    registry = {}
+    for schemaentry in schemas:
+        files = schemaentry.get("files", [])
+        if not files:
+            continue
+        source_prefix = files[0].split("/")[-1].split("_")[0]
+        for key, column_types in schemaentry.items():
+            if key.lower().startswith("schema"):
+                registry[staging_table_name(source_prefix, key)] = column_types
+    return registry
 
-def insert_log_job(client, row):
-    """Fügt eine Log-Zeile als Load Job (Batch-Insert) ein."""
-    df_log = pd.DataFrame([row])
+def list_parquet_files(prefix):
+    """Listet alle Parquet-Dateien in einem Ordnerbaum des Objektspeichers rekursiv auf."""
+    return [obj["name"] for obj in list_parquet_objects(prefix)]
+
+def list_parquet_objects(prefix):
+    """Wie list_parquet_files, liefert aber zusätzlich Generation, Größe und CRC32C jeder Datei."""
+    store = get_object_store()
+    print(f"INFO: Suche Parquet-Dateien in {store.uri(prefix)}...")
+    return store.list_objects(prefix)
+
+def list_target_objects(prefixes, workers=DEFAULT_FOOTER_WORKERS):
+    """Listet mehrere Ordner parallel (ein Listing pro Präfix) und liefert alle Objekte in Präfix-Reihenfolge."""
+    store = get_object_store()
+    if isinstance(store, GCSObjectStore):
+        store.client  # Client einmal vor den Threads erstellen statt in jedem Thread
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prefixes)))) as executor:
+        return [obj for objects in executor.map(list_parquet_objects, prefixes) for obj in objects]
+
+
+def dedupe_objects(objects):
+    """Fasst inhaltsgleiche Objekte derselben Quelle zusammen (z.B. dieselbe Datei unter zwei Präfixen).
+
+    Inhaltsgleich sind Objekte mit gleicher Größe und CRC32C. Prüfsummen fehlen nur im lokalen
+    Backend; sie werden dann nur für Dateien gleicher Größe berechnet. Behalten wird die erste
+    Kopie in Listing-Reihenfolge (d.h. nach TARGET_GCS_PREFIXES). Liefert (eindeutige Objekte,
+    behaltener gcs_path -> [Pfade der übrigen Kopien]).
+    """
+    by_size = {}
+    for obj in objects:
+        source_prefix = obj["name"].split("/")[-1].split("_")[0]
+        by_size.setdefault((source_prefix, obj.get("size")), []).append(obj)
+
+    store = get_object_store()
+    duplicates = {}
+    dropped = set()
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        kept_by_checksum = {}
+        for obj in candidates:
+            checksum = obj.get("crc32c") or store.checksum(obj["name"])
+            kept = kept_by_checksum.setdefault(checksum, obj)
+            if kept is not obj:
+                duplicates.setdefault(kept["name"], []).append(obj["name"])
+                dropped.add(obj["name"])
+                print(f"INFO: {obj['name']} ist inhaltsgleich mit {kept['name']} und wird nicht erneut verarbeitet.")
+    if dropped:
+        print(f"INFO: {len(dropped)} inhaltsgleiche Kopien zusammengefasst.")
+    return [obj for obj in objects if obj["name"] not in dropped], duplicates
+
+
+def write_log_rows(client, rows):
+    """Schreibt mehrere Log-Zeilen in einem einzigen Load Job (Batch-Insert) in das Warehouse client."""
+    df_log = pd.DataFrame(rows)
     
     df_log["processed_at"] = pd.to_datetime(df_log["processed_at"]).dt.tz_localize(None) 
     df_log["opened_at"] = pd.to_datetime(df_log["opened_at"]).dt.tz_localize(None)
 
-    job_config = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND
-    )
-    
-    full_log_table = f"{PROJECTID}.{DATASET}.{LOGTABLE}"
-    
-    job = client.load_table_from_dataframe(
-        df_log,
-        full_log_table,
-        job_config=job_config
+    client.append_rows(LOGTABLE, df_log)
+
+
+_audit_sink = None
+
+def insert_log_job(client, row):
+    """Fügt eine Log-Zeile ein: gepuffert über den AuditSink, falls aktiv, sonst direkt als Load Job."""
+    if _audit_sink is not None:
+        _audit_sink.append(row)
+    else:
+        write_log_rows(client, [row])
+
+
+def start_audit_sink(client, options):
+    """Aktiviert den gepufferten Audit-Writer mit prozesseigener Write-Ahead-Datei."""
+    global _audit_sink
+    wal_path = os.path.join(options.audit_wal_dir, f"audit-{os.getpid()}.jsonl")
+    _audit_sink = AuditSink(
+        lambda rows: write_log_rows(client, rows),
+        wal_path,
+        flush_rows=options.audit_flush_rows,
+        flush_seconds=options.audit_flush_seconds,
+        flush_in_background=options.max_outstanding_loads is not None,
     )
-    job.result()
+    return _audit_sink
 
 
-def processfile(bqclient, mapping, filename, gcs_path):
-    """Verarbeitet eine einzelne Parquet-Datei: Lädt, prüft Duplikate, setzt DUPLICATE_FLAG und MISSING_FLAG, lädt in BigQuery, loggt."""
-    print(f"\n--- Starte Verarbeitung der Datei: {gcs_path} ---")
-    
-    current_time_utc = datetime.now(timezone.utc)
-    start_time = time.time()
+_stream_journal = None
+
+def start_stream_journal(options):
+    """Öffnet das Journal für Write-Stream-Commits (nur im Write-Stream-Modus)."""
+    global _stream_journal
+    if options.write_stream:
+        _stream_journal = StreamJournal(options.stream_journal_path)
+    return _stream_journal
+
+
+def commit_write_stream(warehouse, table_name, gcs_path, sink, log_row):
+    """Exactly-once-Commit: Stream-Commit und Audit-Zeile werden über das Journal verbunden.
+
+    Reihenfolge: Audit-Zeile im Journal vormerken -> Stream committen -> Audit-Zeile schreiben ->
+    Journal-Eintrag entfernen. Ein Absturz dazwischen wird von recover_write_streams aufgelöst.
+    """
+    if sink.stream_name is None:
+        # Keine Zeilen angehängt -> nichts zu committen
+        insert_log_job(warehouse, log_row)
+        return
+    _stream_journal.prepare(sink.stream_name, table_name, gcs_path, sink.row_count, log_row)
+    warehouse.commit_write_streams(table_name, [sink.stream_name])
+    _stream_journal.mark_committed(sink.stream_name)
+    insert_log_job(warehouse, log_row)
+    _stream_journal.remove(sink.stream_name)
+
+
+def recover_write_streams(warehouse, path=STREAM_JOURNAL_PATH):
+    """Löst Journal-Einträge abgestürzter Läufe auf.
+
+    Committete Streams bekommen ihre Audit-Zeile nachgetragen; finalisierte, aber nicht committete
+    Streams werden committet. Unbekannte oder abgelaufene Streams werden verworfen, die Datei wird
+    dann mangels Erfolgszeile erneut verarbeitet. Liefert die nachgetragenen Einträge.
+    """
+    if not os.path.exists(path):
+        return []
+    journal = StreamJournal(path)
+    recovered = []
+    for entry in journal.entries():
+        stream_name, table_name = entry["stream_name"], entry["table_name"]
+        try:
+            state = COMMITTED if entry["state"] == COMMITTED else warehouse.write_stream_state(table_name, stream_name)
+            if state == "finalized":
+                warehouse.commit_write_streams(table_name, [stream_name])
+                state = COMMITTED
+        except Exception as e:
+            print(f"WARNUNG: Write Stream {stream_name} konnte nicht geprüft werden (bleibt im Journal): {e}")
+            continue
+        if state in (COMMITTED, "committed"):
+            log_row = entry["audit_row"]
+            log_row["additional_info"] += f" | Recovered commit of write stream {stream_name}"
+            insert_log_job(warehouse, log_row)
+            recovered.append(entry)
+            print(f"INFO: Audit-Zeile für {entry['gcs_path']} aus committetem Write Stream nachgetragen.")
+        else:
+            print(f"WARNUNG: Write Stream {stream_name} für {entry['gcs_path']} nicht committet ({state}); Datei wird erneut verarbeitet.")
+        journal.remove(stream_name)
+    journal.close()
+    return recovered
+
+
+_load_poller = None
+
+def start_load_poller(options):
+    """Startet den zentralen Poller für asynchron eingereichte Load Jobs (nur mit --async-loads)."""
+    global _load_poller
+    if options.max_outstanding_loads is not None:
+        _load_poller = LoadJobPoller(options.max_outstanding_loads)
+    return _load_poller
+
+
+_raw_cache = None
+
+def start_raw_cache(options):
+    """Öffnet den Raw-File-Cache (nur mit --raw-cache, auch in Worker-Prozessen)."""
+    global _raw_cache
+    if options.raw_cache_dir:
+        _raw_cache = RawFileCache(options.raw_cache_dir, options.raw_cache_mb, options.run_id)
+        # Ein verkleinertes Budget gilt sofort, nicht erst beim nächsten Download
+        _raw_cache.evict()
+    return _raw_cache
+
+
+_work_leases = None
+
+def start_work_leases(ttl_seconds, objects, run_id, on_done_elsewhere=None):
+    """Startet die Lease-basierte Arbeitsverteilung mit anderen Staging-Prozessen (nur mit --claim-leases).
 
-    log_row = {
+    Leases werden nur im Hauptprozess beansprucht und verlängert; Worker-Prozesse sehen sie nicht.
+    """
+    global _work_leases
+    generations = {obj["name"]: obj["generation"] for obj in objects}
+    _work_leases = WorkLeases(get_object_store(), lease_owner(PROCESSOR_NAME, run_id), ttl_seconds, generations,
+                              on_done_elsewhere)
+    print(f"INFO: Work-Leases aktiv ({_work_leases.owner}, TTL {ttl_seconds}s).")
+    return _work_leases
+
+
+def claim_work_item(filename, gcs_path):
+    """True, wenn dieser Prozess die Datei verarbeiten darf (ohne --claim-leases immer)."""
+    return _work_leases is None or _work_leases.claim(filename, gcs_path)
+
+
+_fingerprint_index = None
+
+def start_fingerprint_index(options):
+    """Öffnet den Fingerprint-Index des Prozesses (nur mit --fingerprint-index); alle Dateien teilen ihn."""
+    global _fingerprint_index
+    if options.fingerprint_index_dir:
+        _fingerprint_index = FingerprintIndex(options.fingerprint_index_dir, use_bloom=options.bloom)
+    return _fingerprint_index
+
+
+_checkpoint_manifest = None
+
+def start_checkpoints(options):
+    """Öffnet das Manifest für Row-Group-Checkpoints (nur mit --checkpoint-row-groups, auch in Worker-Prozessen)."""
+    global _checkpoint_manifest
+    if options.checkpoint_row_groups:
+        _checkpoint_manifest = IngestionManifest(options.manifest_path)
+    return _checkpoint_manifest
+
+
+_metrics_recorder = None
+
+def start_metrics_recorder(options):
+    """Aktiviert die strukturierten Metriken pro Datei (alle Prozesse schreiben in dieselbe JSON-Lines-Datei)."""
+    global _metrics_recorder
+    if options.metrics_path:
+        _metrics_recorder = MetricsRecorder(options.metrics_path, options.run_id)
+    return _metrics_recorder
+
+
+def new_log_row(filename):
+    """Erstellt eine leere Log-Zeile für eine Datei mit Status 'running'."""
+    current_time_utc = datetime.now(timezone.utc)
+    return {
         "table_name": None,
         "file_name": filename,
         "row_count": None,
@@ -162,200 +518,1745 @@ def processfile(bqclient, mapping, filename, gcs_path):
         "status": "running",
         "additional_info": "" # Initialisierung für Warnungen/Fehler
     }
+
+
+# --- FLAG-LOGIK ---
+
+def get_critical_null_cols(filename):
+    """Bestimmt Quell-Präfix und kritische Spalten für den Null-Check anhand des Dateinamens."""
+    if filename.startswith('fhv_'):
+        return 'fhv', ['PULocationID', 'DOLocationID', 'Affiliated_base_number', 'SR_Flag', 'dispatching_base_num', 'pickup_datetime', 'dropOff_datetime']
+    elif filename.startswith('green_'):
+        return 'green', ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'VendorID']
+    elif filename.startswith('yellow_'):
+        return 'yellow', ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'VendorID']
+    raise ValueError(f"Unbekanntes Quelldateiformat für {filename}")
+
+
+# Pickup-Spalte je Quelle (Partitionierung des Fingerprint-Index nach Pickup-Monat)
+PICKUP_COLUMNS = {
+    'fhv': 'pickup_datetime',
+    'green': 'lpep_pickup_datetime',
+    'yellow': 'tpep_pickup_datetime',
+}
+
+
+def row_hashes(df):
+    """64-Bit-Hash pro Zeile über alle Spalten (stabil über Prozesse und Läufe hinweg)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+class FileFingerprints:
+    """Bindet den FingerprintIndex an eine Datei: Lookup gegen frühere Dateien, Vormerken der eigenen Zeilen."""
+
+    def __init__(self, index, source_prefix, filename):
+        self.index = index
+        self.source_prefix = source_prefix
+        self.filename = filename
+        self.pickup_col = PICKUP_COLUMNS.get(source_prefix)
+
+    def pickup_months(self, df):
+        """Liefert den Pickup-Monat ('YYYY-MM') pro Zeile, 'unknown' falls nicht bestimmbar."""
+        if self.pickup_col not in df.columns:
+            return np.full(len(df), "unknown")
+        pickup = pd.to_datetime(df[self.pickup_col], errors="coerce").to_numpy(dtype="datetime64[ns]")
+        months = pickup.astype("datetime64[M]").astype(str)
+        months[np.isnat(pickup)] = "unknown"
+        return months
+
+    def mark_seen(self, df, hashes):
+        """Bool-Maske der Zeilen, die bereits in einer früheren oder gleichzeitig laufenden Datei vorkamen."""
+        return self.index.mark_seen(self.source_prefix, self.pickup_months(df), hashes, self.filename)
+
+    def commit(self):
+        self.index.commit(self.filename)
+
+    def discard(self):
+        self.index.discard(self.filename)
+
+
+def merge_crossfile_duplicates(fingerprints, df, hashes, is_duplicated, stats):
+    """Ergänzt die dateiinterne Duplikatmaske um Zeilen, die schon in früheren Dateien vorkamen."""
+    if fingerprints is None:
+        return is_duplicated
+    seen = fingerprints.mark_seen(df, hashes)
+    stats["crossfile_duplicate_count"] += int((seen & ~np.asarray(is_duplicated)).sum())
+    return is_duplicated | seen
+
+
+def compute_missing_mask(df, existing_critical_cols):
+    """Markiert Zeilen, in denen mindestens eine kritische Spalte NULL oder ein leerer String ist."""
+    # Startmaske: Echte Pandas-Nullwerte
+    missing_mask = df[existing_critical_cols].isnull().any(axis=1)
     
-    tablename = None
-    schemacategory = mapping.get(filename) 
-    
-    # 1. PRÜFUNG: Schema-Mapping
-    if not schemacategory:
-        log_row["status"] = "quarantine"
-        log_row["additional_info"] = "CRITICAL: No schema mapping found for file. File completely quarantined."
-        
+    # Überprüfung auf leere Strings (häufig bei Parquet/String-Spalten)
+    for col in existing_critical_cols:
+        if df[col].dtype == 'object':
+            try:
+                is_empty_string = (df[col] == '')
+                missing_mask = missing_mask | is_empty_string
+            except TypeError:
+                print(f"WARNUNG: Spalte {col} hat gemischte Typen, Prüfung auf leeren String ('') übersprungen.")
+    return missing_mask
+
+
+def flag_dataframe(df, existing_critical_cols, is_duplicated, stats):
+    """Setzt duplicate_flag und missing_flag auf dem DataFrame und zählt die Treffer in stats."""
+    if existing_critical_cols:
+        missing_mask = compute_missing_mask(df, existing_critical_cols)
+    else:
+        missing_mask = pd.Series([False] * len(df), index=df.index)
+
+    df['duplicate_flag'] = is_duplicated.map({True: 'Y', False: 'N'})
+    df['missing_flag'] = missing_mask.map({True: 'Y', False: 'N'})
+
+    stats["duplicate_count"] += int(is_duplicated.sum())
+    stats["missing_count"] += int(missing_mask.sum())
+    # Gesamtanzahl der fehlerhaften Zeilen (entweder Missing ODER Duplicate) für das Logging
+    stats["quarantined_count"] += int((is_duplicated | missing_mask).sum())
+
+
+def new_stats():
+    """Erstellt die Zähler und Zeitmessungen für eine Datei."""
+    return {
+        "row_count": 0,
+        "column_count": 0,
+        "duplicate_count": 0,
+        "missing_count": 0,
+        "quarantined_count": 0,
+        "crossfile_duplicate_count": 0,
+        "critical_cols": [],
+        "load_duration": 0.0,
+        "check_duration": 0.0,
+        "bq_load_duration": 0.0,
+        "bytes_read": 0,
+        "bytes_uploaded": 0,
+    }
+
+
+def build_result_info(stats, start_time):
+    """Baut den Timing- und Quarantäne-Teil von additional_info für eine erfolgreiche Verarbeitung."""
+    # Aufbau der Timing-Metriken
+    timing_info = (
+        f"Total ETL Time: {time.time() - start_time:.2f}s | "
+        f"Parquet Load Time: {stats['load_duration']:.2f}s | "
+        f"Validation Time: {stats['check_duration']:.2f}s | "
+        f"BQ Load Time: {stats['bq_load_duration']:.2f}s"
+    )
+
+    quarantine_reasons = []
+    if stats["crossfile_duplicate_count"] > 0:
+        quarantine_reasons.append(f"Cross-file Duplicates: {stats['crossfile_duplicate_count']}")
+    if stats["missing_count"] > 0:
+        quarantine_reasons.append(f"Missing Critical Data ({'/'.join(stats['critical_cols'])}): {stats['missing_count']}")
+
+    # Aufbau der Quarantäne-Metriken
+    total_quarantined = stats["quarantined_count"]
+    row_count = stats["row_count"]
+    quarantine_rate = (total_quarantined / row_count) * 100 if row_count > 0 else 0
+    if total_quarantined > 0:
+        reason_info = f"Duplicates: {stats['duplicate_count']} | " + " | ".join(quarantine_reasons)
+        quarantine_info = f"Quarantine: {total_quarantined} unique rows flagged ({quarantine_rate:.2f}%). Reasons: {reason_info}"
+    else:
+        quarantine_info = "Quarantine: No issues found."
+
+    return f"{timing_info} | {quarantine_info}"
+
+
+# --- STAGING-PFADE ---
+
+def read_in_memory(gcs_uri, critical_cols, stats):
+    """Lädt die komplette Datei in einen DataFrame."""
+    # 2. PARQUET LADEN
+    start_load = time.time()
+    with fsspec.open(gcs_uri, "rb") as f:
+        stats["bytes_read"] = f.size
+        df = pd.read_parquet(f)
+    stats["load_duration"] = time.time() - start_load
+
+    stats["row_count"] = len(df)
+    stats["column_count"] = len(df.columns)
+    print(f"INFO: Parquet-Laden abgeschlossen. Dauer: {stats['load_duration']:.2f}s. Rows: {len(df)}.")
+
+    # Finde kritische Spalten, die tatsächlich im DataFrame existieren
+    stats["critical_cols"] = [col for col in critical_cols if col in df.columns]
+    return df
+
+
+def flag_in_memory(df, stats, fingerprints=None):
+    """Setzt duplicate_flag und missing_flag auf dem kompletten DataFrame."""
+    # 3. DUAL FLAG LOGIK (Exakte Zeilenduplikate + fehlende kritische Werte)
+    start_check = time.time()
+    is_duplicated = df.duplicated()
+    if fingerprints is not None:
+        is_duplicated = merge_crossfile_duplicates(fingerprints, df, row_hashes(df), is_duplicated, stats)
+    flag_dataframe(df, stats["critical_cols"], is_duplicated, stats)
+    stats["check_duration"] = time.time() - start_check
+    return df
+
+
+def upload_data(data, sink, stats):
+    """Schreibt einen geflaggten DataFrame bzw. eine Arrow-Tabelle in den Sink."""
+    # 4. HAUPT-LADEN IN BIGQUERY (Staging Layer)
+    start_bq_load = time.time()
+    if isinstance(data, pa.Table):
+        stats["bytes_uploaded"] += sink.write_arrow(data)
+    else:
+        stats["bytes_uploaded"] += sink.write_dataframe(data)
+    stats["bq_load_duration"] = time.time() - start_bq_load
+    print(f"INFO: BigQuery Lade-Job abgeschlossen. Dauer: {stats['bq_load_duration']:.2f}s.")
+
+
+class RowHashSet:
+    """Menge von 64-Bit-Zeilen-Hashes als sortiertes numpy-Array (8 Byte pro eindeutiger Zeile).
+
+    Erkennt exakte Duplikate über Batch-Grenzen hinweg, ohne die Zeilen selbst im Speicher zu halten.
+    Die Kollisionswahrscheinlichkeit liegt bei ~n²/2^65 (für 100 Mio. Zeilen < 0.03%).
+    """
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def check_and_add(self, hashes):
+        """Liefert eine Bool-Maske der Duplikate (wie df.duplicated(keep='first')) und merkt sich alle Hashes."""
+        is_duplicated = np.ones(len(hashes), dtype=bool)
+        # Erstes Vorkommen innerhalb des Batches ist kein Duplikat ...
+        unique_hashes, first_idx = np.unique(hashes, return_index=True)
+        is_duplicated[first_idx] = False
+
+        # ... außer der Hash wurde bereits in einem früheren Batch gesehen
+        if len(self._hashes):
+            pos = np.searchsorted(self._hashes, hashes)
+            pos_clipped = np.minimum(pos, len(self._hashes) - 1)
+            seen_before = self._hashes[pos_clipped] == hashes
+            is_duplicated |= seen_before
+            unique_hashes = unique_hashes[~np.isin(unique_hashes, self._hashes, assume_unique=True)]
+
+        self._hashes = np.sort(np.concatenate([self._hashes, unique_hashes]))
+        return is_duplicated
+
+
+def estimate_batch_rows(parquet_file, memory_budget_mb):
+    """Schätzt aus den Parquet-Metadaten, wie viele Zeilen pro Batch in das Speicherbudget passen."""
+    metadata = parquet_file.metadata
+    if metadata.num_rows == 0:
+        return STREAM_MIN_BATCH_ROWS
+    uncompressed = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+    # Dekodierte Arrow-Daten + pandas-Kopie + Flags/Upload-Serialisierung
+    bytes_per_row = max(1, uncompressed / metadata.num_rows) * STREAM_MEMORY_FACTOR
+    batch_rows = int(memory_budget_mb * 1024 * 1024 / bytes_per_row)
+    return max(STREAM_MIN_BATCH_ROWS, batch_rows)
+
+
+def stage_streaming(gcs_uri, sink, critical_cols, stats, memory_budget_mb, fingerprints=None):
+    """Liest die Datei Row-Group-weise, setzt die Flags pro Batch und schreibt jeden Batch einzeln in den Sink.
+
+    Der Spitzenverbrauch wird durch memory_budget_mb begrenzt; nur die Zeilen-Hashes für die
+    dateiweite Duplikaterkennung wachsen mit der Dateigröße.
+    """
+    seen_rows = RowHashSet()
+
+    with fsspec.open(gcs_uri, "rb") as f:
+        stats["bytes_read"] = f.size
+        parquet_file = pq.ParquetFile(f)
+        batch_rows = estimate_batch_rows(parquet_file, memory_budget_mb)
+        column_names = parquet_file.schema_arrow.names
+        stats["column_count"] = len(column_names)
+        stats["critical_cols"] = [col for col in critical_cols if col in column_names]
+        print(f"INFO: Streaming-Modus: {parquet_file.metadata.num_row_groups} Row Groups, "
+              f"{parquet_file.metadata.num_rows} Rows, Batch-Größe {batch_rows} Rows "
+              f"(Budget {memory_budget_mb} MB).")
+
+        start_load = time.time()
+        for batch_number, batch in enumerate(parquet_file.iter_batches(batch_size=batch_rows), start=1):
+            df = batch.to_pandas()
+            del batch
+            stats["load_duration"] += time.time() - start_load
+            stats["row_count"] += len(df)
+
+            # 3. DUAL FLAG LOGIK pro Batch, Duplikate über alle bisherigen Batches hinweg
+            start_check = time.time()
+            hashes = row_hashes(df)
+            is_duplicated = pd.Series(seen_rows.check_and_add(hashes), index=df.index)
+            is_duplicated = merge_crossfile_duplicates(fingerprints, df, hashes, is_duplicated, stats)
+            flag_dataframe(df, stats["critical_cols"], is_duplicated, stats)
+            stats["check_duration"] += time.time() - start_check
+
+            # 4. INKREMENTELLES LADEN IN BIGQUERY (WRITE_APPEND)
+            start_bq_load = time.time()
+            stats["bytes_uploaded"] += sink.write_dataframe(df)
+            stats["bq_load_duration"] += time.time() - start_bq_load
+            print(f"INFO: Batch {batch_number} geladen ({len(df)} Rows, gesamt {stats['row_count']}).")
+
+            del df
+            start_load = time.time()
+
+
+# --- ROW-GROUP-CHECKPOINTS ---
+
+# Zähler, die pro Row-Group-Bereich im Manifest gespeichert und bei der Wiederaufnahme übernommen werden
+CHECKPOINT_COUNTERS = ["row_count", "duplicate_count", "missing_count", "quarantined_count", "bytes_uploaded"]
+
+
+def checkpoint_append_id(gcs_path, generation, tablename, first_row_group, last_row_group, attempt):
+    """Kennung eines Row-Group-Bereichs (Präfix der BigQuery-Job-ID bzw. Dateiname im lokalen Warehouse).
+
+    attempt ist je Verarbeitungsversuch neu: BigQuery behält Job-IDs in der Historie, ein späteres
+    erneutes Laden derselben Generation würde sonst den alten Job übernehmen statt anzuhängen.
+    Nur ein noch offener Checkpoint wird mit seiner gespeicherten append_id wiederholt.
+    """
+    digest = hashlib.sha1(f"{gcs_path}|{generation}|{tablename}".encode("utf-8")).hexdigest()[:16]
+    return f"staging_{digest}_{attempt}_rg{first_row_group}-{last_row_group}"
+
+
+def row_group_ranges(metadata, start, batch_rows):
+    """Teilt die Row Groups ab start in Bereiche (erste, letzte) mit höchstens batch_rows Zeilen (mindestens eine Row Group)."""
+    first, rows = start, 0
+    for rg in range(start, metadata.num_row_groups):
+        rg_rows = metadata.row_group(rg).num_rows
+        if rg > first and rows + rg_rows > batch_rows:
+            yield first, rg - 1
+            first, rows = rg, 0
+        rows += rg_rows
+    if first < metadata.num_row_groups:
+        yield first, metadata.num_row_groups - 1
+
+
+def stage_checkpointed(gcs_uri, gcs_path, tablename, sink, critical_cols, stats, memory_budget_mb, checkpoints, lake_sink=None):
+    """Wie stage_streaming, aber in ganzen Row Groups mit Checkpoints im Manifest (--checkpoint-row-groups).
+
+    Jeder Bereich wird vor dem Anhängen vorgemerkt und danach mit Zählern und Zeilen-Hashes als
+    angehängt markiert. Ein erneuter Lauf übernimmt die angehängten Bereiche (Zähler und Hashes für
+    die Duplikaterkennung) und setzt beim ersten unfertigen Bereich fort. Ein nur vorgemerkter Bereich
+    wird mit denselben Grenzen und seiner gespeicherten append_id wiederholt und landet so höchstens einmal
+    in der Tabelle; neue Bereiche bekommen eine append_id mit einer Kennung dieses Versuchs. Zum Schluss müssen die Zeilen aller angehängten Bereiche der Zeilenzahl der Datei entsprechen.
+    Mit lake_sink bleiben beim Fortsetzen die Lake-Dateien der übernommenen Bereiche stehen.
+    Liefert die erste in diesem Lauf verarbeitete Row Group (0 = kein Checkpoint übernommen).
+    """
+    generation = get_object_store().stat(gcs_path)["generation"]
+    attempt = uuid.uuid4().hex[:12]
+    seen_rows = RowHashSet()
+    start = 0
+    pending = None
+    adopted = []
+    for checkpoint in checkpoints.checkpoints(gcs_path, generation):
+        if checkpoint["first_row_group"] != start:
+            break
+        if checkpoint["status"] != APPENDED:
+            pending = checkpoint
+            break
+        for key in CHECKPOINT_COUNTERS:
+            stats[key] += checkpoint[key]
+        seen_rows.check_and_add(np.frombuffer(checkpoint["row_hashes"], dtype=np.uint64))
+        adopted.append(checkpoint["append_id"])
+        start = checkpoint["last_row_group"] + 1
+    if lake_sink is not None:
+        lake_sink.clear(keep=adopted if start or pending is not None else None)
+
+    with fsspec.open(gcs_uri, "rb") as f:
+        stats["bytes_read"] = f.size
+        parquet_file = pq.ParquetFile(f)
+        metadata = parquet_file.metadata
+        batch_rows = estimate_batch_rows(parquet_file, memory_budget_mb)
+        column_names = parquet_file.schema_arrow.names
+        stats["column_count"] = len(column_names)
+        stats["critical_cols"] = [col for col in critical_cols if col in column_names]
+        if start:
+            print(f"INFO: Setze {gcs_path} bei Row Group {start}/{metadata.num_row_groups} fort "
+                  f"({stats['row_count']} Rows aus Checkpoints übernommen).")
+
+        ranges = row_group_ranges(metadata, start, batch_rows)
+        if pending is not None:
+            # Vorgemerkter Bereich eines abgebrochenen Laufs: mit denselben Grenzen wiederholen
+            ranges = itertools.chain([(pending["first_row_group"], pending["last_row_group"])],
+                                     row_group_ranges(metadata, pending["last_row_group"] + 1, batch_rows))
+        for first, last in ranges:
+            start_load = time.time()
+            df = parquet_file.read_row_groups(range(first, last + 1)).to_pandas()
+            stats["load_duration"] += time.time() - start_load
+
+            start_check = time.time()
+            before = {key: stats[key] for key in CHECKPOINT_COUNTERS}
+            stats["row_count"] += len(df)
+            hashes = row_hashes(df)
+            is_duplicated = pd.Series(seen_rows.check_and_add(hashes), index=df.index)
+            flag_dataframe(df, stats["critical_cols"], is_duplicated, stats)
+            stats["check_duration"] += time.time() - start_check
+
+            if pending is not None and first == pending["first_row_group"]:
+                append_id = pending["append_id"]
+            else:
+                append_id = checkpoint_append_id(gcs_path, generation, tablename, first, last, attempt)
+            checkpoints.begin_row_groups(gcs_path, generation, first, last, append_id)
+            start_bq_load = time.time()
+            stats["bytes_uploaded"] += sink.write_dataframe(df, append_id=append_id)
+            stats["bq_load_duration"] += time.time() - start_bq_load
+            counts = {key: stats[key] - before[key] for key in CHECKPOINT_COUNTERS}
+            checkpoints.complete_row_groups(gcs_path, first, counts, hashes.astype(np.uint64).tobytes())
+            print(f"INFO: Row Groups {first}-{last} geladen ({len(df)} Rows, gesamt {stats['row_count']}).")
+            del df
+
+    # Abgleich vor dem Erfolg: lückenlose Bereiche über alle Row Groups und Zeilenzahl der Datei
+    appended = [c for c in checkpoints.checkpoints(gcs_path, generation) if c["status"] == APPENDED]
+    contiguous = all(a["last_row_group"] + 1 == b["first_row_group"] for a, b in zip(appended, appended[1:]))
+    covered = (bool(appended) and appended[0]["first_row_group"] == 0
+               and appended[-1]["last_row_group"] == metadata.num_row_groups - 1 and contiguous)
+    checkpointed_rows = sum(c["row_count"] for c in appended)
+    if metadata.num_row_groups and (not covered or checkpointed_rows != metadata.num_rows or stats["row_count"] != metadata.num_rows):
+        raise RuntimeError(f"Zeilenabgleich fehlgeschlagen: Datei {metadata.num_rows} Rows, Checkpoints {checkpointed_rows} Rows, "
+                           f"Lauf {stats['row_count']} Rows (Row Groups lückenlos: {covered}).")
+    return start
+
+
+# --- ARROW-NATIVER PFAD ---
+
+def arrow_duplicate_mask(table):
+    """Markiert exakte Zeilenduplikate (wie df.duplicated(keep='first')) über ein Arrow group_by."""
+    # Reine NULL-Spalten sind in jeder Zeile gleich und tragen nichts zur Unterscheidung bei
+    keys = [name for name, typ in zip(table.column_names, table.schema.types) if not pa.types.is_null(typ)]
+    is_duplicated = np.ones(table.num_rows, dtype=bool)
+    if not keys:
+        is_duplicated[:1] = False
+        return is_duplicated
+    indexed = table.select(keys).append_column("__row", pa.array(np.arange(table.num_rows, dtype=np.int64)))
+    first_rows = indexed.group_by(keys, use_threads=False).aggregate([("__row", "min")])
+    is_duplicated[first_rows["__row_min"].to_numpy()] = False
+    return is_duplicated
+
+
+def arrow_missing_mask(table, existing_critical_cols):
+    """Berechnet in einem vektorisierten Ausdruck: irgendeine kritische Spalte ist NULL/NaN oder ''."""
+    masks = []
+    for col in existing_critical_cols:
+        column = table[col]
+        mask = pc.is_null(column, nan_is_null=True)
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            mask = pc.or_kleene(mask, pc.equal(column, ""))
+        masks.append(mask)
+    return pc.fill_null(functools.reduce(pc.or_kleene, masks), False)
+
+
+def flag_array(mask):
+    """Wandelt eine Bool-Maske in eine dictionary-kodierte 'Y'/'N'-Spalte (2 Wörterbucheinträge + int8-Indizes)."""
+    indices = pa.array(np.where(np.asarray(mask), 1, 0).astype(np.int8))
+    return pa.DictionaryArray.from_arrays(indices, pa.array(["N", "Y"]))
+
+
+def read_arrow(gcs_uri, critical_cols, stats):
+    """Liest die Datei als Arrow-Tabelle (ohne pandas-Konvertierung)."""
+    # 2. PARQUET LADEN
+    start_load = time.time()
+    with fsspec.open(gcs_uri, "rb") as f:
+        stats["bytes_read"] = f.size
+        table = pq.read_table(f)
+    stats["load_duration"] = time.time() - start_load
+
+    stats["row_count"] = table.num_rows
+    stats["column_count"] = table.num_columns
+    print(f"INFO: Parquet-Laden (Arrow) abgeschlossen. Dauer: {stats['load_duration']:.2f}s. Rows: {table.num_rows}.")
+
+    stats["critical_cols"] = [col for col in critical_cols if col in table.column_names]
+    return table
+
+
+def flag_arrow(table, stats, fingerprints=None):
+    """Setzt die Flags mit pyarrow.compute und liefert die Tabelle mit den beiden Flag-Spalten."""
+    # 3. DUAL FLAG LOGIK
+    start_check = time.time()
+    is_duplicated = arrow_duplicate_mask(table)
+    if fingerprints is not None:
+        # Hashes batchweise über pandas, damit sie mit den anderen Pfaden übereinstimmen
+        offset = 0
+        for batch in table.to_batches():
+            batch_df = batch.to_pandas()
+            rows = slice(offset, offset + len(batch_df))
+            is_duplicated[rows] = merge_crossfile_duplicates(fingerprints, batch_df, row_hashes(batch_df), is_duplicated[rows], stats)
+            offset += len(batch_df)
+    if stats["critical_cols"]:
+        missing_mask = arrow_missing_mask(table, stats["critical_cols"]).to_numpy(zero_copy_only=False)
+    else:
+        missing_mask = np.zeros(table.num_rows, dtype=bool)
+
+    table = table.append_column("duplicate_flag", flag_array(is_duplicated))
+    table = table.append_column("missing_flag", flag_array(missing_mask))
+
+    stats["duplicate_count"] += int(is_duplicated.sum())
+    stats["missing_count"] += int(missing_mask.sum())
+    stats["quarantined_count"] += int((is_duplicated | missing_mask).sum())
+    stats["check_duration"] = time.time() - start_check
+    return table
+
+
+class FileTask:
+    """Zustand einer Datei auf dem Weg durch die Phasen Download -> Validierung -> Upload.
+
+    processfile führt die Phasen direkt nacheinander aus; run_pipelined verteilt sie auf
+    getrennte Threads, sodass sich Dateien in unterschiedlichen Phasen überlappen.
+    """
+
+    def __init__(self, warehouse, mapping, filename, gcs_path, options):
+        self.warehouse = warehouse
+        self.filename = filename
+        self.gcs_path = gcs_path
+        self.options = options
+        self.schemacategory = mapping.get(filename)
+        self.start_time = time.time()
+        self.log_row = new_log_row(filename)
+        self.tablename = None
+        self.fingerprints = None
+        self.sink = None
+        self.stats = new_stats()
+        self.data = None
+        # Batch-Load: gestagtes Objekt und Job-Konfiguration für den gemeinsamen Load Job
+        self.stage = None
+        self.stage_name = None
+        self.job_config = None
+        self.pushdown = False
+        self.lake_sink = None
+        self.router = None
+        # Quarantäne-Zeilen der Datei, vorgemerkt bis finish() (Stage im Objektspeicher bzw. versteckte Dateien)
+        self.quarantine_sink = None
+        self.quarantine_stage = None
+        self.quarantine_stage_name = None
+        # Asynchron eingereichte Load Jobs der Datei (LoadGroup, nur mit --async-loads)
+        self.loads = None
+        self.fetch_duration = 0.0
+        # RSS-Messung der Datei (nur mit Metriken); peak_rss_bytes wird beim Beenden der Messung gesetzt
+        self.rss_token = _metrics_recorder.rss.start() if _metrics_recorder is not None else None
+        self.peak_rss_bytes = None
+        # Inhaltsgleiche Kopien unter anderen Präfixen, die mit dieser Datei erledigt sind
+        self.duplicate_sources = options.duplicate_sources.get(gcs_path, [])
+
+    def check_mapping(self):
+        """1. PRÜFUNG: Schema-Mapping. Ohne Mapping wird die Datei als 'quarantine' geloggt (Rückgabe False)."""
+        if self.schemacategory:
+            return True
+
+        self.log_row["status"] = "quarantine"
+        self.log_row["additional_info"] = "CRITICAL: No schema mapping found for file. File completely quarantined."
+        if self.duplicate_sources:
+            self.log_row["additional_info"] += f" | {self.duplicate_sources_info()}"
         try:
-            insert_log_job(bqclient, log_row) 
+            insert_log_job(self.warehouse, self.log_row) 
         except Exception as log_e:
             print(f"KRITISCHER FEHLER beim Logging des Quarantäne-Status: {str(log_e)}")
             raise
             
-        print(f"KEIN SCHEMA: Keine Schemazuordnung für Datei {filename}. Log in Quarantäne-Status.")
-        return tablename
+        print(f"KEIN SCHEMA: Keine Schemazuordnung für Datei {self.filename}. Log in Quarantäne-Status.")
+        self.record_metrics("quarantine")
+        return False
 
-    try:
-        # 2. PARQUET LADEN
-        start_load = time.time()
-        gcs_uri = f"gs://{BUCKET_NAME}/{gcs_path}"
-        
-        df = pd.read_parquet(gcs_uri)
-        load_duration = time.time() - start_load 
-        
-        initial_row_count = len(df)
-        log_row["row_count"] = initial_row_count
-        log_row["column_count"] = len(df.columns)
-        
-        print(f"INFO: Parquet-Laden abgeschlossen. Dauer: {load_duration:.2f}s. Rows: {initial_row_count}.")
-        
-        # 2b. BESTIMME KRITISCHE SPALTEN FÜR NULL CHECK
-        if filename.startswith('fhv_'):
-            source_prefix = 'fhv'
-            CRITICAL_NULL_COLS = ['PULocationID', 'DOLocationID', 'Affiliated_base_number', 'SR_Flag', 'dispatching_base_num', 'pickup_datetime', 'dropOff_datetime'] 
-        elif filename.startswith('green_'):
-            source_prefix = 'green'
-            CRITICAL_NULL_COLS = ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'VendorID']
-        elif filename.startswith('yellow_'):
-            source_prefix = 'yellow'
-            CRITICAL_NULL_COLS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'VendorID']
+    def setup(self):
+        """2. BESTIMME ZIELTABELLE, SINK UND KRITISCHE SPALTEN FÜR NULL CHECK"""
+        options = self.options
+        source_prefix, self.critical_cols = get_critical_null_cols(self.filename)
+        self.tablename = staging_table_name(source_prefix, self.schemacategory)
+        self.gcs_uri = get_object_store().uri(self.gcs_path)
+
+        schema_version = self.tablename
+        if options.unified_table:
+            # Eine partitionierte Tabelle pro Quelle statt einer Tabelle pro Schema-Version
+            self.tablename = unified_table_name(source_prefix)
+        if options.batch_load_files:
+            # Geflaggte Daten nur als Objekt stagen; geladen wird gemeinsam durch den BatchLoader
+            self.stage_name = f"{STAGED_PREFIX}{options.run_id}/{self.tablename}/{self.filename}"
+            self.stage = StagedParquetFile(get_object_store().open_write(self.stage_name))
+
+        if _load_poller is not None:
+            self.loads = _load_poller.group(self.gcs_path)
+
+        unified_columns = None
+        if options.unified_table:
+            unified_columns = build_unified_columns(options.schema_registry, source_prefix)
+            self.sink = self.warehouse.unified_sink(self.tablename, unified_columns, source_prefix,
+                                                    schema_version, self.filename, stage=self.stage, loads=self.loads)
         else:
-            CRITICAL_NULL_COLS = [] 
-            raise ValueError(f"Unbekanntes Quelldateiformat für {filename}") 
+            self.sink = self.warehouse.staging_sink(self.tablename, options.schema_registry.get(self.tablename),
+                                                    stage=self.stage, loads=self.loads)
+        if options.write_stream:
+            # Batches an einen Pending Write Stream anhängen; sichtbar erst mit dem Commit in finish()
+            self.sink = self.warehouse.write_stream_sink(self.tablename, self.sink)
+        if options.split_quarantine:
+            if options.quarantine_dir:
+                self.quarantine_sink = QuarantineParquetSink(options.quarantine_dir, self.tablename, self.filename)
+            else:
+                # Quarantäne-Zeilen nur stagen; in die Quarantäne-Tabelle gelangen sie erst in finish()
+                quarantine_table = self.tablename + QUARANTINE_TABLE_SUFFIX
+                self.quarantine_stage_name = f"{STAGED_PREFIX}{options.run_id}/{quarantine_table}/{self.filename}"
+                self.quarantine_stage = StagedParquetFile(get_object_store().open_write(self.quarantine_stage_name))
+                self.quarantine_sink = self.warehouse.quarantine_sink(quarantine_table, stage=self.quarantine_stage)
+            prepare = None
+            if unified_columns is not None:
+                # Quarantäne-Zeilen aller Schema-Versionen auf denselben Spaltensatz bringen
+                prepare = lambda table: unify_arrow_table(table, unified_columns, source_prefix, schema_version, self.filename)
+            self.sink = SplitRoutingSink(self.sink, self.quarantine_sink, self.filename, prepare)
+        if options.lake_dir:
+            # Alle Zeilen (inkl. Flags) im vereinheitlichten Spaltensatz der Quelle in den Lake schreiben
+            lake_columns = unified_columns or build_unified_columns(options.schema_registry, source_prefix)
+            self.lake_sink = LakeSink(options.lake_dir, source_prefix, lake_columns, schema_version, self.filename)
+            self.sink = LakeTeeSink(self.sink, self.lake_sink)
+        if options.max_month_offset is not None:
+            # Pickup-Monat einmal pro Batch bestimmen; Tabelle, Quarantäne und Lake übernehmen ihn
+            self.router = PickupMonthRoutingSink(self.sink, source_prefix, self.filename, options.max_month_offset)
+            self.sink = self.router
+        self.log_row["table_name"] = self.tablename
 
-        tablename = f"{source_prefix}_{schemacategory.replace('-', '_').lower()}" 
-        log_row["table_name"] = tablename
-        
-        # Finde kritische Spalten, die tatsächlich im DataFrame existieren
-        existing_critical_cols = [col for col in CRITICAL_NULL_COLS if col in df.columns]
+        if options.fingerprint_index_dir:
+            # Gemeinsamer Index: gleichzeitig laufende Dateien sehen die vorgemerkten Hashes der anderen
+            self.fingerprints = FileFingerprints(_fingerprint_index, source_prefix, self.filename)
 
-        # 3. DUAL FLAG LOGIK
-        
-        start_check = time.time()
-        
-        # 3a. Duplikat-Erkennung (Exakte Zeilenduplikate)
-        is_duplicated = df.duplicated()
-        dupcount = is_duplicated.sum()
-        log_row["duplicate_count"] = int(dupcount)
-        
-        # Setze duplicate_flag
-        df['duplicate_flag'] = is_duplicated.map({True: 'Y', False: 'N'})
-        
-        # 3b. Fehlende Werte Erkennung (Gezielte Prüfung auf kritische Spalten)
-        missing_critical_count = 0
-        missing_mask = pd.Series([False] * len(df), index=df.index)
-        quarantine_reasons = [] # Wird nun für die Log-Tabelle verwendet
-        
-        if not existing_critical_cols:
-             # Protokolliere, falls kritische Spalten fehlen (WARNUNG)
-             log_row["additional_info"] += f"WARNING: Critical columns for null check are missing or missing from data: {CRITICAL_NULL_COLS}. Null check skipped. | "
-             
-        elif existing_critical_cols:
-            
-            # Startmaske: Echte Pandas-Nullwerte
-            missing_mask = df[existing_critical_cols].isnull().any(axis=1)
-            
-            # Überprüfung auf leere Strings (häufig bei Parquet/String-Spalten)
-            for col in existing_critical_cols:
-                if df[col].dtype == 'object':
-                    try:
-                        is_empty_string = (df[col] == '')
-                        missing_mask = missing_mask | is_empty_string
-                    except TypeError:
-                        print(f"WARNUNG: Spalte {col} hat gemischte Typen, Prüfung auf leeren String ('') übersprungen.")
-
-            missing_critical_count = missing_mask.sum()
-            
-            if missing_critical_count > 0:
-                quarantine_reasons.append(f"Missing Critical Data ({'/'.join(existing_critical_cols)}): {missing_critical_count}")
-        
-        # Setze missing_flag
-        df['missing_flag'] = missing_mask.map({True: 'Y', False: 'N'})
+        if options.pushdown_min_mb is not None:
+            fs, path = fsspec.core.url_to_fs(self.gcs_uri)
+            self.pushdown = fs.size(path) >= options.pushdown_min_mb * 1024 * 1024
 
-        # Gesamtanzahl der fehlerhaften Zeilen (entweder Missing ODER Duplicate) für das Logging
-        total_quarantined = is_duplicated.sum() + missing_mask.sum() - (is_duplicated & missing_mask).sum()
-        
-        check_duration = time.time() - start_check 
-        
+    def push_down(self):
+        """Lädt die Rohdatei per URI direkt ins Warehouse und setzt die Flags dort per SQL (--pushdown).
 
-        # 4. HAUPT-LADEN IN BIGQUERY (Staging Layer)
-        start_bq_load = time.time()
-        fulltable = f"{PROJECTID}.{DATASET}.{tablename}"
-        
-        job = bqclient.load_table_from_dataframe(df, fulltable)
-        job.result()  
-        bq_load_duration = time.time() - start_bq_load
-        print(f"INFO: BigQuery Lade-Job abgeschlossen. Dauer: {bq_load_duration:.2f}s.")
-        
-        # 5. KRITISCHES LOGGING: Erfolg
-        log_row["status"] = "success"
-        
-        # Aufbau der Timing-Metriken
-        timing_info = (
-            f"Total ETL Time: {time.time() - start_time:.2f}s | "
-            f"Parquet Load Time: {load_duration:.2f}s | "
-            f"Validation Time: {check_duration:.2f}s | "
-            f"BQ Load Time: {bq_load_duration:.2f}s"
-        )
-        
-        # Aufbau der Quarantäne-Metriken
-        quarantine_rate = (total_quarantined / initial_row_count) * 100 if initial_row_count > 0 else 0
-        if total_quarantined > 0:
-            reason_info = f"Duplicates: {dupcount} | " + " | ".join(quarantine_reasons)
-            quarantine_info = f"Quarantine: {total_quarantined} unique rows flagged ({quarantine_rate:.2f}%). Reasons: {reason_info}"
+        Gelesen wird lokal nur der Parquet-Footer (Spalten und Typen für die generierte SQL).
+        """
+        stats = self.stats
+        _, arrow_schema = read_parquet_metadata(self.gcs_uri)
+        columns = list(zip(arrow_schema.names, arrow_schema.types))
+        stats["column_count"] = len(columns)
+        stats["critical_cols"] = [col for col in self.critical_cols if col in arrow_schema.names]
+
+        result = self.warehouse.pushdown_append(self.tablename, self.gcs_uri, columns, stats["critical_cols"],
+                                                self.options.schema_registry.get(self.tablename))
+        for key in ("row_count", "duplicate_count", "missing_count", "quarantined_count"):
+            stats[key] = int(result[key])
+        stats["load_duration"] = result["load_seconds"]
+        stats["check_duration"] = result["check_seconds"]
+        stats["bq_load_duration"] = result["append_seconds"]
+        self.log_row["additional_info"] += f"Pushdown: flags computed in warehouse SQL (job {result['job_id']}) | "
+        print(f"INFO: Pushdown abgeschlossen ({stats['row_count']} Rows, Job {result['job_id']}).")
+
+    def source_uri(self):
+        """URI zum Lesen der Rohdatei: mit --raw-cache der lokale Cache-Pfad (bei Bedarf geprüft heruntergeladen)."""
+        if _raw_cache is None:
+            return self.gcs_uri
+        start = time.time()
+        obj = get_object_store().stat(self.gcs_path)
+        uri, hit = _raw_cache.fetch(self.gcs_uri, obj["generation"], obj["crc32c"], obj["size"])
+        self.fetch_duration = time.time() - start
+        if hit:
+            self.log_row["additional_info"] += "Raw Cache: hit | "
+        elif uri != self.gcs_uri:
+            self.log_row["additional_info"] += f"Raw Cache: miss ({obj['size']} bytes downloaded in {self.fetch_duration:.2f}s) | "
+        return uri
+
+    def download(self):
+        # Pushdown-Dateien durchlaufen alle Phasen im Warehouse; Validierung und Upload entfallen
+        if self.pushdown:
+            self.push_down()
+        elif self.options.arrow:
+            self.data = read_arrow(self.source_uri(), self.critical_cols, self.stats)
         else:
-            quarantine_info = "Quarantine: No issues found."
+            self.data = read_in_memory(self.source_uri(), self.critical_cols, self.stats)
+        # Der Download in den Cache zählt zur Ladezeit
+        self.stats["load_duration"] += self.fetch_duration
 
-        # Kombiniere Timing und Quarantäne und hänge es an eventuelle Warnings an
-        log_row["additional_info"] = log_row["additional_info"] + f"{timing_info} | {quarantine_info}"
+    def validate(self):
+        if self.pushdown:
+            return
+        if self.options.arrow:
+            self.data = flag_arrow(self.data, self.stats, self.fingerprints)
+        else:
+            self.data = flag_in_memory(self.data, self.stats, self.fingerprints)
+
+    def upload(self):
+        if self.pushdown:
+            return
+        upload_data(self.data, self.sink, self.stats)
+        self.data = None
+        self.sink.close()
+        self.job_config = self.sink.job_config
+
+    def stream(self):
+        """Download, Validierung und Upload batchweise in einem Schritt (--stream)."""
+        uri = self.source_uri()
+        if self.options.checkpoint_row_groups:
+            resumed_at = stage_checkpointed(uri, self.gcs_path, self.tablename, self.sink, self.critical_cols,
+                                            self.stats, self.options.memory_budget_mb, _checkpoint_manifest, self.lake_sink)
+            if resumed_at:
+                self.log_row["additional_info"] += f"Checkpoint: resumed at row group {resumed_at} | "
+        else:
+            stage_streaming(uri, self.sink, self.critical_cols, self.stats, self.options.memory_budget_mb, self.fingerprints)
+        self.stats["load_duration"] += self.fetch_duration
+        self.sink.close()
+        self.job_config = self.sink.job_config
 
-        insert_log_job(bqclient, log_row)
+    def detach(self):
+        """Entfernt prozessgebundene Objekte (Clients, offene Dateien), damit ein gestagter Task aus einem
+        Worker-Prozess an den BatchLoader im Hauptprozess übergeben werden kann."""
+        self.warehouse = None
+        self.sink = None
+        self.stage = None
+        self.data = None
+        # Die Messung läuft im Worker; der Hauptprozess meldet nur noch deren Ergebnis
+        self.stop_rss_sampling()
+        return self
+
+    def stop_rss_sampling(self):
+        if self.rss_token is not None and _metrics_recorder is not None:
+            self.peak_rss_bytes = _metrics_recorder.rss.stop(self.rss_token)
+            self.rss_token = None
+
+    def remove_staged(self):
+        """Löscht das gestagte Objekt (nach dem Batch Load oder nach einem Fehler)."""
+        if self.stage is not None:
+            self.stage.abort()
+        if self.stage_name:
+            try:
+                get_object_store().delete(self.stage_name)
+            except Exception as e:
+                print(f"WARNUNG: Gestagtes Objekt {self.stage_name} konnte nicht gelöscht werden: {e}")
+
+    def publish_quarantine(self):
+        """Übernimmt die vorgemerkten Quarantäne-Zeilen, nachdem die Haupt-Zeilen geladen sind."""
+        if self.quarantine_stage is not None:
+            if self.quarantine_stage.writer is not None:
+                self.warehouse.load_staged(self.tablename + QUARANTINE_TABLE_SUFFIX,
+                                           [get_object_store().uri(self.quarantine_stage_name)], self.quarantine_sink.job_config)
+            get_object_store().delete(self.quarantine_stage_name)
+            self.quarantine_stage = None
+        elif self.quarantine_sink is not None:
+            self.quarantine_sink.publish()
+
+    def discard_quarantine(self):
+        """Verwirft die vorgemerkten Quarantäne-Zeilen einer gescheiterten Datei."""
+        try:
+            if self.quarantine_stage is not None:
+                self.quarantine_stage.abort()
+                get_object_store().delete(self.quarantine_stage_name)
+                self.quarantine_stage = None
+            elif self.quarantine_sink is not None:
+                self.quarantine_sink.discard()
+        except Exception as e:
+            print(f"WARNUNG: Vorgemerkte Quarantäne-Zeilen von {self.gcs_path} konnten nicht verworfen werden: {e}")
+
+    def finish(self):
+        """5. KRITISCHES LOGGING: Erfolg"""
+        stats = self.stats
+        log_row = self.log_row
+        log_row["row_count"] = stats["row_count"]
+        log_row["column_count"] = stats["column_count"]
+        log_row["duplicate_count"] = stats["duplicate_count"]
+
+        if not stats["critical_cols"]:
+            # Protokolliere, falls kritische Spalten fehlen (WARNUNG)
+            log_row["additional_info"] += f"WARNING: Critical columns for null check are missing or missing from data: {self.critical_cols}. Null check skipped. | "
         
-    except Exception as e:
-        # 6. KRITISCHES LOGGING: Fehler
+        if self.options.split_quarantine:
+            target = self.options.quarantine_dir or self.tablename + QUARANTINE_TABLE_SUFFIX
+            log_row["additional_info"] += f"Quarantine Routing: {stats['quarantined_count']} rows -> {target} | "
+        if self.options.lake_dir:
+            log_row["additional_info"] += f"Lake: {self.lake_sink.bytes_written} bytes -> {self.options.lake_dir} | "
+        if self.router is not None:
+            buckets = ", ".join(f"{bucket}={rows}" for bucket, rows in sorted(self.router.bucket_counts.items()))
+            log_row["additional_info"] += f"Pickup Buckets: {buckets} | "
+        if self.duplicate_sources:
+            log_row["additional_info"] += f"{self.duplicate_sources_info()} | "
+
+        log_row["status"] = "success"
+        # Kombiniere Timing und Quarantäne und hänge es an eventuelle Warnings an
+        log_row["additional_info"] += build_result_info(stats, self.start_time)
+
+        self.publish_quarantine()
+        if self.options.write_stream:
+            commit_write_stream(self.warehouse, self.tablename, self.gcs_path, self.sink, log_row)
+        else:
+            insert_log_job(self.warehouse, log_row)
+        # Fingerprints erst nach erfolgreichem Laden persistieren
+        if self.fingerprints is not None:
+            self.fingerprints.commit()
+        if self.options.checkpoint_row_groups:
+            _checkpoint_manifest.clear_checkpoints(self.gcs_path)
+        self.record_metrics("success")
+        print(f"Verarbeitung abgeschlossen (Status: {log_row['status']}): {self.gcs_path}")
+
+    def fail(self, e):
+        """6. KRITISCHES LOGGING: Fehler"""
+        self.data = None
+        log_row = self.log_row
         log_row["status"] = "fail"
         log_row["additional_info"] = f"CRITICAL ETL failed: {type(e).__name__}: {str(e)}"
-        print(f"FEHLER: Kritischer Verarbeitungsfehler für {gcs_path}: {log_row['additional_info']}")
+        if self.duplicate_sources:
+            log_row["additional_info"] += f" | {self.duplicate_sources_info()}"
+        if self.fingerprints is not None:
+            self.fingerprints.discard()
+        if self.loads is not None:
+            self.loads.abandon()
+        self.remove_staged()
+        self.discard_quarantine()
+        if self.options.write_stream and self.sink is not None:
+            self.sink.abort()
+        print(f"FEHLER: Kritischer Verarbeitungsfehler für {self.gcs_path}: {log_row['additional_info']}")
         
         try:
              # Logge den Fehlerstatus
-             insert_log_job(bqclient, log_row)
+             insert_log_job(self.warehouse, log_row)
         except:
              print("WARNUNG: Konnte selbst den Fehlerstatus nicht protokollieren. Verarbeitung wird beendet.")
-        
+        self.record_metrics("fail")
+
+    def duplicate_sources_info(self):
+        return (f"Duplicate Sources: {len(self.duplicate_sources)} identical copies skipped "
+                f"({', '.join(self.duplicate_sources)})")
+
+    def mode(self):
+        if self.pushdown:
+            return "pushdown"
+        if self.options.stream:
+            return "stream"
+        return "arrow" if self.options.arrow else "pandas"
+
+    def record_metrics(self, status):
+        """Schreibt den strukturierten Metrik-Eintrag der Datei (falls Metriken aktiv sind)."""
+        if _metrics_recorder is None:
+            return
+        self.stop_rss_sampling()
+        entry = build_file_metrics(_metrics_recorder.run_id, self.gcs_path, status, self.stats,
+                                   time.time() - self.start_time, self.tablename, self.mode(), self.peak_rss_bytes)
+        try:
+            _metrics_recorder.record(entry)
+        except OSError as e:
+            print(f"WARNUNG: Metriken für {self.gcs_path} konnten nicht geschrieben werden: {e}")
+
+
+def upload_file(warehouse, mapping, filename, gcs_path, options):
+    """Führt die Phasen einer Datei bis einschließlich Upload aus, ohne den Erfolg zu protokollieren.
+
+    Liefert den FileTask (None bei fehlendem Schema-Mapping). Im Batch-Load-Modus ist die Datei
+    danach nur gestagt und wird vom BatchLoader geladen und protokolliert.
+    """
+    print(f"\n--- Starte Verarbeitung der Datei: {gcs_path} ---")
+    task = FileTask(warehouse, mapping, filename, gcs_path, options)
+
+    if not task.check_mapping():
+        return None
+
+    try:
+        task.setup()
+        if task.options.stream and not task.pushdown:
+            task.stream()
+        else:
+            task.download()
+            task.validate()
+            task.upload()
+    except Exception as e:
+        task.fail(e)
         raise
+    return task
+
+
+def processfile(warehouse, mapping, filename, gcs_path, options=None):
+    """Verarbeitet eine einzelne Parquet-Datei: Lädt, prüft Duplikate, setzt DUPLICATE_FLAG und MISSING_FLAG, lädt in BigQuery, loggt."""
+    task = upload_file(warehouse, mapping, filename, gcs_path, options or StagingOptions())
+    if task is None:
+        return None
+
+    try:
+        task.finish()
+    except Exception as e:
+        task.fail(e)
+        raise
+
+    return task.tablename
+
+
+def seal_loads(task, on_result):
+    """Versiegelt die eingereichten Load Jobs einer hochgeladenen Datei (--async-loads).
+
+    finish() (Audit-Zeile) bzw. fail() und on_result folgen erst, wenn alle Jobs der Datei
+    abgeschlossen sind, und laufen im Thread, der LoadJobPoller.collect()/drain() aufruft.
+    """
+    loads = task.loads
+
+    def emit(status, error=None):
+        on_result({"gcs_path": task.gcs_path, "status": status,
+                   "table_name": task.tablename if status == "success" else None, "error": error})
+
+    def succeeded():
+        task.stats["bytes_uploaded"] += sum(loaded_bytes(job) for job in loads.completed)
+        if loads.completed:
+            task.log_row["additional_info"] += f"Async Load: {len(loads.completed)} jobs, {loads.retries} retries | "
+        try:
+            task.finish()
+            emit("success")
+        except Exception as e:
+            task.fail(e)
+            emit("fail", f"{type(e).__name__}: {e}")
+
+    def failed(error):
+        task.fail(error)
+        emit("fail", f"{type(error).__name__}: {error}")
+
+    loads.seal(succeeded, failed)
+
+
+# --- BATCH-LOAD ---
+
+class BatchLoader:
+    """Sammelt gestagte Dateien je Zieltabelle und lädt sie gemeinsam in einem Load Job.
+
+    Ein Load Job ist atomar: Entweder werden alle Dateien der Gruppe übernommen (Audit-Zeile
+    'success' je Datei mit den Job-Statistiken) oder keine ('fail' für alle Dateien der Gruppe).
+    on_result erhält für jede Datei das Ergebnis-Dict, sobald ihr Load Job abgeschlossen ist.
+    """
+
+    def __init__(self, warehouse, max_files=DEFAULT_BATCH_LOAD_FILES, on_result=None):
+        self.warehouse = warehouse
+        self.max_files = max_files
+        self.on_result = on_result
+        self.groups = {}  # (Tabelle, Job-Konfiguration) -> [FileTask]
+        self.jobs = 0
+        self.loaded_files = 0
+
+    def emit(self, task, status, error=None):
+        if self.on_result:
+            self.on_result({"gcs_path": task.gcs_path, "status": status,
+                            "table_name": task.tablename if status == "success" else None, "error": error})
+
+    def add(self, task):
+        """Übernimmt einen gestagten Task; eine volle Gruppe wird sofort geladen."""
+        if task.stats["row_count"] == 0:
+            # Nichts zu laden
+            self.commit([task], None)
+            return
+        job_config = task.job_config
+        config_key = json.dumps(job_config.to_api_repr(), sort_keys=True) if job_config is not None else None
+        key = (task.tablename, config_key)
+        group = self.groups.setdefault(key, [])
+        group.append(task)
+        if len(group) >= self.max_files:
+            self.load_group(key)
+
+    def flush(self):
+        """Lädt alle noch offenen Gruppen (am Ende des Laufs)."""
+        for key in list(self.groups):
+            self.load_group(key)
+        if self.jobs:
+            print(f"INFO: {self.loaded_files} Dateien in {self.jobs} Batch Load Jobs geladen.")
+
+    def load_group(self, key):
+        tasks = self.groups.pop(key)
+        table = key[0]
+        uris = [get_object_store().uri(task.stage_name) for task in tasks]
+        print(f"INFO: Batch-Load von {len(tasks)} Dateien nach {table}.")
+        try:
+            job = self.warehouse.load_staged(table, uris, tasks[0].job_config)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"FEHLER: Batch-Load nach {table} fehlgeschlagen ({len(tasks)} Dateien): {error}")
+            for task in tasks:
+                task.fail(e)
+                self.emit(task, "fail", error)
+            return
+        self.jobs += 1
+        self.loaded_files += len(tasks)
+        print(f"INFO: Load Job {job['job_id']}: {job['output_rows']} Zeilen aus {len(tasks)} Dateien "
+              f"nach {table} geladen. Dauer: {job['seconds']:.2f}s.")
+        self.commit(tasks, job)
+
+    def commit(self, tasks, job):
+        """Protokolliert den Erfolg jeder Datei einer erfolgreich geladenen Gruppe."""
+        info = ""
+        if job is not None:
+            expected_rows = sum(task.stats["row_count"] for task in tasks)
+            info = f"Batch Load Job: {job['job_id']} ({len(tasks)} files, {job['output_rows']} rows) | "
+            if job["output_rows"] is not None and job["output_rows"] != expected_rows:
+                info += f"WARNING: Load job reported {job['output_rows']} rows, expected {expected_rows}. | "
+        for task in tasks:
+            if job is not None:
+                task.stats["bq_load_duration"] += job["seconds"]
+            task.log_row["additional_info"] += info
+            try:
+                task.finish()
+                self.emit(task, "success")
+            except Exception as e:
+                task.fail(e)
+                self.emit(task, "fail", f"{type(e).__name__}: {e}")
+            task.remove_staged()
+
+
+# --- PIPELINE-VERARBEITUNG ---
+
+def run_pipelined(mapping, work_items, options, on_result=None, max_in_flight=DEFAULT_PIPELINE_DEPTH, admission=None):
+    """Überlappt Download, Validierung und Upload verschiedener Dateien in drei Threads.
+
+    Während Datei N validiert wird, lädt der Download-Thread bereits Datei N+1 und der
+    Upload-Thread schreibt Datei N-1. Ein Semaphor begrenzt die Zahl der Dateien, die sich
+    gleichzeitig im Speicher befinden, auf max_in_flight (Backpressure für den Download).
+    Mit admission wartet der Download zusätzlich, bis der projizierte RSS die Datei zulässt.
+    Im Batch-Load-Modus gibt eine Datei ihren Platz bereits nach dem Stagen frei; ihr Ergebnis
+    folgt, sobald der gemeinsame Load Job abgeschlossen ist.
+    Liefert (Ergebnisse, Auslastung je Stufe).
+    """
+    slots = threading.Semaphore(max_in_flight)
+    validate_queue = queue.Queue()
+    upload_queue = queue.Queue()
+    results = []
+    results_lock = threading.Lock()
+    busy = {"download": 0.0, "validate": 0.0, "upload": 0.0}
+
+    def record(result):
+        with results_lock:
+            results.append(result)
+            print(f"INFO: [{len(results)}/{len(work_items)}] {result['gcs_path']} -> {result['status']}")
+        if on_result:
+            on_result(result)
+
+    def release(task):
+        if admission:
+            admission.release(admission.estimate_for(task.gcs_path))
+        slots.release()
+
+    def complete(task, status, error=None):
+        record({"gcs_path": task.gcs_path, "status": status,
+                "table_name": task.tablename if status == "success" else None, "error": error})
+        release(task)
+
+    batch_loader = BatchLoader(get_warehouse(), options.batch_load_files, record) if options.batch_load_files else None
+
+    def run_stage(stage, task, fn):
+        """Führt eine Phase aus; bei Fehlern wird die Datei als 'fail' abgeschlossen (Rückgabe False)."""
+        start = time.time()
+        try:
+            fn()
+            return True
+        except Exception as e:
+            task.fail(e)
+            complete(task, "fail", f"{type(e).__name__}: {e}")
+            return False
+        finally:
+            busy[stage] += time.time() - start
+
+    def downloader():
+        for filename, gcs_path in work_items:
+            slots.acquire()
+            if admission:
+                admission.admit(admission.estimate_for(gcs_path))
+            # Erst beanspruchen, wenn Platz ist; sonst hielte der Prozess einen Lease, den andere abarbeiten könnten
+            if not claim_work_item(filename, gcs_path):
+                if admission:
+                    admission.release(admission.estimate_for(gcs_path))
+                slots.release()
+                continue
+            print(f"\n--- Starte Verarbeitung der Datei: {gcs_path} ---")
+            task = FileTask(get_warehouse(), mapping, filename, gcs_path, options)
+            try:
+                if not task.check_mapping():
+                    complete(task, "quarantine")
+                    continue
+            except Exception as e:
+                complete(task, "fail", f"{type(e).__name__}: {e}")
+                continue
+            if run_stage("download", task, lambda: (task.setup(), task.download())):
+                validate_queue.put(task)
+        validate_queue.put(None)
+
+    def validator():
+        while (task := validate_queue.get()) is not None:
+            if run_stage("validate", task, task.validate):
+                upload_queue.put(task)
+        upload_queue.put(None)
 
-    print(f"Verarbeitung abgeschlossen (Status: {log_row['status']}): {gcs_path}")
-    return tablename
+    def uploader():
+        while (task := upload_queue.get()) is not None:
+            if _load_poller is not None:
+                _load_poller.collect()
+            if batch_loader:
+                if run_stage("upload", task, task.upload):
+                    release(task)
+                    batch_loader.add(task)
+            elif _load_poller is not None:
+                # Die Daten sind hochgeladen; das Ergebnis folgt, sobald die Load Jobs abgeschlossen sind
+                if run_stage("upload", task, task.upload):
+                    release(task)
+                    seal_loads(task, record)
+            elif run_stage("upload", task, lambda: (task.upload(), task.finish())):
+                complete(task, "success")
+        if _load_poller is not None:
+            _load_poller.drain()
 
-def main():
+    start = time.time()
+    threads = [threading.Thread(target=fn, name=f"staging-{fn.__name__}") for fn in (downloader, validator, uploader)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if batch_loader:
+        batch_loader.flush()
+    wall = max(time.time() - start, 1e-9)
+
+    utilization = {stage: busy[stage] / wall for stage in busy}
+    return results, utilization
+
+
+# --- PARALLELE VERARBEITUNG ---
+
+_worker_mapping = {}
+_worker_options = None
+
+def _init_worker(mapping, options):
+    """Initialisiert einen Worker-Prozess mit eigenen Backends, Schema-Mapping und Optionen."""
+    global _worker_mapping, _worker_options
+    # Clients dürfen nicht über Prozessgrenzen geteilt werden (Sockets/Threads), daher neu erstellen
+    configure_backends(options)
+    _worker_mapping = mapping
+    _worker_options = options
+    # Worker-Prozesse führen keine atexit-Handler aus; Finalize flusht den Audit-Puffer beim Beenden
+    sink = start_audit_sink(get_warehouse(), options)
+    multiprocessing.util.Finalize(sink, sink.close, exitpriority=10)
+    start_metrics_recorder(options)
+    start_stream_journal(options)
+    start_checkpoints(options)
+    start_fingerprint_index(options)
+    start_raw_cache(options)
+
+
+def _process_worker(filename, gcs_path):
+    """Führt processfile in einem Worker-Prozess aus und liefert ein Ergebnis-Dict statt einer Exception.
+
+    Im Batch-Load-Modus wird die Datei nur gestagt; das Ergebnis enthält dann den Task für den BatchLoader.
+    """
+    try:
+        if _worker_options.batch_load_files:
+            task = upload_file(get_warehouse(), _worker_mapping, filename, gcs_path, _worker_options)
+            if task is not None:
+                return {"gcs_path": gcs_path, "status": "staged", "table_name": task.tablename, "error": None,
+                        "task": task.detach()}
+            return {"gcs_path": gcs_path, "status": "quarantine", "table_name": None, "error": None}
+        tablename = processfile(get_warehouse(), _worker_mapping, filename, gcs_path, _worker_options)
+        status = "success" if tablename else "quarantine"
+        return {"gcs_path": gcs_path, "status": status, "table_name": tablename, "error": None}
+    except Exception as e:
+        # processfile hat den Fehlerstatus bereits selbst protokolliert
+        return {"gcs_path": gcs_path, "status": "fail", "table_name": None, "error": f"{type(e).__name__}: {e}"}
+
+
+def log_worker_crash(client, filename, error):
+    """Protokolliert einen Fehler, der außerhalb von processfile aufgetreten ist (z.B. abgestürzter Worker-Prozess)."""
+    log_row = new_log_row(filename)
+    log_row["status"] = "fail"
+    log_row["additional_info"] = f"CRITICAL ETL failed: Worker crashed: {error}"
+    try:
+        insert_log_job(client, log_row)
+    except Exception as log_e:
+        print(f"WARNUNG: Konnte Worker-Absturz für {filename} nicht protokollieren: {log_e}")
+
+
+def run_sequential(mapping, work_items, options, on_result=None):
+    """Verarbeitet die Dateien nacheinander. Ein Fehler bricht den Lauf nicht ab."""
+    results = []
+
+    def record(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    batch_loader = BatchLoader(get_warehouse(), options.batch_load_files, record) if options.batch_load_files else None
+    for filename, gcs_path in work_items:
+        if _load_poller is not None:
+            # Ergebnisse inzwischen abgeschlossener Load Jobs protokollieren, ohne auf offene zu warten
+            _load_poller.collect()
+        if not claim_work_item(filename, gcs_path):
+            continue
+        try:
+            if batch_loader or _load_poller is not None:
+                task = upload_file(get_warehouse(), mapping, filename, gcs_path, options)
+                if task is not None:
+                    if batch_loader:
+                        batch_loader.add(task)
+                    else:
+                        seal_loads(task, record)
+                    continue
+                tablename = None
+            else:
+                tablename = processfile(get_warehouse(), mapping, filename, gcs_path, options)
+            status = "success" if tablename else "quarantine"
+            result = {"gcs_path": gcs_path, "status": status, "table_name": tablename, "error": None}
+        except Exception as e:
+            print(f"\nFEHLER: Verarbeitung von {gcs_path} fehlgeschlagen. Fahre mit nächster Datei fort.")
+            result = {"gcs_path": gcs_path, "status": "fail", "table_name": None, "error": f"{type(e).__name__}: {e}"}
+        record(result)
+    if batch_loader:
+        batch_loader.flush()
+    if _load_poller is not None:
+        _load_poller.drain()
+    return results
+
+
+def run_parallel(mapping, work_items, workers, options, on_result=None, admission=None):
+    """Verarbeitet unabhängige Dateien parallel in einem Prozess-Pool. Jede Datei loggt ihren eigenen Audit-Eintrag.
+
+    Mit admission wird eine Datei erst an den Pool übergeben, wenn der projizierte RSS unter dem
+    Budget bleibt. Passt die nächste Datei nicht, werden kleinere spätere Dateien vorgezogen; große
+    Dateien laufen so mit reduzierter Parallelität (notfalls allein) statt den Lauf abstürzen zu lassen.
+    Im Batch-Load-Modus stagen die Worker nur; geladen und protokolliert wird im Hauptprozess.
+    """
+    results = []
+
+    def record(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+        print(f"INFO: [{len(results)}/{len(work_items)}] {result['gcs_path']} -> {result['status']}")
+
+    batch_loader = BatchLoader(get_warehouse(), options.batch_load_files, record) if options.batch_load_files else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mapping, options)) as executor:
+        futures = {}
+
+        def collect(timeout=None):
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, gcs_path = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Worker-Prozess ist abgestürzt (z.B. OOM) -> processfile konnte nicht mehr loggen
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"\nFEHLER: Worker für {gcs_path} abgestürzt: {error}")
+                    log_worker_crash(get_warehouse(), filename, error)
+                    result = {"gcs_path": gcs_path, "status": "fail", "table_name": None, "error": error}
+                if admission:
+                    admission.release(admission.estimate_for(gcs_path))
+                if result["status"] == "staged":
+                    task = result["task"]
+                    task.warehouse = get_warehouse()
+                    batch_loader.add(task)
+                else:
+                    record(result)
+
+        waiting = list(work_items)
+        while waiting:
+            # Höchstens so viele Dateien zulassen wie Worker frei sind, sonst reserviert die Warteschlange
+            # Speicher bzw. Leases, die andere Hosts abarbeiten könnten
+            if (admission is not None or _work_leases is not None) and len(futures) >= workers:
+                collect()
+                continue
+            if admission is None:
+                filename, gcs_path = waiting.pop(0)
+                if not claim_work_item(filename, gcs_path):
+                    continue
+            else:
+                admitted = next((item for item in waiting if admission.try_admit(admission.estimate_for(item[1]))), None)
+                if admitted is None:
+                    admission.deferred += 1
+                    wait_for_admission(admission, admission.estimate_for(waiting[0][1]), collect)
+                    admitted = waiting[0]
+                waiting.remove(admitted)
+                filename, gcs_path = admitted
+                if not claim_work_item(filename, gcs_path):
+                    admission.release(admission.estimate_for(gcs_path))
+                    continue
+            futures[executor.submit(_process_worker, filename, gcs_path)] = (filename, gcs_path)
+        while futures:
+            collect()
+    if batch_loader:
+        batch_loader.flush()
+    return results
+
+
+def print_run_summary(results, utilization=None):
+    """Gibt eine Zusammenfassung des ETL-Laufs aus (optional mit Auslastung der Pipeline-Stufen)."""
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"\nZUSAMMENFASSUNG: {len(results)} Dateien verarbeitet: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    for result in results:
+        if result["status"] == "fail":
+            print(f"  FEHLGESCHLAGEN: {result['gcs_path']} ({result['error']})")
+    if utilization:
+        print("PIPELINE-AUSLASTUNG: " + " | ".join(f"{stage}: {share * 100:.1f}%" for stage, share in utilization.items()))
+
+
+def export_run_metrics(options, prometheus_textfile, run_seconds):
+    """Fasst die Metrik-Einträge des Laufs (aller Worker) zusammen und exportiert sie optional für Prometheus."""
+    if not options.metrics_path:
+        return
+    entries = load_run_metrics(options.metrics_path, options.run_id)
+    print_metrics_summary(entries, run_seconds)
+    if prometheus_textfile:
+        write_prometheus_textfile(prometheus_textfile, entries, run_seconds)
+        print(f"INFO: Prometheus-Metriken nach {prometheus_textfile} geschrieben.")
+
+
+def select_work_items(objects, manifest, reconcile=False):
+    """Bestimmt die zu verarbeitenden Dateien anhand des lokalen Manifests (ohne Warehouse-Abfrage).
+
+    Ist das Manifest leer oder reconcile gesetzt, wird es vorher mit der Audit-Tabelle abgeglichen.
+    """
+    if reconcile or len(manifest) == 0:
+        adopted, reset = manifest.reconcile(objects, get_processed_files(get_warehouse()))
+        print(f"INFO: Manifest mit Audit-Log abgeglichen: {adopted} Dateien übernommen, {reset} zurückgesetzt.")
+
+    work_items = []
+    for obj in objects:
+        gcs_path = obj["name"]
+        state = manifest.classify(obj)
+        if state == UNCHANGED:
+            print(f"INFO: Überspringe Datei {gcs_path} (unverändert und bereits erfolgreich verarbeitet).")
+            continue
+        if state == CHANGED:
+            print(f"WARNUNG: Datei {gcs_path} wurde seit der letzten Verarbeitung geändert und wird neu geladen.")
+        work_items.append((gcs_path.split("/")[-1], gcs_path))
+    return work_items
+
+
+def plan_decisions(objects, manifest, successful_files, reconcile=False):
+    """Trockenlauf von select_work_items (bzw. des Audit-Log-Abgleichs mit --no-manifest), ohne das Manifest zu ändern.
+
+    Liefert gcs_path -> (Aktion, Grund). Widersprechen sich Manifest und Audit-Log, wird das im Grund vermerkt.
+    """
+    reconcile = manifest is not None and (reconcile or len(manifest) == 0)
+    state_names = {NEW: "neu", CHANGED: "geändert"}
+    decisions = {}
+    for obj in objects:
+        gcs_path = obj["name"]
+        in_audit = gcs_path.split("/")[-1] in successful_files
+        if manifest is None:
+            decisions[gcs_path] = (SKIP, "success im Audit-Log") if in_audit else (PROCESS, "nicht im Audit-Log")
+            continue
+        state = manifest.classify(obj)
+        if reconcile and state == NEW and in_audit and manifest.get(gcs_path) is None:
+            decisions[gcs_path] = (SKIP, "success im Audit-Log (wird ins Manifest übernommen)")
+        elif reconcile and state == UNCHANGED and not in_audit:
+            decisions[gcs_path] = (PROCESS, "fehlt im Audit-Log (Manifest-Eintrag wird zurückgesetzt)")
+        elif state == UNCHANGED:
+            decisions[gcs_path] = (SKIP, "unverändert" + ("" if in_audit else "; WARNUNG: fehlt im Audit-Log"))
+        else:
+            # Eine geänderte Datei hat ihren Erfolg im Audit-Log von der früheren Version
+            mismatch = state == NEW and in_audit
+            decisions[gcs_path] = (PROCESS, state_names[state] + ("; WARNUNG: success im Audit-Log" if mismatch else ""))
+    return decisions
+
+
+def build_work_plan(objects, decisions, mastermapping, options, workers=DEFAULT_FOOTER_WORKERS, raw_cache=None):
+    """Erstellt den Arbeitsplan aus Listing, Entscheidungen (gcs_path -> (Aktion, Grund)) und Parquet-Footern.
+
+    Gelesen werden nur die Footer der zu verarbeitenden Dateien (parallel): Zeilenzahl und geschätzter
+    Spitzen-RSS. Als Upload-Volumen gilt die Dateigröße (die geflaggten Daten werden wieder als Parquet
+    bzw. per Load Job übertragen); Pushdown-Dateien laden nichts über den Client. Dateien, die bereits
+    im raw_cache liegen, werden als gecacht markiert und ihre Footer lokal gelesen.
+    """
+    mode = "stream" if options.stream else "arrow" if options.arrow else "pandas"
+    entries = []
+    for obj in objects:
+        if obj["name"] not in decisions:
+            continue
+        action, reason = decisions[obj["name"]]
+        filename = obj["name"].split("/")[-1]
+        entry = PlanEntry(obj["name"], filename, action, reason, size=obj.get("size") or 0,
+                          schema=mastermapping.get(filename))
+        if raw_cache is not None:
+            entry.cached_path = raw_cache.lookup(get_object_store().uri(obj["name"]), obj["generation"],
+                                                 obj.get("crc32c"), obj.get("size") or 0)
+        if entry.action == PROCESS and entry.schema is None:
+            entry.action, entry.reason = QUARANTINE, "kein Schema-Mapping"
+        elif entry.schema is not None:
+            try:
+                source_prefix, _ = get_critical_null_cols(filename)
+                entry.table_name = unified_table_name(source_prefix) if options.unified_table else staging_table_name(source_prefix, entry.schema)
+            except ValueError:
+                pass
+        entries.append(entry)
+
+    start = time.time()
+    uris = {entry.gcs_path: entry.cached_path or get_object_store().uri(entry.gcs_path)
+            for entry in entries if entry.action == PROCESS}
+    profiles = profile_files(list(uris.values()), mode, options.memory_budget_mb, workers)
+    for entry in entries:
+        if entry.action != PROCESS:
+            continue
+        profile = profiles[uris[entry.gcs_path]]
+        if isinstance(profile, Exception):
+            # processfile scheitert an dieser Datei ohnehin; sie belegt dann kaum Speicher
+            entry.error = f"{type(profile).__name__}: {profile}"
+            continue
+        pushdown = options.pushdown_min_mb is not None and entry.size >= options.pushdown_min_mb * 1024 * 1024
+        entry.mode = "pushdown" if pushdown else mode
+        entry.rows = profile["rows"]
+        entry.columns = profile["columns"]
+        entry.estimated_memory_bytes = 0 if pushdown else profile["peak_bytes"]
+        entry.estimated_load_bytes = 0 if pushdown else entry.size
+    print(f"INFO: Arbeitsplan für {len(entries)} Dateien erstellt ({len(uris)} Footer gelesen). Dauer: {time.time() - start:.2f}s.")
+    return WorkPlan(entries)
+
+
+def classify_unmapped_files(work_items, mastermapping, schemas_by_source, options, workers=DEFAULT_FOOTER_WORKERS, persist=True):
+    """Ordnet Dateien ohne Eintrag im Schema-Mapping anhand ihres Parquet-Footers einer Schema-Version zu.
+
+    Liest nur die Footer (parallel), ergänzt mastermapping und Schema-Registry und schreibt neu
+    registrierte Schema-Versionen bzw. neue Dateinamen in die Schema-JSON-Dateien zurück
+    (nicht mit persist=False, z.B. bei --plan).
+    """
+    unmapped = []
+    for filename, gcs_path in work_items:
+        if filename in mastermapping:
+            continue
+        try:
+            source_prefix, _ = get_critical_null_cols(filename)
+        except ValueError:
+            continue  # Unbekannte Quelle -> wird von processfile in Quarantäne gelegt
+        unmapped.append((source_prefix, filename, get_object_store().uri(gcs_path)))
+    if not unmapped:
+        return
+
+    start = time.time()
+    footers = read_footer_schemas([uri for _, _, uri in unmapped], workers)
+    classifier = SchemaClassifier(schemas_by_source)
+    classified = {}
+    for source_prefix, filename, uri in unmapped:
+        column_types = footers[uri]
+        if isinstance(column_types, Exception):
+            print(f"WARNUNG: Footer von {uri} konnte nicht gelesen werden: {column_types}")
+            continue
+        classified.setdefault(source_prefix, []).append((filename, column_types))
+        schemacategory, is_new = classifier.classify(source_prefix, filename, column_types)
+        mastermapping[filename] = schemacategory
+        if is_new:
+            print(f"INFO: Neue Schema-Version {source_prefix}/{schemacategory} für {filename} registriert.")
+        else:
+            print(f"INFO: {filename} per Footer als {schemacategory} klassifiziert.")
+
+    for source_prefix in classifier.changed_sources:
+        if persist:
+            jsonfile = SCHEMA_JSON_BY_SOURCE[source_prefix]
+            schemas_by_source[source_prefix] = upload_schema_json(jsonfile, source_prefix, classified[source_prefix])
+            # Parallel registrierte Versionen können die Nummern verschoben haben
+            mastermapping.update(loadschemamappingjsonfile(jsonfile, schemas_by_source[source_prefix]))
+        options.schema_registry.update(build_schema_registry(schemas_by_source[source_prefix]))
+    print(f"INFO: {len(unmapped)} Dateien per Footer klassifiziert. Dauer: {time.time() - start:.2f}s.")
+
+
+def build_admission_controller(plan, max_rss_mb, poll_seconds=DEFAULT_POLL_SECONDS):
+    """Erstellt die RSS-Zulassungskontrolle mit den Speicherschätzungen des Arbeitsplans."""
+    estimates = plan.estimates()
+    for entry in plan.pending():
+        if entry.error:
+            print(f"WARNUNG: Speicherbedarf von {entry.gcs_path} nicht schätzbar: {entry.error}")
+    budget_bytes = max_rss_mb * 1024 * 1024
+    too_large = [path for path, estimate in estimates.items() if estimate > budget_bytes]
+    for path in too_large:
+        print(f"WARNUNG: {path} benötigt geschätzt {estimates[path] / 2**20:,.0f} MiB (> Budget {max_rss_mb} MiB) und wird allein verarbeitet.")
+    print(f"INFO: Speicherbedarf von {len(estimates)} Dateien geschätzt "
+          f"(max. {max(estimates.values(), default=0) / 2**20:,.0f} MiB).")
+    return AdmissionController(budget_bytes, estimates, poll_seconds)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Staging-ETL: Lädt TLC-Parquet-Dateien aus GCS nach BigQuery.")
+    parser.add_argument("--backend", choices=[GCP_BACKEND, LOCAL_BACKEND], default=GCP_BACKEND,
+                        help="Objektspeicher/Warehouse: 'gcp' (GCS + BigQuery, Standard) oder 'local' (Verzeichnis + Parquet-Warehouse, offline).")
+    parser.add_argument("--local-root", default=DEFAULT_LOCAL_ROOT,
+                        help=f"Wurzelverzeichnis des lokalen Backends (Quelldateien wie im Bucket, Warehouse unter {LOCAL_WAREHOUSE_DIR}/; Standard: {DEFAULT_LOCAL_ROOT}).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Anzahl paralleler Worker-Prozesse (Standard: 1 = sequentiell).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Dateien Row-Group-weise lesen und batchweise laden (begrenzter Speicherverbrauch).")
+    parser.add_argument("--arrow", action="store_true",
+                        help="Flags mit pyarrow.compute berechnen und mit explizitem BigQuery-Schema laden (ohne pandas).")
+    parser.add_argument("--pipeline", type=int, nargs="?", const=DEFAULT_PIPELINE_DEPTH, default=None, metavar="K",
+                        help=f"Download, Validierung und Upload dateiübergreifend überlappen; höchstens K Dateien im Speicher (Standard: {DEFAULT_PIPELINE_DEPTH}).")
+    parser.add_argument("--fingerprint-index", metavar="DIR", default=None,
+                        help="Verzeichnis eines persistenten Zeilen-Fingerprint-Index für dateiübergreifende Duplikate.")
+    parser.add_argument("--no-bloom", action="store_true",
+                        help="Bloom-Filter vor dem Fingerprint-Index deaktivieren.")
+    parser.add_argument("--audit-flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+                        help=f"Audit-Zeilen pro Batch-Load (Standard: {DEFAULT_FLUSH_ROWS}).")
+    parser.add_argument("--audit-flush-seconds", type=float, default=DEFAULT_FLUSH_SECONDS,
+                        help=f"Maximale Pufferzeit für Audit-Zeilen in Sekunden (Standard: {DEFAULT_FLUSH_SECONDS}).")
+    parser.add_argument("--manifest", default=MANIFEST_PATH,
+                        help=f"Pfad des lokalen Ingestion-Manifests (Standard: {MANIFEST_PATH}).")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help="Manifest nicht verwenden; Dateien wie bisher nur anhand des Audit-Logs überspringen.")
+    parser.add_argument("--reconcile-manifest", action="store_true",
+                        help="Manifest vor dem Lauf mit der Audit-Tabelle abgleichen.")
+    parser.add_argument("--no-footer-classification", action="store_true",
+                        help="Dateien ohne Schema-Mapping nicht per Parquet-Footer klassifizieren (direkt Quarantäne).")
+    parser.add_argument("--footer-workers", type=int, default=DEFAULT_FOOTER_WORKERS,
+                        help=f"Parallele Footer-Lesezugriffe bei der Klassifikation (Standard: {DEFAULT_FOOTER_WORKERS}).")
+    parser.add_argument("--unified-table", action="store_true",
+                        help="In eine nach Pickup-Monat partitionierte Tabelle pro Quelle ({source}_staging) laden.")
+    parser.add_argument("--metrics-file", default=METRICS_PATH,
+                        help=f"JSON-Lines-Datei für strukturierte Metriken pro Datei und Stufe (Standard: {METRICS_PATH}).")
+    parser.add_argument("--no-metrics", action="store_true",
+                        help="Keine strukturierten Metriken schreiben.")
+    parser.add_argument("--prometheus-textfile", metavar="PATH", default=None,
+                        help="Metriken des Laufs zusätzlich im Prometheus-Textfile-Format schreiben (node_exporter).")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help=f"Speicherbudget pro Datei im Streaming-Modus (Standard: {DEFAULT_MEMORY_BUDGET_MB} MB).")
+    parser.add_argument("--batch-load", type=int, nargs="?", const=DEFAULT_BATCH_LOAD_FILES, default=None, metavar="N",
+                        help=f"Geflaggte Dateien stagen und je Zieltabelle gemeinsam in einem Load Job laden; höchstens N Dateien pro Job (Standard: {DEFAULT_BATCH_LOAD_FILES}).")
+    parser.add_argument("--write-stream", action="store_true",
+                        help="Über Pending Write Streams (Storage Write API) anhängen und zusammen mit der Audit-Zeile committen (exactly-once).")
+    parser.add_argument("--split-quarantine", action="store_true",
+                        help=f"Geflaggte Zeilen mit Grundcode in <tabelle>{QUARANTINE_TABLE_SUFFIX} statt in die Staging-Tabelle schreiben.")
+    parser.add_argument("--quarantine-dir", metavar="URI", default=None,
+                        help="Geflaggte Zeilen stattdessen als Parquet-Dateien unter URI/<tabelle>/ ablegen (lokal oder gs://; impliziert --split-quarantine).")
+    parser.add_argument("--pushdown", type=int, nargs="?", const=DEFAULT_PUSHDOWN_MIN_MB, default=None, metavar="MIN_MB",
+                        help=f"Dateien ab MIN_MB per URI direkt ins Warehouse laden und die Flags dort per SQL setzen (Standard: {DEFAULT_PUSHDOWN_MIN_MB} MB; 0 = alle Dateien).")
+    parser.add_argument("--max-rss-mb", type=int, default=None,
+                        help="Gesamt-RSS-Budget (Prozess + Worker); Dateien werden nur zugelassen, solange der projizierte RSS darunter bleibt.")
+    parser.add_argument("--admission-poll-seconds", type=float, default=DEFAULT_POLL_SECONDS,
+                        help=f"Intervall, in dem zurückgestellte Dateien den RSS erneut prüfen (Standard: {DEFAULT_POLL_SECONDS}s).")
+    parser.add_argument("--checkpoint-row-groups", action="store_true",
+                        help="Im Streaming-Modus in ganzen Row Groups laden und den Fortschritt im Manifest sichern; ein erneuter Lauf setzt beim ersten unfertigen Bereich fort.")
+    parser.add_argument("--lake-dir", metavar="URI", default=None,
+                        help="Geflaggte Daten zusätzlich als Hive-partitionierten Parquet-Lake (source=/year=/month=, zstd) unter URI ablegen; kleine Dateien mit parquet_lake.py kompaktieren. Erneutes Stagen ersetzt die Lake-Zeilen der Datei.")
+    parser.add_argument("--route-pickup-months", type=int, nargs="?", const=DEFAULT_MAX_MONTH_OFFSET, default=None, metavar="MAX_OFFSET",
+                        help=f"Zeilen nach tatsächlichem Pickup-Monat partitionieren; Zeilen mehr als MAX_OFFSET Monate neben dem Dateimonat in die NULL-Partition (Standard: {DEFAULT_MAX_MONTH_OFFSET}; setzt --unified-table voraus).")
+    parser.add_argument("--async-loads", type=int, nargs="?", const=DEFAULT_MAX_OUTSTANDING, default=None, metavar="MAX_JOBS",
+                        help=f"Load Jobs nur einreichen und sofort mit der nächsten Datei weitermachen; ein Poller verfolgt höchstens MAX_JOBS ausstehende Jobs, wiederholt transiente Fehler mit Backoff und protokolliert jede Datei nach Abschluss ihrer Jobs (Standard: {DEFAULT_MAX_OUTSTANDING}).")
+    parser.add_argument("--raw-cache", metavar="DIR", default=None,
+                        help="Rohdateien in einem lokalen, per Generation und CRC32C adressierten Cache unter DIR ablegen und wiederverwenden (auch für --plan).")
+    parser.add_argument("--raw-cache-mb", type=int, default=DEFAULT_RAW_CACHE_MB,
+                        help=f"Speicherbudget des Raw-File-Caches; darüber werden die am längsten nicht genutzten Dateien verdrängt (Standard: {DEFAULT_RAW_CACHE_MB} MB).")
+    parser.add_argument("--claim-leases", type=int, nargs="?", const=DEFAULT_LEASE_TTL_SECONDS, default=None, metavar="TTL_SECONDS",
+                        help="Dateien vor der Verarbeitung über Leases im Objektspeicher beanspruchen, sodass mehrere Staging-Prozesse "
+                             f"(auch auf verschiedenen Hosts) dieselbe Dateiliste ohne doppelte Loads abarbeiten (Standard-TTL: {DEFAULT_LEASE_TTL_SECONDS}s).")
+    parser.add_argument("--plan", action="store_true",
+                        help="Nur planen: Ordner listen, Parquet-Footer lesen, mit Manifest und Audit-Log abgleichen und den Arbeitsplan je Datei ausgeben (keine Verarbeitung, keine Schreibzugriffe).")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers muss mindestens 1 sein.")
+    if args.stream and args.arrow:
+        parser.error("--stream und --arrow schließen sich aus.")
+    if args.pipeline and (args.stream or args.workers > 1):
+        parser.error("--pipeline ist nicht mit --stream oder --workers > 1 kombinierbar.")
+    if args.write_stream and args.batch_load:
+        parser.error("--write-stream und --batch-load schließen sich aus.")
+    if (args.batch_load or args.write_stream) and (args.split_quarantine or args.quarantine_dir):
+        # Quarantäne-Zeilen werden nach den direkt geladenen Haupt-Zeilen übernommen, nicht im gemeinsamen
+        # Load Job bzw. Stream-Commit; ein Fehler dort ließe sie stehen und jede Wiederholung hängte sie erneut an
+        parser.error("--split-quarantine/--quarantine-dir ist nicht mit --batch-load oder --write-stream kombinierbar.")
+    if args.fingerprint_index and args.workers > 1:
+        # Vorgemerkte Fingerprints sieht nur der eigene Prozess; gleichzeitige Dateien anderer Worker blieben unerkannt
+        parser.error("--fingerprint-index ist nicht mit --workers > 1 kombinierbar.")
+    if args.pushdown is not None and (args.unified_table or args.fingerprint_index or args.batch_load or args.write_stream
+                                      or args.split_quarantine or args.quarantine_dir):
+        # Vereinheitlichung, Fingerprints und die alternativen Ladewege setzen lokal gelesene Daten voraus
+        parser.error("--pushdown ist nicht mit --unified-table, --fingerprint-index, --batch-load, --write-stream "
+                     "oder --split-quarantine kombinierbar.")
+    if args.route_pickup_months is not None and not args.unified_table:
+        # Nur die vereinheitlichten Tabellen sind nach Pickup-Monat partitioniert
+        parser.error("--route-pickup-months setzt --unified-table voraus.")
+    if args.async_loads is not None and (args.workers > 1 or args.batch_load or args.write_stream
+                                         or args.checkpoint_row_groups):
+        # Worker-Prozesse überlappen das Warten bereits; die anderen Ladewege brauchen das Ergebnis sofort
+        parser.error("--async-loads ist nicht mit --workers > 1, --batch-load, --write-stream oder "
+                     "--checkpoint-row-groups kombinierbar.")
+    if args.claim_leases is not None and args.claim_leases < 3:
+        parser.error("--claim-leases braucht eine TTL von mindestens 3 Sekunden.")
+    if args.lake_dir and args.pushdown is not None:
+        # Beim Pushdown erreichen die Zeilen den Client nie
+        parser.error("--lake-dir ist nicht mit --pushdown kombinierbar.")
+    if args.checkpoint_row_groups and (not args.stream or args.no_manifest or args.fingerprint_index or args.batch_load
+                                       or args.write_stream or args.split_quarantine or args.quarantine_dir):
+        # Checkpoints liegen im Manifest; die anderen Ladewege hängen nicht bereichsweise und idempotent an
+        parser.error("--checkpoint-row-groups setzt --stream voraus und ist nicht mit --no-manifest, --fingerprint-index, "
+                     "--batch-load, --write-stream oder --split-quarantine kombinierbar.")
+    return args
+
+
+def load_schema_mappings(options):
+    """Lädt die Schema-JSON-Dateien aller Quellen; füllt die Schema-Registry und liefert (mastermapping, schemas_by_source)."""
+    mastermapping = {}
+    schemas_by_source = {}
+    for source_prefix, jsonfile in SCHEMA_JSON_BY_SOURCE.items():
+        schemas = download_schema_json(jsonfile)
+        schemas_by_source[source_prefix] = schemas
+        mapping = loadschemamappingjsonfile(jsonfile, schemas)
+        mastermapping.update(mapping)
+        options.schema_registry.update(build_schema_registry(schemas))
+    return mastermapping, schemas_by_source
+
+
+def plan_run(args, options):
+    """--plan: Erstellt und druckt den Arbeitsplan nur aus Listing, Footern, Manifest und Audit-Log.
+
+    Schreibt nichts (keine Audit-Tabelle, kein Manifest, keine Schema-JSON-Dateien, keine Metriken).
+    """
+    start = time.time()
+    configure_backends(options)
+    mastermapping, schemas_by_source = load_schema_mappings(options)
+    objects = list_target_objects(TARGET_GCS_PREFIXES, args.footer_workers)
+    print(f"INFO: {len(objects)} Dateien in den Ziel-Ordnern gefunden.")
+    unique_objects, duplicates = dedupe_objects(objects)
+
+    # Ohne Manifest-Datei würde der echte Lauf das (leere) Manifest aus dem Audit-Log übernehmen
+    manifest = None
+    if not args.no_manifest and os.path.exists(args.manifest):
+        manifest = IngestionManifest(args.manifest)
+    decisions = plan_decisions(unique_objects, manifest, get_processed_files(get_warehouse()), args.reconcile_manifest)
+    for kept, copies in duplicates.items():
+        decisions.update({copy: (SKIP, f"inhaltsgleich mit {kept}") for copy in copies})
+    if manifest is not None:
+        manifest.close()
+
+    if not args.no_footer_classification:
+        pending = [(gcs_path.split("/")[-1], gcs_path) for gcs_path, (action, _) in decisions.items() if action == PROCESS]
+        classify_unmapped_files(pending, mastermapping, schemas_by_source, options, args.footer_workers, persist=False)
+    # Lesend: ein vorhandener Cache liefert Footer lokal, es wird nichts heruntergeladen
+    raw_cache = RawFileCache.open_existing(options.raw_cache_dir, options.raw_cache_mb) if options.raw_cache_dir else None
+    plan = build_work_plan(objects, decisions, mastermapping, options, args.footer_workers, raw_cache)
+    if raw_cache is not None:
+        raw_cache.close()
+    plan.print_report()
+    print(f"INFO: Planung abgeschlossen. Dauer: {time.time() - start:.2f}s.")
+    return plan
+
+
+def main(argv=None):
     print("MAIN FN EXECUTED")
+    args = parse_args(argv)
+    options = StagingOptions(
+        backend=args.backend,
+        local_root=args.local_root,
+        stream=args.stream,
+        memory_budget_mb=args.memory_budget_mb,
+        arrow=args.arrow,
+        fingerprint_index_dir=args.fingerprint_index,
+        bloom=not args.no_bloom,
+        audit_flush_rows=args.audit_flush_rows,
+        audit_flush_seconds=args.audit_flush_seconds,
+        unified_table=args.unified_table,
+        metrics_path=None if args.no_metrics else args.metrics_file,
+        run_id=new_run_id(),
+        batch_load_files=args.batch_load,
+        write_stream=args.write_stream,
+        split_quarantine=args.split_quarantine or bool(args.quarantine_dir),
+        quarantine_dir=args.quarantine_dir,
+        pushdown_min_mb=args.pushdown,
+        checkpoint_row_groups=args.checkpoint_row_groups,
+        manifest_path=args.manifest,
+        lake_dir=args.lake_dir,
+        max_month_offset=args.route_pickup_months,
+        max_outstanding_loads=args.async_loads,
+        raw_cache_dir=args.raw_cache,
+        raw_cache_mb=args.raw_cache_mb,
+    )
+    if args.plan:
+        return plan_run(args, options)
+
+    run_start = time.time()
+    start_metrics_recorder(options)
     
-    ensure_audit_tables_exist(bqclient)
+    warehouse = configure_backends(options)[1]
+    ensure_audit_tables_exist(warehouse)
+    sink = start_audit_sink(warehouse, options)
+    atexit.register(sink.close)
+    sink.recover()
+    # Write Streams abgestürzter Läufe auflösen, bevor bereits verarbeitete Dateien bestimmt werden
+    recovered_streams = recover_write_streams(warehouse, options.stream_journal_path)
+    if recovered_streams:
+        sink.flush()
+    start_stream_journal(options)
+    start_checkpoints(options)
+    start_fingerprint_index(options)
+    start_raw_cache(options)
+    start_load_poller(options)
     
-    mastermapping = {}
-    for jsonfile in SCHEMAJSONFILES:
-        mapping = loadschemamappingjsonfile(jsonfile)
-        mastermapping.update(mapping)
+    mastermapping, schemas_by_source = load_schema_mappings(options)
         
     if not mastermapping:
         print("KRITISCHER FEHLER: Master-Schema-Mapping ist leer. Beende ETL.")
         return
         
-    all_parquet_paths = []
-    for prefix in TARGET_GCS_PREFIXES:
-        paths = list_gcs_parquet_files(BUCKET_NAME, prefix)
-        all_parquet_paths.extend(paths)
+    all_objects = list_target_objects(TARGET_GCS_PREFIXES, args.footer_workers)
         
-    if not all_parquet_paths:
+    if not all_objects:
         print("INFO: Keine Parquet-Dateien in den Ziel-Ordnern gefunden. Beende ETL.")
         return
 
-    print(f"INFO: {len(all_parquet_paths)} Dateien in den Ziel-Ordnern gefunden.")
-    
-    successful_files = get_processed_files(bqclient)
+    print(f"INFO: {len(all_objects)} Dateien in den Ziel-Ordnern gefunden.")
+    # Inhaltsgleiche Kopien unter mehreren Präfixen nur einmal laden
+    listed_objects = all_objects
+    all_objects, options.duplicate_sources = dedupe_objects(all_objects)
     
-    for gcs_path in all_parquet_paths:
-        filename = gcs_path.split("/")[-1] 
-        
-        if filename in successful_files:
-            print(f"INFO: Überspringe Datei {gcs_path} (bereits erfolgreich im Audit-Log gefunden).")
-            continue
-        
-        if filename in mastermapping:
-            try:
-                processfile(bqclient, mastermapping, filename, gcs_path)
-            except Exception as e:
-                print(f"\nFATAL ERROR: Verarbeitung von {gcs_path} abgebrochen. Überprüfen Sie die Logs.")
-                return 
-        else:
-            # Sende Datei trotzdem an processfile zur Log-Erstellung des 'quarantine'-Status.
-            processfile(bqclient, mastermapping, filename, gcs_path)
+    # Dateien ohne Mapping werden trotzdem an processfile gesendet (Log-Erstellung des 'quarantine'-Status).
+    manifest = None
+    on_result = None
+    if args.no_manifest:
+        successful_files = get_processed_files(get_warehouse())
+        work_items = []
+        for obj in all_objects:
+            filename = obj["name"].split("/")[-1]
+            if filename in successful_files:
+                print(f"INFO: Überspringe Datei {obj['name']} (bereits erfolgreich im Audit-Log gefunden).")
+                continue
+            work_items.append((filename, obj["name"]))
+    else:
+        manifest = IngestionManifest(args.manifest)
+        objects_by_path = {obj["name"]: obj for obj in listed_objects}
+        for entry in recovered_streams:
+            if entry["gcs_path"] in objects_by_path:
+                manifest.record(objects_by_path[entry["gcs_path"]], "success", entry["table_name"])
+        work_items = select_work_items(all_objects, manifest, reconcile=args.reconcile_manifest)
+
+        def on_result(result):
+            # Kopien teilen das Ergebnis der verarbeiteten Datei
+            for gcs_path in [result["gcs_path"], *options.duplicate_sources.get(result["gcs_path"], [])]:
+                manifest.record(objects_by_path[gcs_path], result["status"], result["table_name"])
+
+    if not args.no_footer_classification:
+        classify_unmapped_files(work_items, mastermapping, schemas_by_source, options, args.footer_workers)
+
+    # Derselbe Arbeitsplan wie bei --plan: größte Dateien zuerst starten, Speicherschätzungen für die Zulassung
+    plan = build_work_plan(all_objects, {gcs_path: (PROCESS, "") for _, gcs_path in work_items},
+                           mastermapping, options, args.footer_workers, _raw_cache)
+    work_items = plan.work_items()
+
+    admission = None
+    if args.max_rss_mb and (args.pipeline or args.workers > 1):
+        admission = build_admission_controller(plan, args.max_rss_mb, args.admission_poll_seconds)
+
+    leases = None
+    if args.claim_leases is not None:
+        on_done_elsewhere = None
+        if manifest is not None:
+            on_done_elsewhere = lambda gcs_path, status, table_name: manifest.record(objects_by_path[gcs_path], status, table_name)
+        leases = start_work_leases(args.claim_leases, all_objects, options.run_id, on_done_elsewhere)
+        atexit.register(leases.close)
+        on_result = leases.wrap_on_result(on_result)
+
+    def run(items):
+        if args.pipeline:
+            print(f"INFO: Pipeline-Verarbeitung von {len(items)} Dateien (max. {args.pipeline} Dateien im Speicher).")
+            return run_pipelined(mastermapping, items, options, on_result, args.pipeline, admission)
+        if args.workers > 1:
+            print(f"INFO: Parallele Verarbeitung von {len(items)} Dateien mit {args.workers} Workern.")
+            return run_parallel(mastermapping, items, args.workers, options, on_result, admission), None
+        return run_sequential(mastermapping, items, options, on_result), None
+
+    results, utilization = run(work_items)
+    if leases is not None:
+        # Dateien anderer Prozesse abwarten; Leases abgestürzter Prozesse laufen ab und werden hier übernommen
+        while reclaimable := leases.sweep():
+            more_results, _ = run(reclaimable)
+            results += more_results
+    if admission:
+        print(f"SPEICHER: {admission.summary()}")
+    if _load_poller is not None:
+        _load_poller.close()
+    if _raw_cache is not None:
+        print(f"RAW-CACHE: {_raw_cache.summary()}")
+    if leases is not None:
+        leases.close()
+        print(f"LEASES: {leases.summary()}")
+
+    if manifest is not None:
+        manifest.close()
+
+    # Reste abgestürzter Worker übernehmen, dann letzter Flush
+    sink.recover()
+    sink.close()
+    print_run_summary(results, utilization)
+    export_run_metrics(options, args.prometheus_textfile, time.time() - run_start)
 
 if __name__ == "__main__":
     main()
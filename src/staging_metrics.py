@@ -0,0 +1,256 @@
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import psutil
+
+# Stufe -> Zeitmessung in den stats von processfile
+STAGE_DURATIONS = {
+    "download": "load_duration",
+    "validate": "check_duration",
+    "upload": "bq_load_duration",
+}
+
+# Histogramm-Grenzen (Prometheus 'le'); +Inf wird beim Export ergänzt
+DURATION_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+ROWS_PER_SECOND_BUCKETS = [1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6]
+BYTES_BUCKETS = [2**20, 10 * 2**20, 50 * 2**20, 100 * 2**20, 250 * 2**20, 500 * 2**20, 2**30, 2 * 2**30]
+
+METRIC_PREFIX = "staging"
+
+# Abtastintervall des RSS je Datei
+RSS_SAMPLE_SECONDS = 0.05
+
+
+def new_run_id():
+    """Eindeutige Kennung eines ETL-Laufs (UTC-Startzeit + PID), verbindet die Einträge aller Worker."""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{os.getpid()}"
+
+
+class RssSampler:
+    """Tastet den RSS des Prozesses in einem Hintergrund-Thread ab und führt je laufender Datei das Maximum.
+
+    ru_maxrss wäre der Höchststand seit Prozessstart, d.h. jede Datei nach der größten meldete deren
+    Spitze. Laufen mehrere Dateien gleichzeitig im selben Prozess (Pipeline), zählt der RSS für alle.
+    """
+
+    def __init__(self, interval_seconds=RSS_SAMPLE_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._process = psutil.Process()
+        self._peaks = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        with self._lock:
+            for token, peak in self._peaks.items():
+                if rss > peak:
+                    self._peaks[token] = rss
+
+    def _run(self):
+        while True:
+            self._sample()
+            time.sleep(self.interval_seconds)
+
+    def start(self):
+        """Beginnt die Messung für eine Datei und liefert ihr Token."""
+        with self._lock:
+            token = next(self._tokens)
+            self._peaks[token] = 0
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+        self._sample()
+        return token
+
+    def stop(self, token):
+        """Beendet die Messung und liefert den höchsten RSS in Bytes (None für unbekannte Tokens)."""
+        self._sample()
+        with self._lock:
+            return self._peaks.pop(token, None)
+
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else None
+
+
+def build_file_metrics(run_id, gcs_path, status, stats, total_seconds, table_name=None, mode=None, peak_rss_bytes=None):
+    """Baut den strukturierten Metrik-Eintrag einer Datei aus den stats von processfile (peak_rss_bytes: RssSampler)."""
+    rows = stats.get("row_count", 0)
+    return {
+        "run_id": run_id,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "file_name": gcs_path.split("/")[-1],
+        "gcs_path": gcs_path,
+        "table_name": table_name,
+        "status": status,
+        "mode": mode,
+        "rows": rows,
+        "columns": stats.get("column_count", 0),
+        "bytes_read": stats.get("bytes_read", 0),
+        "bytes_uploaded": stats.get("bytes_uploaded", 0),
+        "duplicate_count": stats.get("duplicate_count", 0),
+        "crossfile_duplicate_count": stats.get("crossfile_duplicate_count", 0),
+        "missing_count": stats.get("missing_count", 0),
+        "quarantined_count": stats.get("quarantined_count", 0),
+        "peak_rss_bytes": peak_rss_bytes,
+        "total_seconds": total_seconds,
+        "rows_per_second": _rate(rows, total_seconds),
+        "stages": {
+            stage: {"seconds": stats.get(key, 0.0), "rows_per_second": _rate(rows, stats.get(key, 0.0))}
+            for stage, key in STAGE_DURATIONS.items()
+        },
+    }
+
+
+class MetricsRecorder:
+    """Hängt Metrik-Einträge als JSON-Lines an eine Datei an.
+
+    Jede Zeile wird mit einem einzigen write() auf einen O_APPEND-Deskriptor geschrieben, daher
+    können Worker-Prozesse und Pipeline-Threads ohne Sperre in dieselbe Datei schreiben.
+    """
+
+    def __init__(self, path, run_id):
+        self.path = path
+        self.run_id = run_id
+        self.rss = RssSampler()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, entry):
+        line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def load_run_metrics(path, run_id):
+    """Liest alle Einträge eines Laufs aus der JSON-Lines-Datei."""
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("run_id") == run_id:
+                entries.append(entry)
+    return entries
+
+
+def _labels(label_text):
+    return f"{{{label_text}}}" if label_text else ""
+
+
+def _histogram_lines(name, help_text, buckets, observations):
+    """Prometheus-Histogramm; observations ist eine Liste von (Label-Dict, Wert)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    series = {}
+    for labels, value in observations:
+        if value is None:
+            continue
+        series.setdefault(tuple(sorted(labels.items())), []).append(value)
+    for labels, values in sorted(series.items()):
+        values = np.asarray(values, dtype=float)
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+        prefix = f"{label_text}," if label_text else ""
+        for bound in buckets:
+            lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {int((values <= bound).sum())}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {len(values)}')
+        lines.append(f"{name}_sum{_labels(label_text)} {float(values.sum())!r}")
+        lines.append(f"{name}_count{_labels(label_text)} {len(values)}")
+    return lines
+
+
+def _gauge_lines(name, help_text, samples):
+    """Prometheus-Gauge; samples ist eine Liste von (Label-Dict, Wert)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in sorted(labels.items()))
+        lines.append(f"{name}{_labels(label_text)} {float(value)!r}")
+    return lines
+
+
+def prometheus_text(entries, run_seconds=None):
+    """Erzeugt das Textfile-Collector-Format (node_exporter) für die Einträge eines Laufs."""
+    p = METRIC_PREFIX
+    processed = [e for e in entries if e["status"] == "success"]
+    lines = []
+    lines += _histogram_lines(
+        f"{p}_stage_duration_seconds", "Dauer je Stufe und Datei.", DURATION_BUCKETS,
+        [({"stage": stage}, e["stages"][stage]["seconds"]) for e in processed for stage in STAGE_DURATIONS],
+    )
+    lines += _histogram_lines(
+        f"{p}_stage_rows_per_second", "Durchsatz je Stufe und Datei (Zeilen pro Sekunde).", ROWS_PER_SECOND_BUCKETS,
+        [({"stage": stage}, e["stages"][stage]["rows_per_second"]) for e in processed for stage in STAGE_DURATIONS],
+    )
+    lines += _histogram_lines(
+        f"{p}_file_bytes", "Gelesene bzw. hochgeladene Bytes je Datei.", BYTES_BUCKETS,
+        [({"direction": "read"}, e["bytes_read"]) for e in processed]
+        + [({"direction": "uploaded"}, e["bytes_uploaded"]) for e in processed],
+    )
+
+    statuses = {}
+    for e in entries:
+        statuses[e["status"]] = statuses.get(e["status"], 0) + 1
+    lines += _gauge_lines(f"{p}_run_files", "Dateien des letzten Laufs je Status.",
+                          [({"status": status}, count) for status, count in sorted(statuses.items())])
+    row_kinds = ["rows", "duplicate_count", "crossfile_duplicate_count", "missing_count", "quarantined_count"]
+    lines += _gauge_lines(f"{p}_run_rows", "Zeilen des letzten Laufs je Art.",
+                          [({"kind": kind}, sum(e[kind] for e in processed)) for kind in row_kinds])
+    peaks = [e["peak_rss_bytes"] for e in entries if e.get("peak_rss_bytes") is not None]
+    if peaks:
+        lines += _gauge_lines(f"{p}_peak_rss_bytes", "Höchster RSS eines Staging-Prozesses im letzten Lauf.", [({}, max(peaks))])
+    if run_seconds is not None:
+        lines += _gauge_lines(f"{p}_run_duration_seconds", "Gesamtdauer des letzten Laufs.", [({}, run_seconds)])
+    lines += _gauge_lines(f"{p}_last_run_timestamp_seconds", "Endzeitpunkt des letzten Laufs (Unix-Zeit).",
+                          [({}, datetime.now(timezone.utc).timestamp())])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path, entries, run_seconds=None):
+    """Schreibt die Metriken atomar (tmp + rename), damit der Collector nie eine halbe Datei liest."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(entries, run_seconds))
+    os.replace(tmp_path, path)
+
+
+def print_metrics_summary(entries, run_seconds=None):
+    """Gibt Verteilungen (p50/p90/max) der Stufendauern und Durchsätze des Laufs aus."""
+    processed = [e for e in entries if e["status"] == "success"]
+    if not processed:
+        return
+    print(f"\nMETRIKEN: {len(processed)} erfolgreich geladene Dateien")
+
+    def describe(values, fmt):
+        values = np.asarray([v for v in values if v is not None], dtype=float)
+        if len(values) == 0:
+            return "-"
+        p50, p90 = np.percentile(values, [50, 90])
+        return f"p50 {fmt(p50)} | p90 {fmt(p90)} | max {fmt(values.max())}"
+
+    for stage in STAGE_DURATIONS:
+        durations = describe([e["stages"][stage]["seconds"] for e in processed], lambda v: f"{v:.2f}s")
+        rates = describe([e["stages"][stage]["rows_per_second"] for e in processed], lambda v: f"{v:,.0f} rows/s")
+        print(f"  {stage:<9} Dauer: {durations}")
+        print(f"  {'':<9} Durchsatz: {rates}")
+
+    rows = sum(e["rows"] for e in processed)
+    bytes_read = sum(e["bytes_read"] for e in processed)
+    bytes_uploaded = sum(e["bytes_uploaded"] for e in processed)
+    print(f"  Gesamt: {rows:,} Zeilen, {bytes_read / 2**20:,.1f} MiB gelesen, {bytes_uploaded / 2**20:,.1f} MiB hochgeladen")
+    if run_seconds:
+        print(f"  Laufdurchsatz: {rows / run_seconds:,.0f} rows/s über {run_seconds:.1f}s")
+    peaks = [e["peak_rss_bytes"] for e in processed if e.get("peak_rss_bytes") is not None]
+    if peaks:
+        print(f"  Peak RSS: {max(peaks) / 2**20:,.0f} MiB")
@@ -0,0 +1,74 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Zustände eines Journal-Eintrags
+PREPARED = "prepared"
+COMMITTED = "committed"
+
+
+class StreamJournal:
+    """Lokales Journal (SQLite) für den Exactly-once-Commit von Write Streams.
+
+    Vor dem Commit eines finalisierten Streams wird die fertige Audit-Zeile der Datei
+    zusammen mit dem Stream-Namen gespeichert. Stürzt der Lauf zwischen Commit und Audit-Zeile
+    ab, kann recover() anhand des Stream-Zustands entscheiden, ob die Daten sichtbar sind
+    (Audit-Zeile nachtragen) oder die Datei erneut verarbeitet werden muss.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Worker-Prozesse teilen sich die Datei; SQLite serialisiert die Schreibzugriffe
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS streams (
+                stream_name TEXT PRIMARY KEY,
+                table_name  TEXT NOT NULL,
+                gcs_path    TEXT NOT NULL,
+                row_count   INTEGER,
+                state       TEXT NOT NULL,
+                audit_row   TEXT NOT NULL,
+                updated_at  TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def prepare(self, stream_name, table_name, gcs_path, row_count, audit_row):
+        """Merkt den Stream mit der Audit-Zeile vor, bevor er committet wird."""
+        self._execute(
+            "INSERT OR REPLACE INTO streams VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (stream_name, table_name, gcs_path, row_count, PREPARED, json.dumps(audit_row, default=str),
+             datetime.now(timezone.utc).isoformat()),
+        )
+
+    def mark_committed(self, stream_name):
+        self._execute("UPDATE streams SET state = ?, updated_at = ? WHERE stream_name = ?",
+                      (COMMITTED, datetime.now(timezone.utc).isoformat(), stream_name))
+
+    def remove(self, stream_name):
+        """Entfernt den Eintrag, sobald die Audit-Zeile geschrieben ist."""
+        self._execute("DELETE FROM streams WHERE stream_name = ?", (stream_name,))
+
+    def entries(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stream_name, table_name, gcs_path, row_count, state, audit_row FROM streams ORDER BY updated_at"
+            ).fetchall()
+        keys = ["stream_name", "table_name", "gcs_path", "row_count", "state", "audit_row"]
+        entries = [dict(zip(keys, row)) for row in rows]
+        for entry in entries:
+            entry["audit_row"] = json.loads(entry["audit_row"])
+        return entries
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
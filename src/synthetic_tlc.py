@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Schema-Dateien im Repository (schema/) und ihr Name im Bucket (schemes/)
+REPO_SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "schema")
+SCHEMA_FILES = {
+    "fhv": "schemas_with_filenames_fhv.json",
+    "green": "schemas_with_filenames_greentaxi.json",
+    "yellow": "schemas_with_filenames_yellowtaxi.json",
+}
+BUCKET_SCHEMA_DIR = "schemes"
+
+# Ablageort der synthetischen Dateien (entspricht TARGET_GCS_PREFIXES in staging.py)
+RAW_PREFIX_BY_SOURCE = {
+    "fhv": "raw/FHV_Data_2015-2025_all/",
+    "green": "raw/Green_Taxi_Trip_Data_2015-2025_all/",
+    "yellow": "raw/Yellow_Taxi_Trip_Data_June_2010-2025/",
+}
+
+# Standardraten für fehlende Werte und Duplikate (grob an den echten TLC-Daten orientiert)
+DEFAULT_NULL_RATE = 0.02
+DEFAULT_EMPTY_RATE = 0.005
+DEFAULT_DUPLICATE_RATIO = 0.001
+DEFAULT_ROW_GROUP_ROWS = 1_000_000
+
+NUM_ZONES = 265
+
+
+def load_repo_schemas(schema_dir=REPO_SCHEMA_DIR):
+    """Lädt schema/schemas_with_filenames_*.json als {Quelle: [Schema-Einträge]}."""
+    schemas_by_source = {}
+    for source, filename in SCHEMA_FILES.items():
+        with open(os.path.join(schema_dir, filename), encoding="utf-8") as f:
+            schemas_by_source[source] = json.load(f)
+    return schemas_by_source
+
+
+def schema_versions(schemas_by_source):
+    """Liefert (Quelle, Schema-Key, {Spalte: Arrow-Typ}, Beispiel-Dateiname) für jede Schema-Version.
+
+    Der Beispiel-Dateiname (erste Datei des Schemas) wird für die synthetische Datei übernommen,
+    damit Schema-Mapping und Pickup-Monat zur echten Datei passen.
+    """
+    versions = []
+    for source, entries in schemas_by_source.items():
+        for entry in entries:
+            for key, column_types in entry.items():
+                if key.lower().startswith("schema") and entry.get("files"):
+                    versions.append((source, key, column_types, entry["files"][0].split("/")[-1]))
+    return versions
+
+
+def file_month(filename):
+    """Pickup-Monat aus einem TLC-Dateinamen, z.B. 'yellow_tripdata_2010-06.parquet' -> '2010-06'."""
+    return filename.rsplit("_", 1)[-1].split(".")[0]
+
+
+class ColumnGenerator:
+    """Erzeugt plausible Werte einer TLC-Spalte anhand ihres Namens und Arrow-Typs."""
+
+    def __init__(self, rng, month, null_rate, empty_rate):
+        self.rng = rng
+        self.month_start = np.datetime64(f"{month}-01T00:00:00", "us")
+        self.month_end = (np.datetime64(month, "M") + 1).astype("datetime64[us]")
+        self.null_rate = null_rate
+        self.empty_rate = empty_rate
+
+    def pickup_times(self, n):
+        span = int((self.month_end - self.month_start) / np.timedelta64(1, "us"))
+        return self.month_start + self.rng.integers(0, span, n).astype("timedelta64[us]")
+
+    def trip_durations(self, n):
+        # Exponentialverteilte Fahrtdauer mit ~15 Minuten Mittelwert
+        return (self.rng.exponential(15 * 60, n) * 1e6).astype("timedelta64[us]")
+
+    def values(self, name, n, context):
+        """Werte ohne fehlende Einträge als numpy-Array; context enthält bereits erzeugte Spalten der Zeilen."""
+        key = name.lower()
+        rng = self.rng
+        if "pickup_datetime" in key:
+            return self.pickup_times(n)
+        if "dropoff_datetime" in key:
+            pickup = next((v for k, v in context.items() if "pickup_datetime" in k.lower()), None)
+            if pickup is None or pickup.dtype.kind != "M":
+                pickup = self.pickup_times(n)
+            return pickup + self.trip_durations(n)
+        if key.endswith("locationid"):
+            return rng.integers(1, NUM_ZONES + 1, n)
+        if key in ("vendorid",):
+            return rng.choice([1, 2], n, p=[0.3, 0.7])
+        if key == "vendor_id":
+            return rng.choice(np.array(["CMT", "VTS", "DDS"], dtype=object), n, p=[0.45, 0.5, 0.05])
+        if key == "passenger_count":
+            return rng.choice(np.arange(7), n, p=[0.02, 0.7, 0.14, 0.05, 0.03, 0.04, 0.02])
+        if key in ("ratecodeid", "rate_code"):
+            return rng.choice([1, 2, 3, 4, 5, 99], n, p=[0.93, 0.03, 0.01, 0.01, 0.019, 0.001])
+        if key == "payment_type":
+            if context.get("__legacy__"):
+                return rng.choice(np.array(["CSH", "CRD", "NOC", "DIS"], dtype=object), n, p=[0.6, 0.38, 0.01, 0.01])
+            return rng.choice([1, 2, 3, 4], n, p=[0.7, 0.27, 0.02, 0.01])
+        if key == "trip_type":
+            return rng.choice([1, 2], n, p=[0.97, 0.03])
+        if key == "sr_flag":
+            return np.ones(n, dtype=np.int64)
+        if key == "store_and_fwd_flag":
+            return rng.choice(np.array(["N", "Y"], dtype=object), n, p=[0.995, 0.005])
+        if key in ("dispatching_base_num", "affiliated_base_number"):
+            return np.char.add("B0", rng.integers(1000, 4000, n).astype(str)).astype(object)
+        if key == "trip_distance":
+            return np.round(rng.exponential(3.0, n), 2)
+        if key.endswith("longitude"):
+            return np.round(rng.normal(-73.97, 0.05, n), 6)
+        if key.endswith("latitude"):
+            return np.round(rng.normal(40.75, 0.04, n), 6)
+        if key == "fare_amount":
+            return np.round(2.5 + rng.exponential(12.0, n), 2)
+        if key == "tip_amount":
+            return np.round(rng.exponential(2.5, n), 2)
+        if key == "total_amount":
+            return np.round(5 + rng.exponential(18.0, n), 2)
+        if key in ("mta_tax", "improvement_surcharge", "extra", "surcharge"):
+            return rng.choice([0.0, 0.5, 1.0], n)
+        if key in ("congestion_surcharge", "airport_fee", "cbd_congestion_fee", "ehail_fee"):
+            return rng.choice([0.0, 0.75, 1.25, 2.5], n, p=[0.6, 0.1, 0.1, 0.2])
+        if key == "tolls_amount":
+            return np.where(rng.random(n) < 0.05, 6.55, 0.0)
+        return np.round(rng.exponential(1.0, n), 2)
+
+    def array(self, name, arrow_type, n, context):
+        """Arrow-Array der Spalte im Zieltyp, mit fehlenden Werten (NULL bzw. leere Strings)."""
+        if arrow_type == "null":
+            return pa.nulls(n)
+        values = self.values(name, n, context)
+        context[name] = values
+        missing = self.rng.random(n) < self.null_rate
+
+        if arrow_type in ("string", "large_string"):
+            if values.dtype.kind == "M":
+                # Yellow 2010: Zeitstempel als String
+                values = np.datetime_as_string(values.astype("datetime64[s]"), unit="s")
+                values = np.char.replace(values, "T", " ").astype(object)
+            elif values.dtype.kind != "O":
+                values = values.astype(str).astype(object)
+            values = values.copy()
+            values[self.rng.random(n) < self.empty_rate] = ""
+            return pa.array(values, type=pa.type_for_alias(arrow_type), mask=missing)
+        if arrow_type.startswith("timestamp"):
+            return pa.array(values, type=pa.timestamp("us"), mask=missing)
+        if arrow_type in ("double", "float"):
+            return pa.array(values.astype(np.float64), type=pa.type_for_alias(arrow_type), mask=missing)
+        if values.dtype.kind not in "iu":
+            values = np.zeros(n, dtype=np.int64)
+        return pa.array(values, type=pa.type_for_alias(arrow_type), mask=missing)
+
+
+def generate_batch(column_types, n, generator, duplicate_ratio, legacy=False):
+    """Erzeugt einen Batch mit n Zeilen; ein Anteil duplicate_ratio wiederholt exakt frühere Zeilen des Batches."""
+    context = {"__legacy__": legacy}
+    arrays = [generator.array(name, arrow_type, n, context) for name, arrow_type in column_types.items()]
+    table = pa.Table.from_arrays(arrays, names=list(column_types))
+    num_duplicates = int(n * duplicate_ratio)
+    if num_duplicates and n > num_duplicates:
+        originals = generator.rng.integers(0, n - num_duplicates, num_duplicates)
+        indices = np.concatenate([np.arange(n - num_duplicates), originals])
+        generator.rng.shuffle(indices)
+        table = table.take(pa.array(indices))
+    return table
+
+
+def write_synthetic_file(path, column_types, rows, month, seed=0, null_rate=DEFAULT_NULL_RATE,
+                         empty_rate=DEFAULT_EMPTY_RATE, duplicate_ratio=DEFAULT_DUPLICATE_RATIO,
+                         row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+    """Schreibt eine synthetische TLC-Datei Row-Group-weise (konstanter Speicherbedarf auch bei 100 Mio. Zeilen)."""
+    rng = np.random.default_rng(seed)
+    generator = ColumnGenerator(rng, month, null_rate, empty_rate)
+    legacy = "vendor_id" in column_types
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    writer = None
+    written = 0
+    try:
+        while written < rows:
+            n = min(row_group_rows, rows - written)
+            batch = generate_batch(column_types, n, generator, duplicate_ratio, legacy)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema)
+            writer.write_table(batch, row_group_size=n)
+            written += n
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def generate_dataset(root, rows, sources=None, schema_keys=None, seed=0, schema_dir=REPO_SCHEMA_DIR,
+                     force=False, **rates):
+    """Erzeugt pro Schema-Version eine synthetische Datei im Layout des lokalen Backends unter root.
+
+    Schreibt zusätzlich die Schema-JSON-Dateien nach <root>/schemes/. Vorhandene Dateien mit
+    gleicher Zeilenzahl werden wiederverwendet (force=True erzeugt sie neu).
+    Liefert eine Liste von Dicts mit source, schema, file_name, gcs_path und rows.
+    """
+    schemas_by_source = load_repo_schemas(schema_dir)
+    for source, filename in SCHEMA_FILES.items():
+        path = os.path.join(root, BUCKET_SCHEMA_DIR, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(schemas_by_source[source], f, indent=4)
+
+    generated = []
+    for source, key, column_types, filename in schema_versions(schemas_by_source):
+        if sources and source not in sources:
+            continue
+        if schema_keys and key.lower() not in {k.lower() for k in schema_keys}:
+            continue
+        gcs_path = RAW_PREFIX_BY_SOURCE[source] + filename
+        path = os.path.join(root, *gcs_path.split("/"))
+        if force or not os.path.exists(path) or pq.ParquetFile(path).metadata.num_rows != rows:
+            print(f"INFO: Erzeuge {gcs_path} ({source}/{key}, {rows:,} Zeilen)...")
+            write_synthetic_file(path, column_types, rows, file_month(filename), seed=seed, **rates)
+        generated.append({"source": source, "schema": key, "file_name": filename, "gcs_path": gcs_path, "rows": rows})
+    return generated
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Erzeugt synthetische TLC-Parquet-Dateien für jede Schema-Version in schema/*.json.")
+    parser.add_argument("--root", default=".staging_local", help="Wurzelverzeichnis des lokalen Backends (Standard: .staging_local).")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Zeilen pro Datei (Standard: 1.000.000).")
+    parser.add_argument("--sources", nargs="*", choices=list(SCHEMA_FILES), help="Nur diese Quellen erzeugen.")
+    parser.add_argument("--schemas", nargs="*", help="Nur diese Schema-Versionen erzeugen (z.B. Schema-1).")
+    parser.add_argument("--null-rate", type=float, default=DEFAULT_NULL_RATE, help=f"Anteil NULL/NaN je Spalte (Standard: {DEFAULT_NULL_RATE}).")
+    parser.add_argument("--empty-rate", type=float, default=DEFAULT_EMPTY_RATE, help=f"Anteil leerer Strings je String-Spalte (Standard: {DEFAULT_EMPTY_RATE}).")
+    parser.add_argument("--duplicate-ratio", type=float, default=DEFAULT_DUPLICATE_RATIO, help=f"Anteil exakter Zeilenduplikate (Standard: {DEFAULT_DUPLICATE_RATIO}).")
+    parser.add_argument("--row-group-rows", type=int, default=DEFAULT_ROW_GROUP_ROWS, help=f"Zeilen pro Row Group (Standard: {DEFAULT_ROW_GROUP_ROWS}).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed des Zufallsgenerators.")
+    parser.add_argument("--force", action="store_true", help="Vorhandene Dateien neu erzeugen.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generated = generate_dataset(
+        args.root, args.rows, sources=args.sources, schema_keys=args.schemas, seed=args.seed, force=args.force,
+        null_rate=args.null_rate, empty_rate=args.empty_rate, duplicate_ratio=args.duplicate_ratio,
+        row_group_rows=args.row_group_rows,
+    )
+    print(f"INFO: {len(generated)} synthetische Dateien unter {args.root} bereit.")
+
+
+if __name__ == "__main__":
+    main()
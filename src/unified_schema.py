@@ -0,0 +1,215 @@
+import re
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Zusätzliche Spalten der vereinheitlichten Staging-Tabellen
+PARTITION_COLUMN = "pickup_month"
+LINEAGE_COLUMNS = ["schema_version", "source_file"]
+FLAG_COLUMNS = ["duplicate_flag", "missing_flag"]
+
+# Pickup-Spalten je Quelle in Prioritätsreihenfolge (Yellow 2010: 'pickup_datetime' als String)
+UNIFIED_PICKUP_COLUMNS = {
+    "fhv": ["pickup_datetime"],
+    "green": ["lpep_pickup_datetime"],
+    "yellow": ["tpep_pickup_datetime", "pickup_datetime"],
+}
+
+# Clustering nach Pickup-/Dropoff-Zone
+CLUSTER_COLUMNS = {
+    "fhv": ["PUlocationID", "DOlocationID"],
+    "green": ["PULocationID", "DOLocationID"],
+    "yellow": ["PULocationID", "DOLocationID"],
+}
+
+# Pickup-Monats-Routing: Buckets für Zeilen weit außerhalb des Dateimonats und ohne Pickup
+OUT_OF_RANGE_BUCKET = "out_of_range"
+UNKNOWN_BUCKET = "unknown"
+DEFAULT_MAX_MONTH_OFFSET = 1
+_FILE_MONTH_PATTERN = re.compile(r"_(\d{4})-(\d{2})\.parquet$")
+
+BQ_TO_ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INT64": pa.int64(),
+    "FLOAT64": pa.float64(),
+    "BOOL": pa.bool_(),
+    "DATETIME": pa.timestamp("us"),
+    "DATE": pa.date32(),
+}
+
+_INT_TYPES = {"int8", "int16", "int32", "int64", "uint8", "uint16", "uint32", "uint64"}
+_FLOAT_TYPES = {"float", "double", "halffloat"}
+_STRING_TYPES = {"string", "large_string"}
+
+
+def unified_table_name(source_prefix):
+    """Name der vereinheitlichten Staging-Tabelle einer Quelle, z.B. 'fhv_staging'."""
+    return f"{source_prefix}_staging"
+
+
+def resolve_unified_type(arrow_types):
+    """Bestimmt den BigQuery-Zieltyp einer Spalte aus ihren Arrow-Typen über alle Schema-Versionen.
+
+    Gemischte int/double-Spalten (PUlocationID, passenger_count, RatecodeID, ...) sind NaN-fähig
+    gespeicherte Ganzzahlen und werden wie in staging-view.sql zu INT64. Enthält eine Datei doch
+    gebrochene Werte, bleibt die Spalte FLOAT64 (siehe _cast_column und widened_columns).
+    """
+    types = {t for t in arrow_types if t != "null"}
+    if not types:
+        return "STRING"
+    if types & _STRING_TYPES:
+        return "STRING"
+    if all(t.startswith("timestamp") for t in types):
+        return "DATETIME"
+    if types <= _INT_TYPES | _FLOAT_TYPES:
+        return "INT64" if types & _INT_TYPES else "FLOAT64"
+    if types == {"bool"}:
+        return "BOOL"
+    return "STRING"
+
+
+def build_unified_columns(schema_registry, source_prefix):
+    """Vereinigt alle Schema-Versionen einer Quelle zu {Spalte: BigQuery-Typ}.
+
+    BigQuery-Spaltennamen sind case-insensitiv, daher werden z.B. 'Airport_fee' und
+    'airport_fee' zusammengeführt (die zuerst gesehene Schreibweise gewinnt).
+    """
+    names = {}
+    arrow_types = {}
+    for tablename, column_types in schema_registry.items():
+        if not tablename.startswith(f"{source_prefix}_schema"):
+            continue
+        for col, arrow_type in column_types.items():
+            key = col.lower()
+            names.setdefault(key, col)
+            arrow_types.setdefault(key, set()).add(arrow_type)
+    return {names[key]: resolve_unified_type(arrow_types[key]) for key in names}
+
+
+def unified_bigquery_fields(unified_columns):
+    """Alle Spalten (Name, BigQuery-Typ) der vereinheitlichten Tabelle in Ladereihenfolge."""
+    fields = list(unified_columns.items())
+    fields.extend((col, "STRING") for col in FLAG_COLUMNS)
+    fields.append((PARTITION_COLUMN, "DATE"))
+    fields.extend((col, "STRING") for col in LINEAGE_COLUMNS)
+    return fields
+
+
+def _cast_column(column, bq_type):
+    target = BQ_TO_ARROW_TYPES[bq_type]
+    if column.type == target:
+        return column
+    if pa.types.is_null(column.type):
+        return pa.nulls(len(column), target)
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if pa.types.is_floating(column.type) and pa.types.is_integer(target):
+        # NaN -> NULL, danach nur verlustfrei nach int64; gebrochene Werte behalten FLOAT64 statt abgeschnitten zu werden
+        column = pc.if_else(pc.is_nan(column), pa.scalar(None, column.type), column)
+        try:
+            return pc.cast(column, target)
+        except pa.ArrowInvalid:
+            return pc.cast(column, pa.float64())
+    if (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)) and pa.types.is_timestamp(target):
+        return pc.strptime(column, format="%Y-%m-%d %H:%M:%S", unit="us", error_is_null=True)
+    return pc.cast(column, target)
+
+
+def widened_columns(table, unified_columns):
+    """INT64-Spalten des vereinheitlichten Spaltensatzes, die in der gecasteten Tabelle FLOAT64 geblieben sind."""
+    return [col for col, bq_type in unified_columns.items()
+            if bq_type == "INT64" and pa.types.is_floating(table.schema.field(col).type)]
+
+
+def pickup_month_column(table, source_prefix):
+    """Berechnet den ersten Tag des Pickup-Monats (DATE) aus der ersten vorhandenen Pickup-Spalte."""
+    lower_names = {name.lower(): name for name in table.column_names}
+    result = pa.nulls(table.num_rows, pa.timestamp("us"))
+    for candidate in reversed(UNIFIED_PICKUP_COLUMNS.get(source_prefix, [])):
+        name = lower_names.get(candidate.lower())
+        if name is None:
+            continue
+        pickup = _cast_column(table[name].combine_chunks(), "DATETIME")
+        result = pc.coalesce(pickup, result)
+    return pc.cast(pc.floor_temporal(result, unit="month"), pa.date32())
+
+
+def file_month_index(source_file):
+    """Monat der Datei laut Dateiname (z.B. yellow_tripdata_2023-06.parquet) als Jahr * 12 + Monat - 1, sonst None."""
+    match = _FILE_MONTH_PATTERN.search(source_file)
+    if match is None:
+        return None
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+
+def route_pickup_months(months, file_month, max_month_offset):
+    """Teilt Pickup-Monate (DATE) in einem vektorisierten Durchlauf in Buckets auf.
+
+    Monate, die mehr als max_month_offset Monate vom Dateimonat (file_month_index) abweichen,
+    werden auf NULL gesetzt und landen damit in der NULL-Partition statt in einer fremden
+    Monatspartition. Liefert (geroutete Monate, {'YYYY-MM' | OUT_OF_RANGE_BUCKET | UNKNOWN_BUCKET: Zeilen}).
+    """
+    counts = {}
+    routed = months
+    if file_month is not None:
+        month_index = pc.add(pc.multiply(pc.year(months), 12), pc.subtract(pc.month(months), 1))
+        out_of_range = pc.greater(pc.abs(pc.subtract(month_index, file_month)), max_month_offset)
+        routed = pc.if_else(out_of_range, pa.scalar(None, pa.date32()), months)
+        counts[OUT_OF_RANGE_BUCKET] = pc.sum(out_of_range).as_py() or 0
+    for entry in pc.value_counts(routed.drop_null()).to_pylist():
+        counts[entry["values"].strftime("%Y-%m")] = entry["counts"]
+    counts[UNKNOWN_BUCKET] = months.null_count
+    return routed, {bucket: rows for bucket, rows in counts.items() if rows}
+
+
+def unify_arrow_table(table, unified_columns, source_prefix, schema_version, source_file):
+    """Castet eine geflaggte Datei auf den vereinheitlichten Spaltensatz ihrer Quelle.
+
+    Fehlende Spalten werden mit NULL aufgefüllt; Partitions- und Lineage-Spalten werden ergänzt.
+    Eine bereits vorhandene Partitionsspalte (PickupMonthRoutingSink) wird übernommen. Spalten der
+    Datei, die im vereinheitlichten Schema fehlen, führen zu einem ValueError. INT64-Spalten mit
+    gebrochenen Werten bleiben FLOAT64 (widened_columns).
+    """
+    lower_names = {name.lower(): name for name in table.column_names}
+    unknown = (set(lower_names) - {col.lower() for col in unified_columns} - {col.lower() for col in FLAG_COLUMNS}
+               - {PARTITION_COLUMN})
+    if unknown:
+        raise ValueError(f"Spalten {sorted(unknown)} fehlen im vereinheitlichten Schema von {source_prefix}")
+
+    arrays = []
+    names = []
+    for col, bq_type in unified_columns.items():
+        name = lower_names.get(col.lower())
+        if name is None:
+            arrays.append(pa.nulls(table.num_rows, BQ_TO_ARROW_TYPES[bq_type]))
+        else:
+            arrays.append(_cast_column(table[name].combine_chunks(), bq_type))
+        names.append(col)
+
+    for col in FLAG_COLUMNS:
+        arrays.append(_cast_column(table[col].combine_chunks(), "STRING") if col in table.column_names
+                      else pa.nulls(table.num_rows, pa.string()))
+        names.append(col)
+
+    if PARTITION_COLUMN in table.column_names:
+        arrays.append(table[PARTITION_COLUMN].combine_chunks())
+    else:
+        arrays.append(pickup_month_column(table, source_prefix))
+    names.append(PARTITION_COLUMN)
+    arrays.append(pa.array(np.full(table.num_rows, schema_version, dtype=object), pa.string()))
+    names.append("schema_version")
+    arrays.append(pa.array(np.full(table.num_rows, source_file, dtype=object), pa.string()))
+    names.append("source_file")
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def create_table_sql(fulltable, unified_columns, source_prefix):
+    """Erzeugt das DDL der partitionierten und geclusterten Staging-Tabelle (Referenz für sql/)."""
+    columns = ",\n".join(f"    `{col}` {bq_type}" for col, bq_type in unified_bigquery_fields(unified_columns))
+    cluster = ", ".join(CLUSTER_COLUMNS[source_prefix])
+    return (
+        f"CREATE TABLE IF NOT EXISTS `{fulltable}` (\n{columns}\n)\n"
+        f"PARTITION BY DATE_TRUNC({PARTITION_COLUMN}, MONTH)\n"
+        f"CLUSTER BY {cluster};\n"
+    )
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+from backends import GCP_BACKEND, LOCAL_BACKEND, GenerationMismatch
+
+# Lease-Objekte liegen im gemeinsamen Objektspeicher unter <präfix><gcs_path>.lease
+LEASE_PREFIX = "leases/"
+LEASE_SUFFIX = ".lease"
+DEFAULT_LEASE_TTL_SECONDS = 300
+# Erneuerung (Heartbeat) dreimal pro TTL, damit ein verspäteter Heartbeat den Lease nicht kostet
+HEARTBEAT_FRACTION = 3
+# Erledigt-Markierungen verhindern, dass ein später startender Host eine gerade geladene Datei erneut lädt;
+# danach entscheiden wieder Manifest und Audit-Log
+DEFAULT_DONE_RETENTION_SECONDS = 12 * 3600
+
+# Zustände eines Lease-Objekts
+HELD = "held"
+DONE = "done"
+
+# Ergebnisse, nach denen eine Datei als erledigt markiert wird ('fail' gibt den Lease frei, ein anderer Host darf es erneut versuchen)
+DONE_STATUSES = {"success", "quarantine"}
+
+
+def lease_owner(processor_name, run_id):
+    """Kennung eines Staging-Prozesses, z.B. 'ed033@host-1:4711/20260101T000000-ab12'."""
+    return f"{processor_name}@{socket.gethostname()}:{os.getpid()}/{run_id}"
+
+
+class WorkLeases:
+    """Verteilte Arbeitsverteilung über Leases im Objektspeicher (GCS bzw. lokales Verzeichnis).
+
+    Jeder Staging-Prozess geht dieselbe Dateiliste durch und verarbeitet eine Datei nur, wenn er
+    ihren Lease bekommt: Anlegen bzw. Übernehmen eines abgelaufenen Leases sind bedingte
+    Schreibvorgänge auf die gelesene Generation, sodass von konkurrierenden Hosts genau einer
+    gewinnt. Ein Heartbeat-Thread verlängert alle gehaltenen Leases; stirbt ein Host, laufen seine
+    Leases nach ttl_seconds ab und werden von den anderen übernommen (sweep). Nach dem Ergebnis
+    wird der Lease als erledigt markiert (success/quarantine) oder freigegeben (fail).
+
+    Die Ablaufzeit stammt aus der Uhr des schreibenden Hosts; die TTL muss daher deutlich größer
+    sein als der Uhrenversatz zwischen den Hosts.
+    """
+
+    def __init__(self, store, owner, ttl_seconds=DEFAULT_LEASE_TTL_SECONDS, generations=None,
+                 on_done_elsewhere=None, done_retention_seconds=DEFAULT_DONE_RETENTION_SECONDS):
+        self.store = store
+        self.owner = owner
+        self.ttl_seconds = ttl_seconds
+        self.done_retention_seconds = done_retention_seconds
+        # gcs_path -> Generation der Quelldatei (eine Erledigt-Markierung gilt nur für dieselbe Generation)
+        self.generations = generations or {}
+        # on_done_elsewhere(gcs_path, status, table_name): von einem anderen Prozess erledigte Datei (z.B. fürs Manifest)
+        self.on_done_elsewhere = on_done_elsewhere
+        self.stats = {"claimed": 0, "reclaimed": 0, "elsewhere": 0, "waited": 0, "renewed": 0, "lost": 0, "done": 0, "released": 0}
+        self.skipped = {}  # gcs_path -> filename (von anderen Hosts gehalten oder erledigt)
+        self._held = {}  # gcs_path -> Generation des eigenen Lease-Objekts
+        self._lost = set()
+        # Schützt die Buchführung und serialisiert Heartbeat und Abschluss desselben Leases
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def lease_name(self, gcs_path):
+        return f"{LEASE_PREFIX}{gcs_path}{LEASE_SUFFIX}"
+
+    def _document(self, gcs_path, state, status=None, table_name=None):
+        now = time.time()
+        return json.dumps({
+            "gcs_path": gcs_path,
+            "owner": self.owner,
+            "state": state,
+            "status": status,
+            "table_name": table_name,
+            "source_generation": self.generations.get(gcs_path),
+            "expires_at": now + (self.ttl_seconds if state == HELD else self.done_retention_seconds),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    def _read(self, gcs_path):
+        data, generation = self.store.read_versioned(self.lease_name(gcs_path))
+        return (json.loads(data) if data is not None else None), generation
+
+    def _claimable(self, gcs_path, lease):
+        """Frei ist eine Datei ohne Lease, mit abgelaufenem Lease oder mit Erledigt-Markierung einer anderen Generation."""
+        if lease is None or lease["expires_at"] <= time.time():
+            return True
+        return lease["state"] == DONE and lease["source_generation"] != self.generations.get(gcs_path)
+
+    def claim(self, filename, gcs_path):
+        """Versucht, den Lease einer Datei zu bekommen. False: ein anderer Host hält sie oder hat sie erledigt."""
+        lease, generation = self._read(gcs_path)
+        if lease is not None and not self._claimable(gcs_path, lease):
+            if lease["state"] == DONE:
+                self._done_elsewhere(gcs_path, lease)
+            else:
+                self._skip(filename, gcs_path, lease)
+            return False
+        try:
+            new_generation = self.store.write_if_generation(self.lease_name(gcs_path), self._document(gcs_path, HELD),
+                                                            generation, content_type="application/json")
+        except GenerationMismatch:
+            # Ein anderer Host war zwischen Lesen und Schreiben schneller
+            self._skip(filename, gcs_path, None)
+            return False
+        with self._lock:
+            self._held[gcs_path] = new_generation
+            self.skipped.pop(gcs_path, None)
+            if lease is not None and lease["state"] == HELD:
+                self.stats["reclaimed"] += 1
+                print(f"INFO: Abgelaufenen Lease von {lease['owner']} für {gcs_path} übernommen.")
+            else:
+                self.stats["claimed"] += 1
+        return True
+
+    def _done_elsewhere(self, gcs_path, lease):
+        with self._lock:
+            self.stats["elsewhere"] += 1
+            self.skipped.pop(gcs_path, None)
+        print(f"INFO: Überspringe {gcs_path}: bereits von {lease['owner']} verarbeitet ({lease['status']}).")
+        if self.on_done_elsewhere is not None:
+            self.on_done_elsewhere(gcs_path, lease["status"], lease.get("table_name"))
+
+    def _skip(self, filename, gcs_path, lease):
+        with self._lock:
+            if gcs_path not in self.skipped:
+                self.stats["waited"] += 1
+            self.skipped[gcs_path] = filename
+        holder = f" ({lease['owner']})" if lease is not None else ""
+        print(f"INFO: Überspringe {gcs_path} vorerst: Lease gehört einem anderen Prozess{holder}.")
+
+    def _write_held(self, gcs_path, document):
+        """Bedingter Schreibvorgang auf den eigenen Lease (Aufrufer hält self._lock)."""
+        generation = self._held[gcs_path]
+        self._held[gcs_path] = self.store.write_if_generation(self.lease_name(gcs_path), document, generation,
+                                                              content_type="application/json")
+
+    def renew(self):
+        """Verlängert alle gehaltenen Leases. Ein Lease, dessen Generation sich geändert hat, gilt als verloren."""
+        with self._lock:
+            for gcs_path in list(self._held):
+                try:
+                    self._write_held(gcs_path, self._document(gcs_path, HELD))
+                    self.stats["renewed"] += 1
+                except GenerationMismatch:
+                    del self._held[gcs_path]
+                    self._lost.add(gcs_path)
+                    self.stats["lost"] += 1
+                    print(f"WARNUNG: Lease für {gcs_path} verloren (abgelaufen und von einem anderen Prozess übernommen).")
+                except Exception as e:
+                    # Objektspeicher vorübergehend nicht erreichbar; der nächste Heartbeat versucht es erneut
+                    print(f"WARNUNG: Lease für {gcs_path} konnte nicht verlängert werden: {e}")
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl_seconds / HEARTBEAT_FRACTION):
+            self.renew()
+
+    def complete(self, gcs_path, status, table_name=None):
+        """Markiert die Datei nach ihrem Ergebnis als erledigt bzw. gibt den Lease frei (fail)."""
+        with self._lock:
+            if gcs_path in self._lost:
+                self._lost.discard(gcs_path)
+                print(f"WARNUNG: {gcs_path} wurde nach Verlust des Leases abgeschlossen ({status}); "
+                      f"ein anderer Prozess verarbeitet die Datei möglicherweise doppelt.")
+                return
+            if gcs_path not in self._held:
+                return
+            try:
+                if status in DONE_STATUSES:
+                    self._write_held(gcs_path, self._document(gcs_path, DONE, status, table_name))
+                    self.stats["done"] += 1
+                else:
+                    self.store.delete_if_generation(self.lease_name(gcs_path), self._held[gcs_path])
+                    self.stats["released"] += 1
+            except GenerationMismatch:
+                self.stats["lost"] += 1
+                print(f"WARNUNG: Lease für {gcs_path} wurde während der Verarbeitung übernommen; "
+                      f"die Datei wurde möglicherweise doppelt verarbeitet.")
+            finally:
+                del self._held[gcs_path]
+
+    def wrap_on_result(self, on_result):
+        """Ergebnis-Callback, der nach dem eigentlichen Callback (z.B. Manifest) den Lease abschließt."""
+        def record(result):
+            if on_result:
+                on_result(result)
+            self.complete(result["gcs_path"], result["status"], result["table_name"])
+        return record
+
+    def sweep(self, poll_seconds=None):
+        """Wartet auf die übersprungenen Dateien anderer Hosts und liefert die, die inzwischen frei sind.
+
+        Erledigte Dateien fallen heraus; von lebenden Hosts gehaltene werden erneut geprüft. Liefert
+        eine leere Liste, sobald keine übersprungene Datei mehr offen ist.
+        """
+        poll_seconds = poll_seconds or self.ttl_seconds / HEARTBEAT_FRACTION
+        while self.skipped:
+            claimable = []
+            for gcs_path, filename in list(self.skipped.items()):
+                lease, _ = self._read(gcs_path)
+                if self._claimable(gcs_path, lease):
+                    claimable.append((filename, gcs_path))
+                elif lease["state"] == DONE:
+                    self._done_elsewhere(gcs_path, lease)
+            if claimable:
+                return claimable
+            if self.skipped:
+                print(f"INFO: Warte auf {len(self.skipped)} Dateien anderer Prozesse (nächste Prüfung in {poll_seconds:.0f}s).")
+                time.sleep(poll_seconds)
+        return []
+
+    def summary(self):
+        s = self.stats
+        return (f"{s['claimed']} beansprucht, {s['reclaimed']} abgelaufen übernommen | {s['elsewhere']} von anderen "
+                f"Prozessen erledigt ({s['waited']} davon abgewartet) | {s['done']} erledigt, {s['released']} freigegeben, "
+                f"{s['lost']} verloren, {s['renewed']} Verlängerungen")
+
+    def close(self):
+        """Beendet den Heartbeat und gibt noch gehaltene Leases frei (z.B. nach einem Abbruch)."""
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            held = list(self._held)
+        for gcs_path in held:
+            self.complete(gcs_path, "fail")
+
+
+def list_leases(store, prefix=LEASE_PREFIX):
+    """Alle Lease-Objekte des Objektspeichers als (Objektname, Lease, Generation)."""
+    leases = []
+    for obj in store.list_objects(prefix, suffix=LEASE_SUFFIX):
+        data, generation = store.read_versioned(obj["name"])
+        if data is not None:
+            leases.append((obj["name"], json.loads(data), generation))
+    return leases
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Übersicht der Work-Leases verteilter Staging-Läufe (staging --claim-leases).")
+    parser.add_argument("--backend", choices=[GCP_BACKEND, LOCAL_BACKEND], default=GCP_BACKEND, help="Objektspeicher wie bei staging.")
+    parser.add_argument("--local-root", default=None, help="Wurzel des lokalen Backends (Standard wie bei staging).")
+    parser.add_argument("--clear", action="store_true",
+                        help="Erledigt-Markierungen und abgelaufene Leases löschen (gehaltene bleiben bestehen).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import staging
+    args = parse_args(argv)
+    options = staging.StagingOptions(backend=args.backend, local_root=args.local_root or staging.DEFAULT_LOCAL_ROOT)
+    store = staging.configure_backends(options)[0]
+    now = time.time()
+    counts = {}
+    for name, lease, generation in list_leases(store):
+        active = lease["state"] == HELD and lease["expires_at"] > now
+        state = lease["state"] if lease["expires_at"] > now else "expired"
+        counts[state] = counts.get(state, 0) + 1
+        if active:
+            print(f"  {lease['gcs_path']}: {lease['owner']} (noch {lease['expires_at'] - now:.0f}s)")
+        elif args.clear:
+            try:
+                store.delete_if_generation(name, generation)
+            except GenerationMismatch:
+                pass  # inzwischen von einem Prozess beansprucht
+    print("LEASES: " + (", ".join(f"{state}={n}" for state, n in sorted(counts.items())) or "keine"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+
+# Aktionen einer Datei im Arbeitsplan
+PROCESS = "process"
+SKIP = "skip"
+QUARANTINE = "quarantine"
+
+
+@dataclass
+class PlanEntry:
+    """Geplante Verarbeitung einer Quelldatei (aus Listing, Manifest/Audit-Log und Parquet-Footer)."""
+    gcs_path: str
+    file_name: str
+    action: str
+    reason: str = ""
+    size: int = 0
+    schema: str = None
+    table_name: str = None
+    mode: str = None
+    rows: int = None
+    columns: int = None
+    # Geschätzter Spitzen-RSS und vom Client ins Warehouse hochgeladene Bytes (0 bei Pushdown)
+    estimated_memory_bytes: int = 0
+    estimated_load_bytes: int = 0
+    error: str = None
+    # Lokaler Pfad im Raw-File-Cache (None = nicht gecacht, Download nötig)
+    cached_path: str = None
+
+
+class WorkPlan:
+    """Arbeitsplan eines Laufs: Ausgabe für --plan und Reihenfolge bzw. Speicherschätzungen für den echten Lauf."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def pending(self):
+        """Zu verarbeitende Dateien, größte zuerst (Zeilen, dann Dateigröße); Dateien ohne Mapping zuletzt."""
+        pending = [entry for entry in self.entries if entry.action != SKIP]
+        return sorted(pending, key=lambda entry: (entry.action == PROCESS, entry.rows or 0, entry.size), reverse=True)
+
+    def work_items(self):
+        return [(entry.file_name, entry.gcs_path) for entry in self.pending()]
+
+    def estimates(self):
+        """gcs_path -> geschätzter Spitzen-RSS in Bytes (für die AdmissionController)."""
+        return {entry.gcs_path: entry.estimated_memory_bytes for entry in self.pending()}
+
+    def totals(self):
+        pending = [entry for entry in self.entries if entry.action == PROCESS]
+        return {
+            "files": len(self.entries),
+            "process": len(pending),
+            "skip": sum(entry.action == SKIP for entry in self.entries),
+            "quarantine": sum(entry.action == QUARANTINE for entry in self.entries),
+            "rows": sum(entry.rows or 0 for entry in pending),
+            "bytes": sum(entry.size for entry in pending),
+            "load_bytes": sum(entry.estimated_load_bytes for entry in pending),
+            "max_memory_bytes": max((entry.estimated_memory_bytes for entry in pending), default=0),
+            "cached": sum(entry.cached_path is not None for entry in pending),
+            "download_bytes": sum(entry.size for entry in pending if entry.cached_path is None and entry.mode != "pushdown"),
+        }
+
+    def print_report(self):
+        """Tabelle je Datei in Ausführungsreihenfolge (übersprungene Dateien am Ende) und Summenzeile."""
+        print(f"\n{'Datei':<48} {'Schema':<12} {'Zeilen':>12} {'RSS MiB':>9} {'Load MiB':>9} {'Modus':<8} {'Aktion':<10} Grund")
+        skipped = [entry for entry in self.entries if entry.action == SKIP]
+        for entry in self.pending() + skipped:
+            rows = f"{entry.rows:,}" if entry.rows is not None else "-"
+            reason = f"{entry.reason} (Footer: {entry.error})" if entry.error else entry.reason
+            print(f"{entry.file_name:<48} {entry.schema or '-':<12} {rows:>12} "
+                  f"{entry.estimated_memory_bytes / 2**20:>9,.0f} {entry.estimated_load_bytes / 2**20:>9,.0f} "
+                  f"{entry.mode or '-':<8} {entry.action:<10} {reason}")
+
+        totals = self.totals()
+        print(f"\nPLAN: {totals['files']} Dateien | {totals['process']} verarbeiten, {totals['skip']} überspringen, "
+              f"{totals['quarantine']} Quarantäne | {totals['rows']:,} Zeilen, {totals['bytes'] / 2**20:,.0f} MiB Quelldaten, "
+              f"~{totals['load_bytes'] / 2**20:,.0f} MiB Upload | max. RSS pro Datei ~{totals['max_memory_bytes'] / 2**20:,.0f} MiB")
+        if totals["cached"]:
+            print(f"RAW-CACHE: {totals['cached']} von {totals['process']} Dateien gecacht, "
+                  f"~{totals['download_bytes'] / 2**20:,.0f} MiB verbleibender Download")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Die Module liegen flach unter src/ (wie beim Aufruf von staging.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
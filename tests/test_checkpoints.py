@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import staging
+from backends import LOCAL_BACKEND
+from manifest import IngestionManifest
+
+GCS_PATH = "raw/Yellow_Taxi_Trip_Data_2023/yellow_tripdata_2023-06.parquet"
+TABLE = "yellow_schema_1"
+ROWS = 30_000
+
+
+@pytest.fixture
+def local_backend(tmp_path):
+    path = tmp_path / GCS_PATH
+    path.parent.mkdir(parents=True)
+    df = pd.DataFrame({"VendorID": np.arange(ROWS) % 3, "trip_distance": np.arange(ROWS) * 0.1})
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=10_000)
+    staging.configure_backends(staging.StagingOptions(backend=LOCAL_BACKEND, local_root=str(tmp_path)))
+    manifest = IngestionManifest(str(tmp_path / "manifest.sqlite"))
+    yield staging.get_warehouse(), manifest
+    manifest.close()
+
+
+def stage(warehouse, manifest):
+    stats = staging.new_stats()
+    sink = warehouse.staging_sink(TABLE)
+    uri = staging.get_object_store().uri(GCS_PATH)
+    # Kleines Budget -> ein Bereich je Row Group
+    staging.stage_checkpointed(uri, GCS_PATH, TABLE, sink, [], stats, 1, manifest)
+    sink.close()
+    return stats
+
+
+def test_restage_after_cleared_checkpoints_appends_again(local_backend):
+    warehouse, manifest = local_backend
+    stage(warehouse, manifest)
+    first_parts = set(warehouse.table_parts(TABLE))
+    manifest.clear_checkpoints(GCS_PATH)
+
+    stats = stage(warehouse, manifest)
+
+    assert stats["row_count"] == ROWS
+    # Neue Dateien neben den alten statt Übernahme der früheren append_ids
+    assert len(set(warehouse.table_parts(TABLE)) - first_parts) == len(first_parts)
+    assert warehouse.read_table(TABLE).num_rows == 2 * ROWS
+
+
+def test_open_checkpoint_is_repeated_with_stored_append_id(local_backend):
+    warehouse, manifest = local_backend
+    generation = staging.get_object_store().stat(GCS_PATH)["generation"]
+    manifest.begin_row_groups(GCS_PATH, generation, 0, 0, "staging_interrupted_rg0-0")
+
+    stage(warehouse, manifest)
+
+    names = sorted(os.path.basename(part) for part in warehouse.table_parts(TABLE))
+    assert "staging_interrupted_rg0-0.parquet" in names
+    assert warehouse.read_table(TABLE).num_rows == ROWS
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import staging
+from fingerprint_index import FingerprintIndex
+
+FIRST = "yellow_tripdata_2023-06.parquet"
+SECOND = "yellow_tripdata_2023-07.parquet"
+
+
+def frame(start, rows):
+    return pd.DataFrame({
+        "VendorID": np.arange(start, start + rows) % 3,
+        "tpep_pickup_datetime": pd.date_range("2023-06-01", periods=start + rows, freq="min")[start:],
+    })
+
+
+def mark_seen(index, filename, df):
+    fingerprints = staging.FileFingerprints(index, "yellow", filename)
+    return fingerprints.mark_seen(df, staging.row_hashes(df))
+
+
+@pytest.fixture
+def index(tmp_path):
+    return FingerprintIndex(str(tmp_path / "fingerprints"))
+
+
+def test_overlapping_files_in_flight_see_each_other(index):
+    # Beide Dateien sind gleichzeitig in Bearbeitung, keine hat bisher committet
+    mark_seen(index, FIRST, frame(0, 100))
+    seen = mark_seen(index, SECOND, frame(50, 100))
+
+    assert seen.sum() == 50
+    assert seen[:50].all()
+
+
+def test_discarded_file_no_longer_counts(index):
+    mark_seen(index, FIRST, frame(0, 100))
+    index.discard(FIRST)
+
+    assert not mark_seen(index, SECOND, frame(50, 100)).any()
+
+
+def test_committed_file_is_seen_by_later_runs(index, tmp_path):
+    mark_seen(index, FIRST, frame(0, 100))
+    index.commit(FIRST)
+
+    seen = mark_seen(FingerprintIndex(str(tmp_path / "fingerprints")), SECOND, frame(50, 100))
+
+    assert seen.sum() == 50
+
+
+def test_fingerprint_index_rejects_multiple_workers():
+    with pytest.raises(SystemExit):
+        staging.parse_args(["--fingerprint-index", "fp", "--workers", "2"])
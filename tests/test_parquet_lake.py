@@ -0,0 +1,39 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from parquet_lake import LakeSink, compact_lake
+
+COLUMNS = {"tpep_pickup_datetime": "DATETIME", "trip_distance": "FLOAT64"}
+ROWS = 1_000
+
+
+def frame(month):
+    return pd.DataFrame({
+        "tpep_pickup_datetime": pd.date_range(f"2023-{month:02d}-01", periods=ROWS, freq="min"),
+        "trip_distance": [0.5] * ROWS,
+    })
+
+
+def write(root, source_file, months):
+    sink = LakeSink(str(root), "yellow", COLUMNS, "yellow_schema_1", source_file)
+    for month in months:
+        sink.write_dataframe(frame(month))
+    sink.close()
+
+
+def rows_per_file(root):
+    table = ds.dataset(str(root), format="parquet", partitioning="hive").to_table(columns=["source_file"])
+    return table.group_by("source_file").aggregate([([], "count_all")]).to_pydict()
+
+
+def test_restage_after_compaction_replaces_rows(tmp_path):
+    write(tmp_path, "yellow_tripdata_2023-06.parquet", [6, 6, 7])
+    write(tmp_path, "yellow_tripdata_2023-07.parquet", [7, 7])
+    compact_lake(str(tmp_path), target_file_mb=64)
+
+    # Neue Generation mit anderen Partitionen
+    write(tmp_path, "yellow_tripdata_2023-06.parquet", [5])
+
+    counts = dict(zip(*rows_per_file(tmp_path).values()))
+    assert counts == {"yellow_tripdata_2023-06.parquet": ROWS, "yellow_tripdata_2023-07.parquet": 2 * ROWS}
+    assert not list(tmp_path.glob("source=yellow/year=2023/month=6/*"))
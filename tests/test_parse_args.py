@@ -0,0 +1,13 @@
+import pytest
+
+import staging
+
+
+@pytest.mark.parametrize("workers", ["0", "-2"])
+def test_workers_below_one_are_rejected(workers):
+    with pytest.raises(SystemExit):
+        staging.parse_args(["--workers", workers])
+
+
+def test_single_worker_is_accepted():
+    assert staging.parse_args(["--workers", "1"]).workers == 1
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import staging
+from backends import LOCAL_BACKEND
+
+FILENAME = "yellow_tripdata_2023-06.parquet"
+GCS_PATH = f"raw/Yellow_Taxi_Trip_Data_2023/{FILENAME}"
+MAPPING = {FILENAME: "Schema-1"}
+TABLE = "yellow_schema_1"
+QUARANTINE_TABLE = TABLE + staging.QUARANTINE_TABLE_SUFFIX
+ROWS = 1_000
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    path = tmp_path / GCS_PATH
+    path.parent.mkdir(parents=True)
+    df = pd.DataFrame({
+        "VendorID": np.arange(ROWS) % 3,
+        "tpep_pickup_datetime": pd.date_range("2023-06-01", periods=ROWS, freq="min"),
+        "tpep_dropoff_datetime": pd.date_range("2023-06-01 00:10", periods=ROWS, freq="min"),
+        "trip_distance": np.arange(ROWS) * 0.1,
+    })
+    df.loc[:9, "VendorID"] = None
+    df = pd.concat([df, df.iloc[100:110]], ignore_index=True)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    staging.configure_backends(staging.StagingOptions(backend=LOCAL_BACKEND, local_root=str(tmp_path)))
+    return staging.get_warehouse()
+
+
+def process(warehouse, **options):
+    return staging.processfile(warehouse, MAPPING, FILENAME, GCS_PATH, staging.StagingOptions(
+        backend=LOCAL_BACKEND, split_quarantine=True, **options))
+
+
+def fail_writes_to(warehouse, monkeypatch, table):
+    write_part = warehouse.write_part
+
+    def failing(target, arrow_table, name=None):
+        if target == table:
+            raise RuntimeError(f"Load nach {target} fehlgeschlagen")
+        return write_part(target, arrow_table, name)
+
+    monkeypatch.setattr(warehouse, "write_part", failing)
+
+
+def test_quarantine_rows_follow_main_rows(warehouse):
+    process(warehouse)
+
+    assert warehouse.read_table(TABLE).num_rows == ROWS - 10
+    assert warehouse.read_table(QUARANTINE_TABLE).num_rows == 20
+    assert not staging.get_object_store().list_objects(staging.STAGED_PREFIX)
+
+
+def test_failed_main_load_leaves_quarantine_unchanged(warehouse, monkeypatch):
+    fail_writes_to(warehouse, monkeypatch, TABLE)
+
+    with pytest.raises(RuntimeError):
+        process(warehouse)
+
+    assert not warehouse.table_parts(QUARANTINE_TABLE)
+    assert not staging.get_object_store().list_objects(staging.STAGED_PREFIX)
+
+
+def test_failed_quarantine_write_leaves_main_table_unchanged(warehouse, monkeypatch, tmp_path):
+    quarantine_dir = tmp_path / "quarantine"
+    quarantine_dir.mkdir()
+    monkeypatch.setattr(staging.QuarantineParquetSink, "write_arrow", lambda self, table: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        process(warehouse, quarantine_dir=str(quarantine_dir))
+
+    assert not warehouse.table_parts(TABLE)
+    assert not list(quarantine_dir.rglob("*.parquet"))
+
+
+def test_quarantine_dir_files_appear_after_success(warehouse, tmp_path):
+    process(warehouse, quarantine_dir=str(tmp_path / "quarantine"))
+
+    parts = list((tmp_path / "quarantine" / TABLE).iterdir())
+    assert [p.name for p in parts] == ["yellow_tripdata_2023-06-00000.parquet"]
+    assert pq.read_table(parts[0]).num_rows == 20
+
+
+@pytest.mark.parametrize("mode", ["--batch-load", "--write-stream"])
+def test_split_quarantine_rejects_deferred_load_modes(mode):
+    with pytest.raises(SystemExit):
+        staging.parse_args(["--split-quarantine", mode])
@@ -0,0 +1,72 @@
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import staging
+from backends import LOCAL_BACKEND
+
+JSONFILE = staging.SCHEMA_JSON_BY_SOURCE["yellow"]
+KNOWN = {"Schema-1": {"VendorID": "int64"}, "files": ["yellow_tripdata_2020-01.parquet"]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    staging.configure_backends(staging.StagingOptions(backend=LOCAL_BACKEND, local_root=str(tmp_path)))
+    store = staging.get_object_store()
+    store.write_bytes(JSONFILE, json.dumps([KNOWN]), content_type="application/json")
+    return store
+
+
+def write_raw(tmp_path, filename, table):
+    path = tmp_path / "raw" / filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, path)
+    return filename, f"raw/{filename}"
+
+
+def registered(store):
+    schemas = json.loads(store.read_bytes(JSONFILE))
+    return {key: entry["files"] for entry in schemas for key in entry if key.startswith("Schema")}
+
+
+def test_concurrent_registration_keeps_both_schemas(store, tmp_path, monkeypatch):
+    ours = write_raw(tmp_path, "yellow_tripdata_2024-01.parquet", pa.table({"VendorID": [1], "fare": [1.5]}))
+    other_file = "yellow_tripdata_2024-02.parquet"
+    write_if_generation = store.write_if_generation
+    raced = []
+
+    def racing_write(name, data, generation, content_type=None):
+        if not raced:
+            # Ein anderer Host registriert zwischen unserem Lesen und Schreiben eine eigene neue Version
+            raced.append(True)
+            staging.upload_schema_json(JSONFILE, "yellow", [(other_file, {"VendorID": "int64", "tip": "double"})])
+        return write_if_generation(name, data, generation, content_type)
+
+    monkeypatch.setattr(store, "write_if_generation", racing_write)
+    mastermapping = {"yellow_tripdata_2020-01.parquet": "Schema-1"}
+    options = staging.StagingOptions(backend=LOCAL_BACKEND)
+    schemas_by_source = {"yellow": [dict(KNOWN, files=list(KNOWN["files"]))]}
+
+    staging.classify_unmapped_files([ours], mastermapping, schemas_by_source, options, workers=1)
+
+    assert registered(store) == {
+        "Schema-1": ["yellow_tripdata_2020-01.parquet"],
+        "Schema-2": [other_file],
+        "Schema-3": ["yellow_tripdata_2024-01.parquet"],
+    }
+    assert mastermapping["yellow_tripdata_2024-01.parquet"] == "Schema-3"
+    assert options.schema_registry["yellow_schema_3"] == {"VendorID": "int64", "fare": "double"}
+
+
+def test_files_registered_elsewhere_are_not_written_again(store, tmp_path):
+    ours = write_raw(tmp_path, "yellow_tripdata_2024-01.parquet", pa.table({"VendorID": [1]}))
+    staging.upload_schema_json(JSONFILE, "yellow", [("yellow_tripdata_2024-01.parquet", {"VendorID": "int64"})])
+    _, generation = store.read_versioned(JSONFILE)
+
+    staging.classify_unmapped_files([ours], {}, {"yellow": [dict(KNOWN, files=list(KNOWN["files"]))]},
+                                    staging.StagingOptions(backend=LOCAL_BACKEND), workers=1)
+
+    assert store.read_versioned(JSONFILE)[1] == generation
+    assert registered(store) == {"Schema-1": ["yellow_tripdata_2020-01.parquet", "yellow_tripdata_2024-01.parquet"]}
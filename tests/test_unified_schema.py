@@ -0,0 +1,28 @@
+import pyarrow as pa
+
+from unified_schema import unify_arrow_table, widened_columns
+
+COLUMNS = {"tpep_pickup_datetime": "DATETIME", "passenger_count": "INT64"}
+
+
+def unify(values):
+    table = pa.table({
+        "tpep_pickup_datetime": pa.array([None] * len(values), pa.timestamp("us")),
+        "passenger_count": pa.array(values, pa.float64()),
+    })
+    return unify_arrow_table(table, COLUMNS, "yellow", "yellow_schema_1", "yellow_tripdata_2023-06.parquet")
+
+
+def test_integral_floats_are_cast_to_int64():
+    table = unify([1.0, float("nan"), None])
+
+    assert table["passenger_count"].type == pa.int64()
+    assert table["passenger_count"].to_pylist() == [1, None, None]
+    assert widened_columns(table, COLUMNS) == []
+
+
+def test_fractional_floats_stay_float64():
+    table = unify([1.0, 2.5, float("nan")])
+
+    assert table["passenger_count"].to_pylist() == [1.0, 2.5, None]
+    assert widened_columns(table, COLUMNS) == ["passenger_count"]
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import staging
+from backends import LOCAL_BACKEND, LocalWriteStreamSink
+
+FILENAME = "yellow_tripdata_2023-06.parquet"
+GCS_PATH = f"raw/Yellow_Taxi_Trip_Data_2023/{FILENAME}"
+MAPPING = {FILENAME: "Schema-1"}
+TABLE = "yellow_schema_1"
+ROWS = 1_000
+
+
+class Crash(BaseException):
+    """Simulierter Prozessabbruch (wird von processfile nicht als Fehler behandelt)."""
+
+
+@pytest.fixture
+def options(tmp_path, monkeypatch):
+    path = tmp_path / GCS_PATH
+    path.parent.mkdir(parents=True)
+    df = pd.DataFrame({
+        "VendorID": np.arange(ROWS) % 3,
+        "tpep_pickup_datetime": pd.date_range("2023-06-01", periods=ROWS, freq="min"),
+        "tpep_dropoff_datetime": pd.date_range("2023-06-01 00:10", periods=ROWS, freq="min"),
+    })
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    options = staging.StagingOptions(backend=LOCAL_BACKEND, local_root=str(tmp_path), write_stream=True,
+                                     stream_journal_path=str(tmp_path / "stream_journal.sqlite"))
+    staging.configure_backends(options)
+    monkeypatch.setattr(staging, "_stream_journal", None)
+    staging.start_stream_journal(options)
+    yield options
+    staging._stream_journal.close()
+
+
+def process(options):
+    return staging.processfile(staging.get_warehouse(), MAPPING, FILENAME, GCS_PATH, options)
+
+
+def audit_rows(warehouse):
+    if not warehouse.table_parts(staging.LOGTABLE):
+        return []
+    return warehouse.read_table(staging.LOGTABLE, columns=["status", "additional_info"]).to_pylist()
+
+
+def open_streams(warehouse):
+    stream_root = os.path.join(warehouse.table_id(TABLE), ".streams")
+    return os.listdir(stream_root) if os.path.isdir(stream_root) else []
+
+
+def test_commit_makes_rows_visible_with_audit_row(options, monkeypatch):
+    warehouse = staging.get_warehouse()
+    commit = warehouse.commit_write_streams
+    seen_before_commit = []
+
+    def observed_commit(table, stream_names):
+        seen_before_commit.append((len(warehouse.table_parts(TABLE)), len(audit_rows(warehouse))))
+        return commit(table, stream_names)
+
+    monkeypatch.setattr(warehouse, "commit_write_streams", observed_commit)
+
+    process(options)
+
+    assert seen_before_commit == [(0, 0)]
+    assert warehouse.read_table(TABLE).num_rows == ROWS
+    assert [row["status"] for row in audit_rows(warehouse)] == ["success"]
+    assert staging._stream_journal.entries() == []
+
+
+def test_abort_leaves_nothing(options, monkeypatch):
+    warehouse = staging.get_warehouse()
+    monkeypatch.setattr(warehouse, "commit_write_streams", lambda table, stream_names: 1 / 0)
+
+    with pytest.raises(ZeroDivisionError):
+        process(options)
+
+    assert warehouse.table_parts(TABLE) == []
+    assert open_streams(warehouse) == []
+    assert [row["status"] for row in audit_rows(warehouse)] == ["fail"]
+
+
+def test_crash_between_commit_and_audit_row_is_recovered_once(options, monkeypatch):
+    warehouse = staging.get_warehouse()
+
+    def crash(client, row):
+        raise Crash()
+
+    with monkeypatch.context() as m:
+        m.setattr(staging, "insert_log_job", crash)
+        with pytest.raises(Crash):
+            process(options)
+    assert warehouse.read_table(TABLE).num_rows == ROWS
+    assert audit_rows(warehouse) == []
+
+    recovered = staging.recover_write_streams(warehouse, options.stream_journal_path)
+
+    assert [entry["gcs_path"] for entry in recovered] == [GCS_PATH]
+    assert warehouse.read_table(TABLE).num_rows == ROWS
+    rows = audit_rows(warehouse)
+    assert [row["status"] for row in rows] == ["success"]
+    assert "Recovered commit of write stream" in rows[0]["additional_info"]
+    assert staging.recover_write_streams(warehouse, options.stream_journal_path) == []
+
+
+def test_finalize_row_count_mismatch_raises(options):
+    warehouse = staging.get_warehouse()
+    sink = warehouse.write_stream_sink(TABLE, warehouse.staging_sink(TABLE))
+    sink.write_dataframe(pd.DataFrame({"VendorID": [1, 2]}))
+    sink.write_dataframe(pd.DataFrame({"VendorID": [3]}))
+    stream_dir = warehouse.stream_dir(TABLE, sink.stream_name)
+    os.remove(os.path.join(stream_dir, sorted(os.listdir(stream_dir))[0]))
+
+    with pytest.raises(RuntimeError, match="enthält 1 statt 3 Zeilen"):
+        sink.close()
+    assert not os.path.exists(os.path.join(stream_dir, LocalWriteStreamSink.FINALIZED_MARKER))